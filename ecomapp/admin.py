@@ -29,7 +29,14 @@ from ecomapp.models import (
     FoodProductImage,
     Testimonial,
     ProductSize,
+    RatingSummary,
+    TrendingScore,
+    VendorDailySales,
+    VendorDailyOrders,
+    IdempotencyKey,
+    OutgoingEmail,
 )
+from ecomapp.transitions import transition_order
 
 
 # class CategoryAdmin(admin.ModelAdmin):
@@ -93,6 +100,18 @@ from ecomapp.models import (
 #         "created_at",
 #         "updated_at",
 #     ]
+
+
+# edits of an existing order run the same transition handlers as the api
+class CartOrderAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        transition_order(
+            obj, **{field: getattr(obj, field) for field in form.changed_data}
+        )
+
+
 admin.site.register(FoodProduct)
 admin.site.register(VendorStrike)
 admin.site.register(ClientStrike)
@@ -104,7 +123,7 @@ admin.site.register(SubscriptionPayment)
 admin.site.register(SubscriptionFeature)
 admin.site.register(Category)
 admin.site.register(Product)
-admin.site.register(CartOrder)
+admin.site.register(CartOrder, CartOrderAdmin)
 admin.site.register(CartOrderItem)
 admin.site.register(Wishlist)
 admin.site.register(ProductReview)
@@ -122,3 +141,9 @@ admin.site.register(ProductImages)
 admin.site.register(FoodProductImage)
 admin.site.register(Testimonial)
 admin.site.register(ProductSize)
+admin.site.register(RatingSummary)
+admin.site.register(TrendingScore)
+admin.site.register(VendorDailySales)
+admin.site.register(VendorDailyOrders)
+admin.site.register(IdempotencyKey)
+admin.site.register(OutgoingEmail)
@@ -0,0 +1,111 @@
+from django.db import transaction
+from django.db.models import BooleanField, Case, F, FloatField, IntegerField
+from django.db.models import Value, When
+from django.db.models.functions import Cast, Round
+from django.dispatch import Signal
+from django.utils import timezone
+from rest_framework import serializers
+
+BULK_UPDATE_LIMIT = 5000
+BULK_UPDATE_BATCH_SIZE = 500
+BULK_UPDATE_FIELDS = ["price", "old_price", "quantity"]
+
+# sent once per bulk update with the model, vendor_id, the updated ids and the
+# changed fields, the per row post_save receivers never run for these updates
+catalog_items_updated = Signal()
+
+
+class ItemUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, required=False
+    )
+    old_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, required=False, allow_null=True
+    )
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if not any(field in attrs for field in BULK_UPDATE_FIELDS):
+            raise serializers.ValidationError(
+                f"at least one of {', '.join(BULK_UPDATE_FIELDS)} must be sent"
+            )
+        return attrs
+
+
+class BulkItemUpdateSerializer(serializers.Serializer):
+    items = ItemUpdateSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        if len(items) > BULK_UPDATE_LIMIT:
+            raise serializers.ValidationError(
+                f"at most {BULK_UPDATE_LIMIT} items can be updated at once"
+            )
+        ids = [item["id"] for item in items]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("every id must be sent only once")
+        return items
+
+
+def derived_values():
+    # same rules as the save() of the items, but computed by the database, the
+    # difference is cast to a float so sqlite does not truncate the division
+    discount = Cast(
+        Round(Cast(F("old_price") - F("price"), FloatField()) * 100 / F("old_price")),
+        IntegerField(),
+    )
+    return {
+        "discount_percentage": Case(
+            When(old_price__gt=F("price"), then=discount),
+            When(old_price__lt=F("price"), then=Value(0)),
+            default=F("discount_percentage"),
+            output_field=IntegerField(),
+        ),
+        "in_stock": Case(
+            When(quantity=0, then=Value(False)),
+            default=Value(True),
+            output_field=BooleanField(),
+        ),
+    }
+
+
+def update_batch(model, queryset, items):
+    changes = {}
+    for field in BULK_UPDATE_FIELDS:
+        changed = [item for item in items if field in item]
+        if changed:
+            changes[field] = Case(
+                *[When(pk=item["id"], then=Value(item[field])) for item in changed],
+                default=F(field),
+                output_field=model._meta.get_field(field),
+            )
+    ids = [item["id"] for item in items]
+    queryset.filter(pk__in=ids).update(updated_at=timezone.now(), **changes)
+    queryset.filter(pk__in=ids).update(**derived_values())
+
+
+# the vendor is part of every WHERE clause, ids of other vendors are reported
+# as not found and never touched
+def bulk_update_items(model, vendor, items, batch_size=BULK_UPDATE_BATCH_SIZE):
+    queryset = model.objects.filter(vendor=vendor)
+    owned = set(
+        queryset.filter(pk__in=[item["id"] for item in items]).values_list(
+            "pk", flat=True
+        )
+    )
+    missing = [item["id"] for item in items if item["id"] not in owned]
+    items = [item for item in items if item["id"] in owned]
+
+    with transaction.atomic():
+        for start in range(0, len(items), batch_size):
+            update_batch(model, queryset, items[start : start + batch_size])
+
+    ids = [item["id"] for item in items]
+    fields = sorted({field for item in items for field in item} - {"id"})
+    if ids:
+        transaction.on_commit(
+            lambda: catalog_items_updated.send(
+                sender=model, vendor_id=vendor.pk, ids=ids, fields=fields
+            )
+        )
+    return {"updated": len(ids), "not_found": missing}
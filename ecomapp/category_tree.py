@@ -0,0 +1,119 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Sector, Category, SubCategory, Product, FoodProduct
+
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+
+COUNTED_MODELS = {"products_count": Product, "food_products_count": FoodProduct}
+
+# (version, tree) of the last tree this process loaded
+local_tree = (None, None)
+
+
+def category_tree_version():
+    return cache.get_or_set("category_tree_version", time.time_ns, None)
+
+
+def invalidate_category_tree():
+    transaction.on_commit(
+        lambda: cache.set("category_tree_version", time.time_ns(), None)
+    )
+
+
+def active_items_count(model):
+    counts = (
+        model.objects.filter(sub_category=OuterRef("pk"), is_active=True)
+        .order_by()
+        .values("sub_category")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def tree_node(instance, children_key=None):
+    node = {
+        "id": instance.pk,
+        "title": instance.title,
+        "image": instance.image.url if instance.image else None,
+        **{key: 0 for key in COUNTED_MODELS},
+    }
+    if children_key:
+        node[children_key] = []
+    return node
+
+
+def add_counts(node, child):
+    for key in COUNTED_MODELS:
+        node[key] += child[key]
+
+
+def build_category_tree():
+    sub_categories = SubCategory.objects.annotate(
+        **{key: active_items_count(model) for key, model in COUNTED_MODELS.items()}
+    ).order_by("title")
+
+    sectors = {
+        sector.pk: tree_node(sector, "categories")
+        for sector in Sector.objects.order_by("title")
+    }
+    categories = {}
+    for category in Category.objects.order_by("title"):
+        node = tree_node(category, "sub_categories")
+        categories[category.pk] = node
+        if category.sector_id in sectors:
+            sectors[category.sector_id]["categories"].append(node)
+
+    for sub_category in sub_categories:
+        category = categories.get(sub_category.category_id)
+        if category is None:
+            continue
+        node = tree_node(sub_category)
+        for key in COUNTED_MODELS:
+            node[key] = getattr(sub_category, key)
+        category["sub_categories"].append(node)
+        add_counts(category, node)
+
+    for sector in sectors.values():
+        for category in sector["categories"]:
+            add_counts(sector, category)
+    return list(sectors.values())
+
+
+def with_image_urls(nodes, request):
+    return [
+        {
+            **{
+                key: (
+                    with_image_urls(value, request)
+                    if isinstance(value, list)
+                    else value
+                )
+                for key, value in node.items()
+                if key != "image"
+            },
+            "image_url": (
+                request.build_absolute_uri(node["image"]) if node["image"] else None
+            ),
+        }
+        for node in nodes
+    ]
+
+
+def get_category_tree():
+    global local_tree
+    version = category_tree_version()
+    local_version, tree = local_tree
+    if local_version == version:
+        return tree
+
+    key = f"category_tree:{version}"
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(key, tree, CATEGORY_TREE_TIMEOUT)
+    local_tree = (version, tree)
+    return tree
@@ -0,0 +1,85 @@
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import CartItem, CartOrder, CartOrderItem, GlobalOrder
+from .response_cache import invalidate_response_cache
+from .tasks import notify_new_orders
+
+DELIVERY_FEE = 20
+
+
+# the vendors come with the cart lines so grouping them never hits the database
+def load_cart_items(shopping_cart):
+    return list(
+        shopping_cart.cart_items.filter(is_ordered=False).select_related(
+            "product__vendor", "food_product__vendor"
+        )
+    )
+
+
+def group_by_vendor(client, cart_items):
+    vendors = {}
+    lines = defaultdict(list)
+    for cart_item in cart_items:
+        item = cart_item.product or cart_item.food_product
+        vendor = item.vendor if item else None
+        if not vendor or vendor.city != client.city:
+            raise ValidationError("Some cart items are not available in your city.")
+        if not cart_item.is_active:
+            raise ValidationError("Some cart items are out of stock.")
+        vendors[vendor.pk] = vendor
+        lines[vendor.pk].append(cart_item)
+    return [(vendors[vendor_id], lines[vendor_id]) for vendor_id in vendors]
+
+
+# one INSERT for the orders, one for their items and one UPDATE for the cart,
+# whatever the number of lines and vendors
+def place_orders(client, global_order, cart_items):
+    groups = group_by_vendor(client, cart_items)
+    global_order.total_price = sum(
+        cart_item.total_price for cart_item in cart_items
+    ) + (len(groups) * DELIVERY_FEE)
+    global_order.save(update_fields=["total_price"])
+
+    orders = []
+    for vendor, lines in groups:
+        total_payed = sum(cart_item.get_price() for cart_item in lines)
+        orders.append(
+            CartOrder(
+                client=client,
+                vendor=vendor,
+                total_payed=(
+                    total_payed + DELIVERY_FEE
+                    if global_order.delivery_option
+                    else total_payed
+                ),
+                payment_method="cod",
+                global_order=global_order,
+                delivery_option=global_order.delivery_option,
+            )
+        )
+    orders = CartOrder.objects.bulk_create(orders)
+
+    CartOrderItem.objects.bulk_create(
+        [
+            CartOrderItem(
+                client=client,
+                order=order,
+                cart_item=cart_item,
+                total_payed=cart_item.get_price(),
+            )
+            for order, (_, lines) in zip(orders, groups)
+            for cart_item in lines
+        ]
+    )
+    CartItem.objects.filter(pk__in=[cart_item.pk for cart_item in cart_items]).update(
+        is_ordered=True, updated_at=timezone.now()
+    )
+
+    # bulk writes skip the post_save receivers, their work is done once here
+    for model in [GlobalOrder, CartOrder, CartOrderItem, CartItem]:
+        invalidate_response_cache(model)
+    order_ids = [order.pk for order in orders]
+    transaction.on_commit(lambda: notify_new_orders.delay(order_ids))
+    return orders
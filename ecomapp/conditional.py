@@ -0,0 +1,96 @@
+from hashlib import md5
+from django.db.models import Max, Count
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from .response_cache import response_cache_key
+
+
+# validators come from one aggregate over the rows the response is built from,
+# or from the response cache version, so a 304 never touches the serializers
+class ConditionalGetMixin:
+    conditional_timestamp_fields = ["updated_at"]
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: self.filter_queryset(self.get_queryset()),
+            False,
+            super().list,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.conditional_response(
+            lambda: self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            ),
+            True,
+            super().retrieve,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    # an anonymous response of a cached view only changes with the version of
+    # its cache group, which is part of the cache key, so no query is needed
+    def cached_validators(self, request):
+        if not getattr(self, "cache_group", None) or request.user.is_authenticated:
+            return None
+        key = response_cache_key(self.cache_group, request)
+        return quote_etag(md5(key.encode()).hexdigest()), None
+
+    def get_validators(self, request, queryset):
+        aggregates = {
+            f"max_{index}": Max(field)
+            for index, field in enumerate(self.conditional_timestamp_fields)
+        }
+        values = queryset.order_by().aggregate(
+            count=Count("pk", distinct=True), **aggregates
+        )
+        timestamps = [values[alias] for alias in aggregates if values[alias]]
+        if not values["count"] or not timestamps:
+            return None, None
+
+        raw = "|".join(
+            [
+                request.get_full_path(),
+                request.accepted_renderer.format,
+                str(request.user.pk),
+                str(values["count"]),
+            ]
+            + [timestamp.isoformat() for timestamp in timestamps]
+        )
+        etag = quote_etag(md5(raw.encode()).hexdigest())
+        return etag, int(max(timestamps).timestamp())
+
+    def conditional_response(
+        self, get_queryset, single, handler, request, *args, **kwargs
+    ):
+        if request.method not in ["GET", "HEAD"]:
+            return handler(request, *args, **kwargs)
+
+        validators = self.cached_validators(request)
+        if validators is None:
+            validators = self.get_validators(request, get_queryset())
+        etag, last_modified = validators
+        # a deleted row does not move the newest timestamp of a list, so lists
+        # are only validated through the etag which also covers the row count
+        if not single:
+            last_modified = None
+
+        if etag:
+            not_modified = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if not_modified is not None:
+                not_modified["ETag"] = etag
+                return not_modified
+
+        response = handler(request, *args, **kwargs)
+        if etag and response.status_code == 200:
+            response["ETag"] = etag
+            if last_modified:
+                response["Last-Modified"] = http_date(last_modified)
+        return response
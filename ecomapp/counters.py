@@ -0,0 +1,113 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from userauths.models import Vendor
+from .response_cache import invalidate_response_cache
+
+
+# counters only move through single UPDATE ... SET x = x + n statements, so
+# concurrent transitions never overwrite each other
+def increment_vendor_counters(vendor_id, **deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not vendor_id or not deltas:
+        return 0
+    updated = Vendor.objects.filter(pk=vendor_id).update(
+        updated_at=timezone.now(),
+        **{
+            field: Greatest(F(field) + Value(delta), Value(0))
+            for field, delta in deltas.items()
+        },
+    )
+    # queryset updates skip the post_save receivers that drop cached responses
+    invalidate_response_cache(Vendor)
+    return updated
+
+
+def transition_delta(previous, current):
+    return int(bool(current)) - int(bool(previous))
+
+
+def count_per_vendor(queryset):
+    counts = (
+        queryset.filter(vendor=OuterRef("pk"))
+        .order_by()
+        .values("vendor")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def vendor_rating_rows(apps):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    ProductReview = apps.get_model("ecomapp", "ProductReview")
+
+    rows = []
+    for model_name in ["product", "foodproduct"]:
+        model = apps.get_model("ecomapp", model_name)
+        content_type, _ = ContentType.objects.get_or_create(
+            app_label="ecomapp", model=model_name
+        )
+        rows += (
+            ProductReview.objects.filter(content_type=content_type)
+            .annotate(
+                vendor_id=Subquery(
+                    model.objects.filter(pk=OuterRef("object_id")).values("vendor_id")
+                )
+            )
+            .filter(vendor_id__isnull=False)
+            .values("vendor_id", "rating")
+            .annotate(count=Count("pk"))
+            .order_by()
+        )
+    content_type, _ = ContentType.objects.get_or_create(
+        app_label="userauths", model="vendor"
+    )
+    rows += (
+        ProductReview.objects.filter(content_type=content_type)
+        .values("rating", vendor_id=F("object_id"))
+        .annotate(count=Count("pk"))
+        .order_by()
+    )
+    return content_type, rows
+
+
+# the caller drops the cached vendor responses once this committed
+def reconcile_vendor_counters(vendor_ids=None, apps=global_apps, batch_size=500):
+    Vendor = apps.get_model("userauths", "Vendor")
+    CartOrder = apps.get_model("ecomapp", "CartOrder")
+    Product = apps.get_model("ecomapp", "Product")
+    FoodProduct = apps.get_model("ecomapp", "FoodProduct")
+    RatingSummary = apps.get_model("ecomapp", "RatingSummary")
+
+    vendors = Vendor.objects.all()
+    if vendor_ids is not None:
+        vendors = vendors.filter(pk__in=vendor_ids)
+    updated = vendors.update(
+        total_sold=count_per_vendor(CartOrder.objects.filter(order_status="delivered")),
+        products_count=count_per_vendor(Product.objects.filter(is_active=True))
+        + count_per_vendor(FoodProduct.objects.filter(is_active=True)),
+        updated_at=timezone.now(),
+    )
+
+    vendor_type, rows = vendor_rating_rows(apps)
+    summaries = {}
+    for row in rows:
+        if vendor_ids is not None and row["vendor_id"] not in vendor_ids:
+            continue
+        summary = summaries.setdefault(
+            row["vendor_id"],
+            RatingSummary(content_type_id=vendor_type.pk, object_id=row["vendor_id"]),
+        )
+        summary.count += row["count"]
+        summary.total += row["count"] * row["rating"]
+        field = f"stars_{row['rating']}"
+        setattr(summary, field, getattr(summary, field) + row["count"])
+
+    stale = RatingSummary.objects.filter(content_type_id=vendor_type.pk)
+    if vendor_ids is not None:
+        stale = stale.filter(object_id__in=vendor_ids)
+    stale.delete()
+    RatingSummary.objects.bulk_create(summaries.values(), batch_size=batch_size)
+    return updated
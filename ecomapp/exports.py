@@ -0,0 +1,133 @@
+import csv
+import json
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from .models import Product, FoodProduct, CartOrder, CartOrderItem
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# every export is a flat values() projection, (column, lookup) pairs keep the
+# column order stable and let related fields come from the same join
+EXPORTS = {
+    "products": {
+        "model": Product,
+        "vendor_lookup": "vendor_id",
+        "columns": [
+            ("id", "id"),
+            ("title", "title"),
+            ("sub_category_title", "sub_category__title"),
+            ("price", "price"),
+            ("old_price", "old_price"),
+            ("discount_percentage", "discount_percentage"),
+            ("quantity", "quantity"),
+            ("in_stock", "in_stock"),
+            ("is_active", "is_active"),
+            ("product_status", "product_status"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+        ],
+    },
+    "food-products": {
+        "model": FoodProduct,
+        "vendor_lookup": "vendor_id",
+        "columns": [
+            ("id", "id"),
+            ("title", "title"),
+            ("sub_category_title", "sub_category__title"),
+            ("price", "price"),
+            ("old_price", "old_price"),
+            ("discount_percentage", "discount_percentage"),
+            ("quantity", "quantity"),
+            ("in_stock", "in_stock"),
+            ("is_active", "is_active"),
+            ("expired_at", "expired_at"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+        ],
+    },
+    "orders": {
+        "model": CartOrder,
+        "vendor_lookup": "vendor_id",
+        "columns": [
+            ("id", "id"),
+            ("global_order_id", "global_order_id"),
+            ("client_id", "client_id"),
+            ("order_date", "order_date"),
+            ("order_status", "order_status"),
+            ("payment_method", "payment_method"),
+            ("delivery_option", "delivery_option"),
+            ("total_payed", "total_payed"),
+            ("is_canceled", "is_canceled"),
+            ("city", "global_order__city"),
+            ("updated_at", "updated_at"),
+        ],
+    },
+    "order-items": {
+        "model": CartOrderItem,
+        "vendor_lookup": "order__vendor_id",
+        "columns": [
+            ("id", "id"),
+            ("order_id", "order_id"),
+            ("order_status", "order__order_status"),
+            ("product_id", "cart_item__product_id"),
+            ("food_product_id", "cart_item__food_product_id"),
+            (
+                "title",
+                Coalesce(
+                    F("cart_item__product__title"),
+                    F("cart_item__food_product__title"),
+                ),
+            ),
+            ("size", "cart_item__size"),
+            ("quantity", "cart_item__quantity"),
+            ("total_payed", "total_payed"),
+            ("is_canceled", "is_canceled"),
+            ("is_canceled_by_vendor", "is_canceled_by_vendor"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+        ],
+    },
+}
+
+
+def export_rows(name, vendor_id=None, since=None):
+    export = EXPORTS[name]
+    queryset = export["model"].objects.all()
+    if vendor_id is not None:
+        queryset = queryset.filter(**{export["vendor_lookup"]: vendor_id})
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+
+    fields, expressions = [], {}
+    for column, lookup in export["columns"]:
+        if column == lookup:
+            fields.append(column)
+        else:
+            expressions[column] = F(lookup) if isinstance(lookup, str) else lookup
+    return queryset.order_by("pk").values(*fields, **expressions)
+
+
+class Echo:
+    # csv.writer only needs an object with write(), the line is handed back
+    def write(self, value):
+        return value
+
+
+def stream_export(queryset, columns, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    rows = queryset.iterator(chunk_size=chunk_size)
+    if file_format == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([row[column] for column in columns])
+        return
+
+    for row in rows:
+        yield json.dumps(
+            {column: row[column] for column in columns}, default=str
+        ) + "\n"
+
+
+def export_columns(name):
+    return [column for column, _ in EXPORTS[name]["columns"]]
@@ -0,0 +1,130 @@
+import time
+from hashlib import md5
+from urllib.parse import urlencode
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, When, Value, IntegerField, Count
+
+FACETS_CACHE_TIMEOUT = 60 * 15
+
+PRICE_BUCKETS = [(0, 50), (50, 100), (100, 250), (250, 500), (500, 1000), (1000, None)]
+
+TAXONOMY_FACETS = {
+    "sector": "sub_category__category__sector",
+    "category": "sub_category__category",
+    "sub_category": "sub_category",
+}
+
+
+def facets_version(model):
+    return cache.get_or_set(
+        f"catalog_facets_version:{model._meta.model_name}", time.time_ns, None
+    )
+
+
+def bump_facets_versions(models):
+    # bumping the version orphans every cached filter combination of the model at once
+    for model in models:
+        cache.set(
+            f"catalog_facets_version:{model._meta.model_name}", time.time_ns(), None
+        )
+
+
+# runs once the writer committed, like the response cache
+def invalidate_catalog_facets(*models):
+    transaction.on_commit(lambda: bump_facets_versions(models))
+
+
+def facets_cache_key(model, params, allowed_params):
+    normalized = sorted(
+        (key, value.strip().lower())
+        for key in allowed_params
+        for value in params.getlist(key)
+        if value.strip()
+    )
+    digest = md5(urlencode(normalized).encode()).hexdigest()
+    return f"catalog_facets:{model._meta.model_name}:{facets_version(model)}:{digest}"
+
+
+def price_bucket():
+    return Case(
+        *[
+            When(
+                **(
+                    {"price__gte": low, "price__lt": high}
+                    if high is not None
+                    else {"price__gte": low}
+                ),
+                then=Value(index),
+            )
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        output_field=IntegerField(),
+    )
+
+
+def add_count(counts, key, count, **extra):
+    if key not in counts:
+        counts[key] = {**extra, "count": 0}
+    counts[key]["count"] += count
+
+
+def sorted_counts(counts):
+    return sorted(counts.values(), key=lambda facet: facet["count"], reverse=True)
+
+
+def get_catalog_facets(queryset):
+    fields = ["vendor__city", "in_stock"]
+    for path in TAXONOMY_FACETS.values():
+        fields += [f"{path}_id", f"{path}__title"]
+    has_vegan = any(
+        field.name == "is_vegan" for field in queryset.model._meta.get_fields()
+    )
+    if has_vegan:
+        fields.append("is_vegan")
+
+    # a single grouped query over every facet dimension, folded in python afterwards
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket())
+        .values(*fields, "price_bucket")
+        .annotate(count=Count("id"))
+    )
+
+    total = 0
+    taxonomy = {name: {} for name in TAXONOMY_FACETS}
+    cities = {}
+    prices = {}
+    in_stock = {"true": 0, "false": 0}
+    is_vegan = {"true": 0, "false": 0}
+
+    for row in rows:
+        count = row["count"]
+        total += count
+        for name, path in TAXONOMY_FACETS.items():
+            add_count(
+                taxonomy[name],
+                row[f"{path}_id"],
+                count,
+                id=row[f"{path}_id"],
+                title=row[f"{path}__title"],
+            )
+        if row["vendor__city"]:
+            add_count(cities, row["vendor__city"], count, value=row["vendor__city"])
+        if row["price_bucket"] is not None:
+            low, high = PRICE_BUCKETS[row["price_bucket"]]
+            add_count(prices, row["price_bucket"], count, min_price=low, max_price=high)
+        in_stock["true" if row["in_stock"] else "false"] += count
+        if has_vegan:
+            is_vegan["true" if row["is_vegan"] else "false"] += count
+
+    facets = {
+        "count": total,
+        **{name: sorted_counts(counts) for name, counts in taxonomy.items()},
+        "city": sorted_counts(cities),
+        "in_stock": in_stock,
+        "price": [prices[index] for index in sorted(prices)],
+    }
+    if has_vegan:
+        facets["is_vegan"] = is_vegan
+    return facets
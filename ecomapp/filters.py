@@ -1,6 +1,14 @@
 from django_filters import rest_framework as filters
 from .models import Product, FoodProduct, Category, SubCategory, CartItem
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, BasePagination
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from .search import search_catalog
 
 
 class ProductPagination(PageNumberPagination):
@@ -10,6 +18,148 @@ class ProductPagination(PageNumberPagination):
     page_query_params = "page"
 
 
+# opt-in with ?pagination=cursor, otherwise the fallback page number pagination is used
+class KeysetPagination(BasePagination):
+    ordering_field = "created_at"
+    fallback_class = PageNumberPagination
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    mode_query_param = "pagination"
+
+    def __init__(self):
+        self.fallback = self.fallback_class()
+        self.use_cursor = False
+
+    def is_cursor_request(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.cursor_query_param in request.query_params
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, instance, reverse):
+        position = getattr(instance, self.ordering_field).isoformat()
+        raw = f"{int(reverse)}|{position}|{instance.pk}"
+        cursor = urlsafe_b64encode(raw.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            reverse, position, pk = (
+                urlsafe_b64decode(encoded.encode()).decode().split("|")
+            )
+            position = parse_datetime(position)
+            if position is None:
+                raise ValueError
+            return bool(int(reverse)), position, int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.is_cursor_request(request)
+        if not self.use_cursor:
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        # the keyset is always the ordering field and the id, another ordering
+        # would be silently dropped
+        if "ordering" in request.query_params:
+            raise ValidationError(
+                {"ordering": "ordering can not be combined with cursor pagination"}
+            )
+
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        field = self.ordering_field
+        reverse = cursor[0] if cursor else False
+
+        if reverse:
+            queryset = queryset.order_by(field, "id")
+        else:
+            queryset = queryset.order_by(f"-{field}", "-id")
+
+        if cursor:
+            _, position, pk = cursor
+            lookup = "gt" if reverse else "lt"
+            queryset = queryset.filter(
+                Q(**{f"{field}__{lookup}": position})
+                | Q(**{field: position, f"id__{lookup}": pk})
+            )
+
+        rows = list(queryset[: page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = (not reverse and has_more) or (reverse and cursor is not None)
+        has_previous = (reverse and has_more) or (not reverse and cursor is not None)
+
+        self.next_link = (
+            self.encode_cursor(rows[-1], False) if rows and has_next else None
+        )
+        self.previous_link = (
+            self.encode_cursor(rows[0], True) if rows and has_previous else None
+        )
+        if not rows and cursor is not None:
+            self.previous_link = remove_query_param(
+                self.base_url, self.cursor_query_param
+            )
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return self.fallback.get_paginated_response(data)
+        return Response(
+            {"next": self.next_link, "previous": self.previous_link, "results": data}
+        )
+
+
+class ProductKeysetPagination(KeysetPagination):
+    fallback_class = ProductPagination
+
+
+class NotificationKeysetPagination(KeysetPagination):
+    pass
+
+
+class CartOrderKeysetPagination(KeysetPagination):
+    ordering_field = "order_date"
+
+
+class CatalogSearchFilter(BaseFilterBackend):
+    search_param = "search"
+    ordering_param = "ordering"
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+
+        search = search_catalog(queryset.model, query)
+        if search is None:
+            return queryset.filter(
+                Q(title__icontains=query) | Q(description__icontains=query)
+            )
+
+        matching_ids, rank = search
+        queryset = queryset.filter(pk__in=matching_ids)
+        if self.ordering_param in request.query_params:
+            return queryset
+        return queryset.annotate(search_rank=rank).order_by("-search_rank", "pk")
+
+
 class CartItemFilter(filters.FilterSet):
     is_ordered = filters.BooleanFilter(field_name="is_ordered")
 
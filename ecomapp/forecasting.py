@@ -0,0 +1,131 @@
+import time
+from datetime import timedelta
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Product, FoodProduct, ProductSize, CartOrderItem
+
+FORECAST_CACHE_TIMEOUT = 60 * 60
+# weight of the most recent day in the smoothed demand
+SMOOTHING_ALPHA = 0.3
+LEAD_TIME_DAYS = 7
+# ~95% service level
+SAFETY_FACTOR = 1.65
+
+
+def forecast_version(vendor_id):
+    return cache.get_or_set(f"stock_forecast_version:{vendor_id}", time.time_ns, None)
+
+
+def invalidate_stock_forecast(vendor_id):
+    cache.set(f"stock_forecast_version:{vendor_id}", time.time_ns(), None)
+
+
+# food products without a quantity are not stock managed, they have no forecast
+def load_skus(vendor):
+    skus = []
+    for kind, model in [("product", Product), ("foodproduct", FoodProduct)]:
+        skus += [
+            (kind, pk, None, quantity)
+            for pk, quantity in model.objects.filter(
+                vendor=vendor, quantity__isnull=False
+            ).values_list("pk", "quantity")
+        ]
+    skus += [
+        ("product", product_id, size, quantity)
+        for product_id, size, quantity in ProductSize.objects.filter(
+            product__vendor=vendor
+        ).values_list("product_id", "size", "quantity")
+    ]
+    return skus
+
+
+def load_sales(vendor, since_day):
+    return (
+        CartOrderItem.objects.filter(
+            order__vendor=vendor,
+            order__order_status="delivered",
+            order__order_date__date__gte=since_day,
+        )
+        .annotate(day=TruncDate("order__order_date"))
+        .values(
+            "day",
+            "cart_item__product_id",
+            "cart_item__food_product_id",
+            "cart_item__size",
+        )
+        .annotate(quantity=Sum("cart_item__quantity"), last_order=Max("created_at"))
+        .order_by()
+    )
+
+
+# every sku of the vendor gets one row of daily sales, the forecast is then
+# computed for all rows at once
+def build_stock_forecast(vendor, days=30):
+    today = timezone.localdate()
+    since_day = today - timedelta(days=days - 1)
+    skus = load_skus(vendor)
+    index = {sku[:3]: row for row, sku in enumerate(skus)}
+
+    sales = np.zeros((len(skus), days))
+    last_orders = [None] * len(skus)
+    rows, columns, quantities = [], [], []
+    for sale in load_sales(vendor, since_day):
+        if sale["cart_item__product_id"]:
+            keys = [("product", sale["cart_item__product_id"], None)]
+            if sale["cart_item__size"]:
+                keys.append(keys[0][:2] + (sale["cart_item__size"],))
+        else:
+            keys = [("foodproduct", sale["cart_item__food_product_id"], None)]
+        for key in keys:
+            row = index.get(key)
+            if row is None:
+                continue
+            rows.append(row)
+            columns.append((sale["day"] - since_day).days)
+            quantities.append(sale["quantity"])
+            if last_orders[row] is None or sale["last_order"] > last_orders[row]:
+                last_orders[row] = sale["last_order"]
+    np.add.at(sales, (rows, columns), quantities)
+
+    weights = SMOOTHING_ALPHA * (1 - SMOOTHING_ALPHA) ** np.arange(days - 1, -1, -1)
+    weights /= weights.sum()
+    demand = sales @ weights
+    demand_std = np.sqrt(((sales - demand[:, None]) ** 2) @ weights)
+    stock = np.array([sku[3] for sku in skus], dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_left = np.where(demand > 0, stock / demand, np.nan)
+    reorder_point = np.ceil(
+        demand * LEAD_TIME_DAYS + SAFETY_FACTOR * demand_std * np.sqrt(LEAD_TIME_DAYS)
+    )
+    total_sold = sales.sum(axis=1)
+
+    return [
+        {
+            "kind": kind,
+            "id": pk,
+            "size": size,
+            "quantity": quantity,
+            "total_sold": int(total_sold[row]),
+            "average_sales": float(total_sold[row] / days),
+            "smoothed_demand": round(float(demand[row]), 4),
+            "days_left": (
+                None if np.isnan(days_left[row]) else round(float(days_left[row]), 2)
+            ),
+            "reorder_point": int(reorder_point[row]),
+            "needs_reorder": bool(demand[row] > 0 and quantity <= reorder_point[row]),
+            "last_order_date": last_orders[row],
+        }
+        for row, (kind, pk, size, quantity) in enumerate(skus)
+    ]
+
+
+def get_stock_forecast(vendor, days=30):
+    key = f"stock_forecast:{vendor.pk}:{forecast_version(vendor.pk)}:{days}"
+    forecast = cache.get(key)
+    if forecast is None:
+        forecast = build_stock_forecast(vendor, days)
+        cache.set(key, forecast, FORECAST_CACHE_TIMEOUT)
+    return forecast
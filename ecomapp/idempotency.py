@@ -0,0 +1,119 @@
+import hashlib
+import json
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(minutes=5)
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    raw = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def prune_idempotency_keys(ttl=IDEMPOTENCY_KEY_TTL):
+    deleted, _ = IdempotencyKey.objects.filter(
+        created_at__lt=timezone.now() - ttl
+    ).delete()
+    return deleted
+
+
+# only one retry can take over an expired lease, the others still get a 409
+def reclaim(record):
+    now = timezone.now()
+    if record.status_code is not None or record.locked_until > now:
+        return False
+    return bool(
+        IdempotencyKey.objects.filter(
+            pk=record.pk, status_code__isnull=True, locked_until=record.locked_until
+        ).update(locked_until=now + IDEMPOTENCY_LOCK_TIMEOUT)
+    )
+
+
+def replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {"error": "this Idempotency-Key was already used for another request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return Response(
+            {"error": "a request with this Idempotency-Key is still in progress"},
+            status=status.HTTP_409_CONFLICT,
+        )
+    response = Response(record.response, status=record.status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+# a retry is answered from the row of its key, only successful responses are
+# kept so a failed request can be sent again with the same key
+class IdempotentMixin:
+    def create(self, request, *args, **kwargs):
+        return self.idempotent_response(super().create, request, *args, **kwargs)
+
+    def idempotent_response(self, handler, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {"error": "the Idempotency-Key must not exceed 255 characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request)
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if (
+            record is not None
+            and record.created_at < timezone.now() - IDEMPOTENCY_KEY_TTL
+        ):
+            record.delete()
+            record = None
+
+        if record is not None:
+            if record.fingerprint != fingerprint or not reclaim(record):
+                return replay(record, fingerprint)
+        else:
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user,
+                        key=key,
+                        fingerprint=fingerprint,
+                        locked_until=timezone.now() + IDEMPOTENCY_LOCK_TIMEOUT,
+                    )
+            except IntegrityError:
+                # the same key arrived twice at once, the first one runs
+                return Response(
+                    {
+                        "error": "a request with this Idempotency-Key is still in progress"
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+        # the writes of the handler and the stored response commit together, a
+        # crash in between can not leave an order whose key still looks pending
+        try:
+            with transaction.atomic():
+                response = handler(request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    record.status_code = response.status_code
+                    record.response = response.data
+                    record.save(update_fields=["status_code", "response"])
+        except Exception:
+            record.delete()
+            raise
+
+        if not status.is_success(response.status_code):
+            record.delete()
+        return response
@@ -0,0 +1,143 @@
+import os
+from io import BytesIO
+from PIL import Image, ImageOps
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from .response_cache import invalidate_response_cache
+
+IMAGE_VARIANT_WIDTHS = [160, 320, 640, 1280]
+IMAGE_VARIANT_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+IMAGE_VARIANT_QUALITY = 80
+
+IMAGE_MODELS = [
+    "ecomapp.Category",
+    "ecomapp.Product",
+    "ecomapp.ProductImages",
+    "ecomapp.FoodProduct",
+    "ecomapp.FoodProductImage",
+    "userauths.Vendor",
+]
+
+# gallery images are rendered inside their item, so the item counts as modified
+IMAGE_PARENTS = {
+    "ecomapp.ProductImages": ("ecomapp.Product", "product_id"),
+    "ecomapp.FoodProductImage": ("ecomapp.FoodProduct", "food_product_id"),
+}
+
+
+def variant_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f"{root}_{width}w.{extension}"
+
+
+def has_alpha(image):
+    return image.mode in ["RGBA", "LA"] or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def encode(image, image_format):
+    if image_format == "JPEG" or not has_alpha(image):
+        if has_alpha(image):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+    else:
+        image = image.convert("RGBA")
+
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=IMAGE_VARIANT_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+# the variants are stored next to the original, an image is never upscaled
+def render_image_variants(name):
+    with default_storage.open(name, "rb") as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+
+    widths = [width for width in IMAGE_VARIANT_WIDTHS if width < image.width]
+    variants = {"source": name}
+    for extension in IMAGE_VARIANT_FORMATS:
+        variants[extension] = {}
+
+    for width in widths or [image.width]:
+        resized = image.copy()
+        resized.thumbnail((width, image.height), Image.LANCZOS)
+        for extension, image_format in IMAGE_VARIANT_FORMATS.items():
+            path = variant_name(name, width, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[extension][str(width)] = default_storage.save(
+                path, encode(resized, image_format)
+            )
+    return variants
+
+
+def variant_files(variants):
+    return {
+        path
+        for extension in IMAGE_VARIANT_FORMATS
+        for path in (variants or {}).get(extension, {}).values()
+    }
+
+
+def delete_variant_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def build_image_variants(model_label, pk):
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.image:
+        return None
+
+    variants = render_image_variants(instance.image.name)
+    changes = {"image_variants": variants}
+    if any(field.name == "updated_at" for field in model._meta.concrete_fields):
+        changes["updated_at"] = timezone.now()
+    # the image may have been replaced while the variants were rendered, the
+    # files nothing points to anymore are removed from the storage
+    updated = model.objects.filter(pk=pk, image=instance.image.name).update(**changes)
+    if not updated:
+        delete_variant_files(variant_files(variants))
+        return None
+    delete_variant_files(
+        variant_files(instance.image_variants) - variant_files(variants)
+    )
+
+    invalidate_response_cache(model)
+    if model_label in IMAGE_PARENTS:
+        parent_label, parent_field = IMAGE_PARENTS[model_label]
+        apps.get_model(parent_label).objects.filter(
+            pk=getattr(instance, parent_field)
+        ).update(updated_at=timezone.now())
+    return variants
+
+
+def needs_image_variants(instance):
+    return bool(instance.image) and (
+        (instance.image_variants or {}).get("source") != instance.image.name
+    )
+
+
+def image_srcset(instance, request):
+    variants = instance.image_variants or {}
+    if not instance.image or variants.get("source") != instance.image.name:
+        return {}
+    srcset = {}
+    for extension in IMAGE_VARIANT_FORMATS:
+        srcset[extension] = {}
+        for width, path in variants.get(extension, {}).items():
+            url = default_storage.url(path)
+            srcset[extension][f"{width}w"] = (
+                request.build_absolute_uri(url) if request else url
+            )
+    return srcset
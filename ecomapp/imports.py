@@ -0,0 +1,259 @@
+import codecs
+import csv
+import json
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+from taggit.models import Tag, TaggedItem
+from .models import (
+    Product,
+    ProductColor,
+    ProductSize,
+    SubCategory,
+    ColorChoices,
+    SizeChoices,
+)
+from .search import index_catalog_items
+from .facets import invalidate_catalog_facets
+from .response_cache import invalidate_response_cache
+from .category_tree import invalidate_category_tree
+from .counters import increment_vendor_counters
+from .forecasting import invalidate_stock_forecast
+from .tasks import generate_image_variants_batch, generate_product_details
+
+IMPORT_CHUNK_SIZE = 200
+IMPORT_FORMATS = ["csv", "jsonl"]
+
+
+def split_list(value):
+    if value in [None, ""]:
+        return []
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in str(value).split("|") if item.strip()]
+
+
+# csv sizes are written as "M:10|L:4", jsonl rows can also send objects
+def parse_sizes(value):
+    sizes = []
+    for item in split_list(value):
+        if isinstance(item, dict):
+            sizes.append(item)
+            continue
+        size, _, quantity = str(item).partition(":")
+        sizes.append({"size": size.strip(), "quantity": quantity.strip() or None})
+    return sizes
+
+
+class ProductSizeImportSerializer(serializers.Serializer):
+    size = serializers.ChoiceField(choices=SizeChoices.choices)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    sub_category = serializers.IntegerField()
+    # path of an image already uploaded to the media storage
+    image = serializers.CharField(max_length=100)
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=100), required=False
+    )
+    colors = serializers.ListField(
+        child=serializers.ChoiceField(choices=ColorChoices.choices), required=False
+    )
+    sizes = ProductSizeImportSerializer(many=True, required=False)
+
+    class Meta:
+        model = Product
+        fields = [
+            "title",
+            "description",
+            "sub_category",
+            "image",
+            "price",
+            "old_price",
+            "quantity",
+            "specifications",
+            "long_description",
+            "potential_guarantee_period",
+            "is_digital",
+            "is_active",
+            "featured",
+            "tags",
+            "colors",
+            "sizes",
+        ]
+
+    def validate_image(self, value):
+        if not default_storage.exists(value):
+            raise serializers.ValidationError("no uploaded image has this path")
+        return value
+
+    def validate_sub_category(self, value):
+        if value not in self.context["sub_category_ids"]:
+            raise serializers.ValidationError("this sub category does not exist")
+        return value
+
+    def to_internal_value(self, data):
+        data = dict(data)
+        for key, value in list(data.items()):
+            if value == "" and key not in ["title", "description", "image"]:
+                data.pop(key)
+        for key in ["tags", "colors"]:
+            if key in data:
+                data[key] = split_list(data[key])
+        if "sizes" in data:
+            data["sizes"] = parse_sizes(data["sizes"])
+        return super().to_internal_value(data)
+
+
+# the whole upload is decoded once before any row is read, so a file that is
+# not utf-8 is refused before a chunk was written
+def check_encoding(stream):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    try:
+        for block in iter(lambda: stream.read(64 * 1024), b""):
+            decoder.decode(block)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError as error:
+        raise serializers.ValidationError(
+            f"the file must be utf-8 encoded: {error.reason} at byte {error.start}"
+        )
+    finally:
+        stream.seek(0)
+
+
+def read_rows(stream, file_format):
+    lines = codecs.getreader("utf-8-sig")(stream)
+    if file_format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, None, f"invalid json: {error}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "every line must be a json object"
+            continue
+        yield line_number, row, None
+
+
+def add_tags(products, tags_by_product):
+    names = {name for tags in tags_by_product for name in tags}
+    if not names:
+        return
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    for name in names - set(tags):
+        tags[name], _ = Tag.objects.get_or_create(name=name)
+
+    content_type = ContentType.objects.get_for_model(Product)
+    TaggedItem.objects.bulk_create(
+        [
+            TaggedItem(content_type=content_type, object_id=product.pk, tag=tags[name])
+            for product, names in zip(products, tags_by_product)
+            for name in set(names)
+        ]
+    )
+
+
+def create_chunk(vendor, rows):
+    products, tags, colors, sizes = [], [], [], []
+    for data in rows:
+        data = dict(data)
+        tags.append(data.pop("tags", []))
+        colors.append(data.pop("colors", []))
+        sizes.append(data.pop("sizes", []))
+        data["sub_category_id"] = data.pop("sub_category")
+        product = Product(vendor=vendor, **data)
+        product.set_discount_and_stock()
+        products.append(product)
+
+    with transaction.atomic():
+        products = Product.objects.bulk_create(products)
+        ProductColor.objects.bulk_create(
+            [
+                ProductColor(product=product, color=color)
+                for product, product_colors in zip(products, colors)
+                for color in dict.fromkeys(product_colors)
+            ]
+        )
+        ProductSize.objects.bulk_create(
+            [
+                ProductSize(product=product, **size)
+                for product, product_sizes in zip(products, sizes)
+                for size in {size["size"]: size for size in product_sizes}.values()
+            ]
+        )
+        add_tags(products, tags)
+    return products
+
+
+# bulk_create skips the post_save receivers, so their work is done once per chunk
+def after_import(vendor, products):
+    index_catalog_items(
+        Product.objects.filter(pk__in=[product.pk for product in products])
+        .select_related("vendor__user")
+        .prefetch_related("tags")
+    )
+    increment_vendor_counters(
+        vendor.pk, products_count=sum(product.is_active for product in products)
+    )
+    invalidate_catalog_facets(Product)
+    invalidate_response_cache(Product)
+    invalidate_category_tree()
+    invalidate_stock_forecast(vendor.pk)
+
+
+def import_products(vendor, stream, file_format, chunk_size=IMPORT_CHUNK_SIZE):
+    context = {
+        "sub_category_ids": set(SubCategory.objects.values_list("pk", flat=True))
+    }
+    report = {"created": 0, "failed": 0, "errors": []}
+    created_ids = []
+    check_encoding(stream)
+
+    def fail(line_number, errors):
+        report["failed"] += 1
+        report["errors"].append({"row": line_number, "errors": errors})
+
+    def flush(chunk):
+        if not chunk:
+            return
+        try:
+            products = create_chunk(vendor, [data for _, data in chunk])
+        except DatabaseError as error:
+            for line_number, _ in chunk:
+                fail(line_number, {"non_field_errors": [str(error)]})
+            return
+        after_import(vendor, products)
+        report["created"] += len(products)
+        created_ids.extend(product.pk for product in products)
+        generate_image_variants_batch.delay(
+            Product._meta.label, [product.pk for product in products]
+        )
+
+    chunk = []
+    for line_number, row, error in read_rows(stream, file_format):
+        if error:
+            fail(line_number, {"non_field_errors": [error]})
+            continue
+        serializer = ProductImportSerializer(data=row, context=context)
+        if not serializer.is_valid():
+            fail(line_number, serializer.errors)
+            continue
+        chunk.append((line_number, serializer.validated_data))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+
+    if created_ids:
+        generate_product_details.delay(created_ids)
+    return report
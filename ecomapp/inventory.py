@@ -0,0 +1,203 @@
+from collections import Counter
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import CartItem, CartOrder, FoodProduct, Product, ProductSize
+from .facets import invalidate_catalog_facets
+from .response_cache import invalidate_response_cache
+from .forecasting import invalidate_stock_forecast
+
+STOCK_RESERVED_STATUSES = ["confirmed", "delivered"]
+
+# ProductSize rows are keyed by (product_id, size), the items by their pk
+STOCK_MODELS = {
+    "product": Product,
+    "food_product": FoodProduct,
+    "product_size": ProductSize,
+}
+
+
+class Oversold(Exception):
+    pass
+
+
+class OutOfStock(ValidationError):
+    def __init__(self, conflicts):
+        super().__init__({"stock": conflicts})
+        self.conflicts = conflicts
+
+
+def stock_lines(order_items):
+    lines = Counter()
+    sized = set()
+    for order_item in order_items:
+        cart_item = order_item.cart_item
+        if cart_item.product_id:
+            lines[("product", cart_item.product_id)] += cart_item.quantity
+            if cart_item.size:
+                sized.add((cart_item.product_id, cart_item.size))
+                lines[
+                    ("product_size", (cart_item.product_id, cart_item.size))
+                ] += cart_item.quantity
+        elif cart_item.food_product_id:
+            lines[("food_product", cart_item.food_product_id)] += cart_item.quantity
+
+    # a size without its own row is only counted on the product
+    if sized:
+        tracked = set(
+            ProductSize.objects.filter(
+                product_id__in={product_id for product_id, _ in sized}
+            ).values_list("product_id", "size")
+        )
+        for key in sized - tracked:
+            del lines[("product_size", key)]
+    return lines
+
+
+def row_filter(kind, key):
+    if kind == "product_size":
+        return Q(product_id=key[0], size=key[1])
+    return Q(pk=key)
+
+
+def group_lines(lines):
+    groups = {}
+    for (kind, key), quantity in lines.items():
+        groups.setdefault(kind, []).append((key, quantity))
+    return groups
+
+
+def per_row(kind, rows):
+    return Case(
+        *[When(row_filter(kind, key), then=Value(quantity)) for key, quantity in rows],
+        output_field=IntegerField(),
+    )
+
+
+def rows_queryset(kind, rows):
+    condition = Q()
+    for key, _ in rows:
+        condition |= row_filter(kind, key)
+    return STOCK_MODELS[kind].objects.filter(condition)
+
+
+def stock_changes(kind, quantity):
+    changes = {"quantity": quantity}
+    if kind != "product_size":
+        changes["updated_at"] = timezone.now()
+    return changes
+
+
+# food products without a quantity are not stock managed and never run out
+def decrement(kind, rows):
+    needed = per_row(kind, rows)
+    updated = (
+        rows_queryset(kind, rows)
+        .filter(Q(quantity__gte=needed) | Q(quantity__isnull=True))
+        .update(**stock_changes(kind, F("quantity") - needed))
+    )
+    if updated != len(rows):
+        raise Oversold()
+    if kind != "product_size":
+        rows_queryset(kind, rows).filter(quantity=0).update(in_stock=False)
+
+
+def increment(kind, rows):
+    rows_queryset(kind, rows).update(
+        **stock_changes(kind, F("quantity") + per_row(kind, rows))
+    )
+    if kind != "product_size":
+        rows_queryset(kind, rows).filter(quantity__gt=0, in_stock=False).update(
+            in_stock=True
+        )
+
+
+def find_conflicts(lines):
+    conflicts = []
+    for kind, rows in group_lines(lines).items():
+        available = {}
+        for row in rows_queryset(kind, rows).values(
+            *(["product_id", "size"] if kind == "product_size" else ["pk"]),
+            "quantity",
+        ):
+            key = (
+                (row["product_id"], row["size"])
+                if kind == "product_size"
+                else row["pk"]
+            )
+            available[key] = row["quantity"]
+
+        for key, quantity in rows:
+            if key in available and (
+                available[key] is None or available[key] >= quantity
+            ):
+                continue
+            conflicts.append(
+                {
+                    "kind": kind,
+                    "id": key[0] if kind == "product_size" else key,
+                    "size": key[1] if kind == "product_size" else None,
+                    "requested": quantity,
+                    "available": available.get(key, 0),
+                }
+            )
+    return conflicts
+
+
+def active_order_items(order):
+    return order.cart_order_items.filter(
+        is_active=True, is_canceled=False, is_canceled_by_vendor=False
+    ).select_related("cart_item")
+
+
+# the stock of an order is taken all at once with one conditional UPDATE per
+# model, a line that would go below zero rolls the whole order back
+def reserve_order_stock(order):
+    lines = Counter()
+    try:
+        with transaction.atomic():
+            # only one of two concurrent confirmations gets to take the stock
+            if not CartOrder.objects.filter(pk=order.pk, stock_reserved=False).update(
+                stock_reserved=True
+            ):
+                order.stock_reserved = True
+                return lines
+            lines = stock_lines(active_order_items(order))
+            for kind, rows in group_lines(lines).items():
+                decrement(kind, rows)
+    except Oversold:
+        raise OutOfStock(find_conflicts(lines))
+
+    order.stock_reserved = True
+    return lines
+
+
+def release_stock(order_items):
+    lines = stock_lines(order_items)
+    with transaction.atomic():
+        for kind, rows in group_lines(lines).items():
+            increment(kind, rows)
+    return lines
+
+
+# stock moves through queryset updates, so the receivers of the items never run
+def invalidate_stock_caches(vendor_id):
+    invalidate_catalog_facets(Product, FoodProduct)
+    invalidate_response_cache(Product)
+    invalidate_response_cache(FoodProduct)
+    invalidate_stock_forecast(vendor_id)
+
+
+# cart lines of items that ran out cannot be checked out, a restock makes them
+# available again, both with one UPDATE for all the items
+def sync_cart_items(model, ids):
+    field = "product" if model is Product else "food_product"
+    lines = CartItem.objects.filter(is_ordered=False, **{f"{field}_id__in": ids})
+    now = timezone.now()
+    lines.filter(is_active=True, **{f"{field}__quantity": 0}).update(
+        is_active=False, updated_at=now
+    )
+    lines.filter(is_active=False, **{f"{field}__quantity__gt": 0}).update(
+        is_active=True, updated_at=now
+    )
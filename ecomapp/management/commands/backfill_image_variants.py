@@ -0,0 +1,45 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from ecomapp.images import IMAGE_MODELS, build_image_variants, needs_image_variants
+from ecomapp.tasks import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = "Generate the resized WebP/JPEG variants of already uploaded images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model", choices=IMAGE_MODELS, action="append", dest="models"
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="regenerate up to date variants"
+        )
+        parser.add_argument(
+            "--queue", action="store_true", help="hand the work to celery workers"
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        for label in options["models"] or IMAGE_MODELS:
+            model = apps.get_model(label)
+            instances = (
+                model.objects.exclude(image="")
+                .exclude(image__isnull=True)
+                .only("pk", "image", "image_variants")
+                .order_by("pk")
+                .iterator(chunk_size=options["batch_size"])
+            )
+            for instance in instances:
+                if not (options["force"] or needs_image_variants(instance)):
+                    continue
+                if options["queue"]:
+                    generate_image_variants.delay(label, instance.pk)
+                else:
+                    try:
+                        build_image_variants(label, instance.pk)
+                    except (OSError, ValueError) as error:
+                        self.stderr.write(f"{label} {instance.pk}: {error}")
+                        continue
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f"{total} images processed"))
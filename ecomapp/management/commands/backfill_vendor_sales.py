@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from ecomapp.sales import rebuild_vendor_sales
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily vendor sales rollup from delivered orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vendor", type=int, action="append", dest="vendors")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        rows = rebuild_vendor_sales(
+            vendor_ids=options["vendors"], batch_size=options["batch_size"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"{rows} daily sales rows rebuilt"))
@@ -0,0 +1,40 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from userauths.models import Vendor
+from ecomapp.imports import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, import_products
+
+
+class Command(BaseCommand):
+    help = "Import products for a vendor from a csv or jsonl file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--vendor", type=int, required=True)
+        parser.add_argument("--format", choices=IMPORT_FORMATS)
+        parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            vendor = Vendor.objects.get(pk=options["vendor"])
+        except Vendor.DoesNotExist:
+            raise CommandError("Vendor with the provided ID does not exist")
+
+        file_format = options["format"] or (
+            "csv" if options["path"].lower().endswith(".csv") else "jsonl"
+        )
+        with open(options["path"], "rb") as stream:
+            try:
+                report = import_products(
+                    vendor, stream, file_format, chunk_size=options["chunk_size"]
+                )
+            except ValidationError as error:
+                raise CommandError(error.detail[0])
+
+        for error in report["errors"]:
+            self.stderr.write(json.dumps(error))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report['created']} products imported, {report['failed']} rows failed"
+            )
+        )
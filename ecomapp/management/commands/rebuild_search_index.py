@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from ecomapp.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full text search index of products and food products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{indexed} catalog items indexed"))
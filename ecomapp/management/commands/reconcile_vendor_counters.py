@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from userauths.models import Vendor
+from ecomapp.counters import reconcile_vendor_counters
+from ecomapp.response_cache import invalidate_response_cache
+
+
+class Command(BaseCommand):
+    help = "Rebuild vendor total_sold, products_count and rating summaries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vendor", type=int, action="append", dest="vendors")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        vendors = reconcile_vendor_counters(
+            vendor_ids=options["vendors"], batch_size=options["batch_size"]
+        )
+        # the queryset updates skip the receivers that drop cached responses
+        invalidate_response_cache(Vendor)
+        self.stdout.write(self.style.SUCCESS(f"{vendors} vendors reconciled"))
@@ -0,0 +1,106 @@
+# Generated by Django 5.1.6 on 2026-10-17 22:35
+
+import django.db.models.deletion
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_summaries(apps, schema_editor):
+    ProductReview = apps.get_model("ecomapp", "ProductReview")
+    RatingSummary = apps.get_model("ecomapp", "RatingSummary")
+    ContentType = apps.get_model("contenttypes", "ContentType")
+
+    rows = list(
+        ProductReview.objects.values("content_type_id", "object_id", "rating")
+        .annotate(reviews=Count("id"))
+        .order_by()
+    )
+    if not rows:
+        return
+
+    vendor_content_type, _ = ContentType.objects.get_or_create(
+        app_label="userauths", model="vendor"
+    )
+    vendor_ids = {}
+    for model_name in ["product", "foodproduct"]:
+        content_type = ContentType.objects.filter(
+            app_label="ecomapp", model=model_name
+        ).first()
+        if content_type is None:
+            continue
+        model = apps.get_model("ecomapp", model_name)
+        for object_id, vendor_id in model.objects.values_list("id", "vendor_id"):
+            vendor_ids[(content_type.id, object_id)] = vendor_id
+
+    summaries = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        key = (row["content_type_id"], row["object_id"])
+        targets = [key]
+        if key in vendor_ids:
+            targets.append((vendor_content_type.id, vendor_ids[key]))
+        for target in targets:
+            summary = summaries[target]
+            summary["count"] += row["reviews"]
+            summary["total"] += row["reviews"] * row["rating"]
+            summary[f"stars_{row['rating']}"] += row["reviews"]
+
+    RatingSummary.objects.bulk_create(
+        [
+            RatingSummary(
+                content_type_id=content_type_id, object_id=object_id, **values
+            )
+            for (content_type_id, object_id), values in summaries.items()
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("ecomapp", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RatingSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("object_id", models.PositiveIntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("stars_1", models.PositiveIntegerField(default=0)),
+                ("stars_2", models.PositiveIntegerField(default=0)),
+                ("stars_3", models.PositiveIntegerField(default=0)),
+                ("stars_4", models.PositiveIntegerField(default=0)),
+                ("stars_5", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Rating Summaries",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("content_type", "object_id"),
+                        name="unique_rating_summary",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_rating_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2026-10-17 22:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("ecomapp", "0002_ratingsummary"),
+        (
+            "taggit",
+            "0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx",
+        ),
+        ("userauths", "0002_delete_sector"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cartorder",
+            index=models.Index(
+                fields=["vendor", "order_date", "id"],
+                name="ecomapp_car_vendor__3a8182_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cartorder",
+            index=models.Index(
+                fields=["client", "order_date", "id"],
+                name="ecomapp_car_client__f2d40e_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="foodproduct",
+            index=models.Index(
+                fields=["created_at", "id"], name="ecomapp_foo_created_c5361a_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["user", "created_at", "id"],
+                name="ecomapp_not_user_id_1b59f4_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["created_at", "id"], name="ecomapp_pro_created_3ac4d7_idx"
+            ),
+        ),
+    ]
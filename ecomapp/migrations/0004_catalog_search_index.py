@@ -0,0 +1,108 @@
+from django.db import migrations
+
+# frozen copy of the ecomapp.search schema, the live backends may change
+# without this migration changing with them
+SEARCH_TABLE = "ecomapp_catalogsearch"
+
+KINDS = {"product": 0, "foodproduct": 1}
+
+COLUMNS = ["title", "description", "tags", "specifications", "vendor", "ingredients"]
+
+CREATE_INDEX = {
+    "sqlite": [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        f"{', '.join(COLUMNS)}, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ],
+    "postgresql": [
+        f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        "(id bigint PRIMARY KEY, document tsvector NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document "
+        f"ON {SEARCH_TABLE} USING GIN (document)",
+    ],
+}
+
+POSTGRES_WEIGHTS = {
+    "title": "A",
+    "tags": "A",
+    "vendor": "B",
+    "description": "B",
+    "ingredients": "C",
+    "specifications": "D",
+}
+
+INSERT_DOCUMENT = {
+    "sqlite": (
+        f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(COLUMNS)}) "
+        f"VALUES (%s, {', '.join(['%s'] * len(COLUMNS))})",
+        COLUMNS,
+    ),
+    "postgresql": (
+        f"INSERT INTO {SEARCH_TABLE} (id, document) VALUES (%s, "
+        + " || ".join(
+            f"setweight(to_tsvector('simple', %s), '{weight}')"
+            for weight in POSTGRES_WEIGHTS.values()
+        )
+        + ")",
+        list(POSTGRES_WEIGHTS),
+    ),
+}
+
+
+def documents(apps, model_name):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    TaggedItem = apps.get_model("taggit", "TaggedItem")
+    model = apps.get_model("ecomapp", model_name)
+
+    content_type, _ = ContentType.objects.get_or_create(
+        app_label="ecomapp", model=model_name
+    )
+    tags = {}
+    for object_id, name in TaggedItem.objects.filter(
+        content_type=content_type
+    ).values_list("object_id", "tag__name"):
+        tags.setdefault(object_id, []).append(name)
+
+    items = model.objects.select_related("vendor__user").order_by("pk")
+    for item in items.iterator(chunk_size=500):
+        vendor = item.vendor
+        yield item.pk * 2 + KINDS[model_name], {
+            "title": item.title,
+            "description": item.description or "",
+            "tags": " ".join(tags.get(item.pk, [])),
+            "specifications": item.specifications or "",
+            "vendor": f"{vendor.title} {vendor.user.first_name} {vendor.user.last_name}",
+            "ingredients": getattr(item, "ingredients", None) or "",
+        }
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_INDEX:
+        return
+    insert, columns = INSERT_DOCUMENT[vendor]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+        for statement in CREATE_INDEX[vendor]:
+            cursor.execute(statement)
+        for model_name in KINDS:
+            for key, document in documents(apps, model_name):
+                cursor.execute(insert, [key] + [document[column] for column in columns])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in CREATE_INDEX:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ecomapp", "0003_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-17 22:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ecomapp", "0004_catalog_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartorder",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.1.6 on 2026-10-17 22:51
+
+from datetime import timedelta
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# updated_at of the existing orders was backfilled with the migration time, so
+# the delivered orders are scored here from their order_date instead, with the
+# same 7 day half life as ecomapp.trending, and are then marked as counted
+def seed_trending_scores(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    CartOrder = apps.get_model("ecomapp", "CartOrder")
+    CartOrderItem = apps.get_model("ecomapp", "CartOrderItem")
+    TrendingScore = apps.get_model("ecomapp", "TrendingScore")
+
+    now = django.utils.timezone.now()
+    half_life = timedelta(days=7)
+    content_types = {
+        model: ContentType.objects.get_or_create(app_label="ecomapp", model=model)[0]
+        for model in ["product", "foodproduct"]
+    }
+    items = CartOrderItem.objects.filter(order__order_status="delivered").values_list(
+        "cart_item__product_id",
+        "cart_item__food_product_id",
+        "cart_item__quantity",
+        "order__vendor__city",
+        "order__order_date",
+    )
+    scores = {}
+    for product_id, food_product_id, quantity, city, ordered_at in items.iterator():
+        if product_id:
+            key = (content_types["product"].pk, product_id)
+        elif food_product_id:
+            key = (content_types["foodproduct"].pk, food_product_id)
+        else:
+            continue
+        score = scores.setdefault(
+            key,
+            TrendingScore(content_type_id=key[0], object_id=key[1], scored_at=now),
+        )
+        score.score += quantity * 0.5 ** ((now - ordered_at) / half_life)
+        score.quantity += quantity
+        score.city = city or ""
+
+    TrendingScore.objects.bulk_create(
+        [score for score in scores.values() if score.score >= 0.01], batch_size=500
+    )
+    CartOrder.objects.filter(order_status="delivered").update(counted_in_trending=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("ecomapp", "0005_cartorder_updated_at"),
+        ("userauths", "0002_delete_sector"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendingScore",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("object_id", models.PositiveIntegerField()),
+                ("city", models.CharField(blank=True, default="", max_length=128)),
+                ("score", models.FloatField(default=0)),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                ("scored_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="cartorder",
+            name="counted_in_trending",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name="cartorder",
+            index=models.Index(
+                fields=["order_status", "counted_in_trending"],
+                name="ecomapp_car_order_s_a9e0b6_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="trendingscore",
+            name="content_type",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                to="contenttypes.contenttype",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trendingscore",
+            index=models.Index(
+                fields=["content_type", "-score"], name="ecomapp_tre_content_a9360e_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trendingscore",
+            index=models.Index(
+                fields=["content_type", "city", "-score"],
+                name="ecomapp_tre_content_5cf2d3_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="trendingscore",
+            constraint=models.UniqueConstraint(
+                fields=("content_type", "object_id"), name="unique_trending_score"
+            ),
+        ),
+        migrations.RunPython(seed_trending_scores, migrations.RunPython.noop),
+    ]
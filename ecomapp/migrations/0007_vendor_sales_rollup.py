@@ -0,0 +1,119 @@
+# Generated by Django 5.1.6 on 2026-10-17 22:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from ecomapp.sales import rebuild_vendor_sales
+
+
+def backfill_vendor_sales(apps, schema_editor):
+    rebuild_vendor_sales(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("ecomapp", "0006_trending_score"),
+        ("userauths", "0002_delete_sector"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VendorDailyOrders",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("orders", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "vendor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_orders",
+                        to="userauths.vendor",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Vendor Daily Orders",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("vendor", "date"), name="unique_vendor_daily_orders"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="VendorDailySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("object_id", models.PositiveIntegerField()),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                ("orders", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="ecomapp.category",
+                    ),
+                ),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                    ),
+                ),
+                (
+                    "vendor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_sales",
+                        to="userauths.vendor",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Vendor Daily Sales",
+                "indexes": [
+                    models.Index(
+                        fields=["vendor", "content_type", "date"],
+                        name="ecomapp_ven_vendor__e0707b_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("vendor", "date", "content_type", "object_id"),
+                        name="unique_vendor_daily_sales",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_vendor_sales, migrations.RunPython.noop),
+    ]
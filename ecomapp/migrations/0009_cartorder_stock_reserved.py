@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-17 23:11
+
+from django.db import migrations, models
+
+
+# confirmed and delivered orders already took their stock
+def mark_reserved_orders(apps, schema_editor):
+    CartOrder = apps.get_model("ecomapp", "CartOrder")
+    CartOrder.objects.filter(order_status__in=["confirmed", "delivered"]).update(
+        stock_reserved=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ecomapp", "0008_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartorder",
+            name="stock_reserved",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_reserved_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ecomapp", "0011_outgoing_email"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartitem",
+            name="is_active",
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 23:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ecomapp", "0012_cartitem_is_active"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="locked_until",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from shortuuid.django_fields import ShortUUIDField
 from django.utils.html import mark_safe
 from userauths.models import (
@@ -12,8 +12,10 @@ from userauths.models import (
 from taggit.managers import TaggableManager
 from datetime import timedelta, datetime
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, Subquery, OuterRef, IntegerField, FloatField
+from django.db.models.functions import Cast, NullIf
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.db.models import TextChoices
@@ -115,6 +117,7 @@ class Category(models.Model):
     title = models.CharField(max_length=128)
     description = models.TextField()
     image = models.ImageField(upload_to="category/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -173,6 +176,87 @@ class ProductReview(models.Model):
     def __str__(self):
         return f"{self.client.user.get_full_name()} - {self.rating} stars"
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class RatingSummary(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    target = GenericForeignKey("content_type", "object_id")
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_type", "object_id"], name="unique_rating_summary"
+            )
+        ]
+        verbose_name_plural = "Rating Summaries"
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def histogram(self):
+        return {rating: getattr(self, f"stars_{rating}") for rating in range(1, 6)}
+
+    def __str__(self):
+        return f"rating summary of {self.content_type.model} {self.object_id}"
+
+
+class TrendingScore(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    target = GenericForeignKey("content_type", "object_id")
+    city = models.CharField(max_length=128, blank=True, default="")
+    score = models.FloatField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    scored_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_type", "object_id"], name="unique_trending_score"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["content_type", "-score"]),
+            models.Index(fields=["content_type", "city", "-score"]),
+        ]
+
+    def __str__(self):
+        return f"trending score of {self.content_type.model} {self.object_id}"
+
+
+class CatalogQuerySet(models.QuerySet):
+    def with_review_stats(self):
+        summary = RatingSummary.objects.filter(
+            content_type__app_label=self.model._meta.app_label,
+            content_type__model=self.model._meta.model_name,
+            object_id=OuterRef("pk"),
+        )
+        return self.annotate(
+            average_reviews=Subquery(
+                summary.annotate(
+                    value=Cast("total", FloatField()) / NullIf("count", 0)
+                ).values("value")[:1],
+                output_field=FloatField(),
+            ),
+            total_reviews=Subquery(
+                summary.values("count")[:1], output_field=IntegerField()
+            ),
+        )
+
 
 class Product(models.Model):
     vendor = models.ForeignKey(
@@ -184,6 +268,7 @@ class Product(models.Model):
         SubCategory, on_delete=models.CASCADE, related_name="products"
     )
     image = models.ImageField(upload_to=user_directory_path)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=False)
     old_price = models.DecimalField(
         max_digits=10, decimal_places=2, null=True, blank=True
@@ -206,8 +291,11 @@ class Product(models.Model):
     reviews = GenericRelation(ProductReview)
     long_description = models.TextField(null=True, blank=True)
 
+    objects = CatalogQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Products"
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def get_tags(self):
         return self.tags.names()
@@ -220,7 +308,8 @@ class Product(models.Model):
             f"{self.title} id : {self.id} subcategory title : {self.sub_category.title}"
         )
 
-    def save(self, *args, **kwargs):
+    # also used by bulk imports, which never call save()
+    def set_discount_and_stock(self):
         if self.old_price and self.old_price > self.price:
             discount = self.old_price - self.price
             discount = discount / self.old_price * 100
@@ -235,6 +324,8 @@ class Product(models.Model):
         elif self.quantity > 0:
             self.in_stock = True
 
+    def save(self, *args, **kwargs):
+        self.set_discount_and_stock()
         super().save(*args, **kwargs)
 
 
@@ -252,6 +343,7 @@ class ProductColor(models.Model):
 
 class ProductImages(models.Model):
     image = models.ImageField(upload_to="product-images/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name="images"
     )
@@ -276,6 +368,7 @@ class FoodProduct(models.Model):
         SubCategory, on_delete=models.CASCADE, related_name="food_products"
     )
     image = models.ImageField(upload_to=user_directory_path)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=False)
     old_price = models.DecimalField(
         max_digits=10, decimal_places=2, null=True, blank=True
@@ -297,8 +390,11 @@ class FoodProduct(models.Model):
     reviews = GenericRelation(ProductReview)
     long_description = models.TextField(null=True, blank=True)
 
+    objects = CatalogQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Food Products"
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def save(self, *args, **kwargs):
         if self.old_price and self.old_price > self.price:
@@ -325,6 +421,7 @@ class FoodProduct(models.Model):
 
 class FoodProductImage(models.Model):
     image = models.ImageField(upload_to="food-product-images/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     food_product = models.ForeignKey(
         FoodProduct, on_delete=models.CASCADE, related_name="images"
     )
@@ -403,6 +500,8 @@ class CartItem(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     is_ordered = models.BooleanField(default=False)
+    # false while the product or food product is out of stock
+    is_active = models.BooleanField(default=True)
     size = models.CharField(
         max_length=20, choices=SizeChoices.choices, null=True, blank=True
     )
@@ -494,9 +593,17 @@ class CartOrder(models.Model):
     )
     is_active = models.BooleanField(default=True)
     total_payed = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    counted_in_trending = models.BooleanField(default=False)
+    stock_reserved = models.BooleanField(default=False)
 
     class Meta:
         verbose_name_plural = "Cart Orders"
+        indexes = [
+            models.Index(fields=["vendor", "order_date", "id"]),
+            models.Index(fields=["client", "order_date", "id"]),
+            models.Index(fields=["order_status", "counted_in_trending"]),
+        ]
 
     def __str__(self):
         vendor_name = (
@@ -535,6 +642,55 @@ class CartOrderItem(models.Model):
         return f"{self.cart_item.product.title if self.cart_item.product else self.cart_item.food_product.title} {self.cart_item.quantity}"
 
 
+class VendorDailySales(models.Model):
+    vendor = models.ForeignKey(
+        Vendor, on_delete=models.CASCADE, related_name="daily_sales"
+    )
+    date = models.DateField()
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    item = GenericForeignKey("content_type", "object_id")
+    category = models.ForeignKey(
+        "Category", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    quantity = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = "Vendor Daily Sales"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["vendor", "date", "content_type", "object_id"],
+                name="unique_vendor_daily_sales",
+            )
+        ]
+        indexes = [models.Index(fields=["vendor", "content_type", "date"])]
+
+    def __str__(self):
+        return f"sales of {self.content_type.model} {self.object_id} on {self.date}"
+
+
+class VendorDailyOrders(models.Model):
+    vendor = models.ForeignKey(
+        Vendor, on_delete=models.CASCADE, related_name="daily_orders"
+    )
+    date = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = "Vendor Daily Orders"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["vendor", "date"], name="unique_vendor_daily_orders"
+            )
+        ]
+
+    def __str__(self):
+        return f"orders of vendor {self.vendor_id} on {self.date}"
+
+
 # class OrderConfirmationVendor(models.Model):
 #     is_confirmed = models.BooleanField(default=False)
 #     cart_order_item = models.OneToOneField(
@@ -792,6 +948,7 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "created_at", "id"])]
 
     def __str__(self):
         return f"notification {self.id}, user : {self.user.get_full_name()}"
@@ -829,3 +986,57 @@ class ProductSize(models.Model):
 
     def __str__(self):
         return f"size : {self.size} product title : {self.product.title}"
+
+
+# one row per Idempotency-Key of a user, the response is filled in once the
+# first request succeeded and replayed to its retries until the row expires
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="idempotency_keys"
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    # a pending row past this time belongs to a request that died, a retry takes it over
+    locked_until = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_user_idempotency_key"
+            )
+        ]
+
+    def __str__(self):
+        return f"idempotency key {self.key} of user {self.user_id}"
+
+
+class EmailStatus(TextChoices):
+    PENDING = "pending", "Pending"
+    SENT = "sent", "Sent"
+    FAILED = "failed", "Failed"
+
+
+# emails are written here in the transaction that produced them and sent later
+# by the outbox worker, a failed send is retried after next_attempt_at
+class OutgoingEmail(models.Model):
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.EmailField()
+    to = models.EmailField()
+    status = models.CharField(
+        max_length=16, choices=EmailStatus.choices, default=EmailStatus.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"email {self.id} to {self.to} : {self.status}"
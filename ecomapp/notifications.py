@@ -0,0 +1,48 @@
+from itertools import islice
+from django.contrib.contenttypes.models import ContentType
+from userauths.models import User
+from .models import Notification
+from .outbox import outgoing_email, queue_emails
+
+NOTIFICATION_BATCH_SIZE = 500
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def notification(user_id, message, target, notification_type):
+    return Notification(
+        user_id=user_id,
+        message=message,
+        content_type=ContentType.objects.get_for_model(target),
+        object_id=target.pk,
+        notification_type=notification_type,
+    )
+
+
+def notifications_for(user_ids, message, target, notification_type):
+    for user_id in user_ids:
+        yield notification(user_id, message, target, notification_type)
+
+
+def notification_email(notification, user):
+    return outgoing_email(
+        user.email, f"Hello, {user.get_full_name()}", notification.message
+    )
+
+
+# rows are inserted in chunks with bulk_create, which skips the post_save
+# receiver, the emails of each chunk go to the outbox in the same transaction
+def fan_out(notifications, batch_size=NOTIFICATION_BATCH_SIZE):
+    count = 0
+    for chunk in chunked(notifications, batch_size):
+        created = Notification.objects.bulk_create(chunk)
+        users = User.objects.only("first_name", "last_name", "email").in_bulk(
+            {row.user_id for row in created}
+        )
+        queue_emails([notification_email(row, users[row.user_id]) for row in created])
+        count += len(created)
+    return count
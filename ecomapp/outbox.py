@@ -0,0 +1,114 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import EmailStatus, OutgoingEmail
+
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_BACKOFF = timedelta(minutes=1)
+EMAIL_RETRY_BACKOFF_MAX = timedelta(hours=1)
+# a claimed batch is left alone this long, a crashed worker's emails come back
+EMAIL_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def outgoing_email(to, subject, body, from_email=None):
+    return OutgoingEmail(
+        to=to,
+        subject=subject[:255],
+        body=body,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+    )
+
+
+# the rows are part of the caller's transaction, the worker only starts once
+# it committed so a rolled back request never mails anyone
+def queue_emails(emails):
+    from .tasks import send_outgoing_emails
+
+    emails = [email for email in emails if email.to]
+    if not emails:
+        return []
+    emails = OutgoingEmail.objects.bulk_create(emails)
+    transaction.on_commit(lambda: send_outgoing_emails.delay())
+    return emails
+
+
+def retry_delay(attempts):
+    return min(EMAIL_RETRY_BACKOFF * 2 ** (attempts - 1), EMAIL_RETRY_BACKOFF_MAX)
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        email_ids = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailStatus.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        OutgoingEmail.objects.filter(pk__in=email_ids).update(
+            next_attempt_at=now + EMAIL_CLAIM_TIMEOUT
+        )
+    return list(OutgoingEmail.objects.filter(pk__in=email_ids).order_by("pk"))
+
+
+def record_failures(emails, error):
+    now = timezone.now()
+    for email in emails:
+        email.attempts += 1
+        email.last_error = str(error)
+        if email.attempts >= EMAIL_MAX_ATTEMPTS:
+            email.status = EmailStatus.FAILED
+        else:
+            email.next_attempt_at = now + retry_delay(email.attempts)
+    OutgoingEmail.objects.bulk_update(
+        emails, ["attempts", "last_error", "status", "next_attempt_at"]
+    )
+
+
+def email_message(email, connection):
+    return EmailMessage(
+        email.subject,
+        email.body,
+        email.from_email,
+        [email.to],
+        connection=connection,
+    )
+
+
+# one connection of the configured backend is opened for the whole batch, a
+# message that fails is retried later with a growing delay and the connection
+# is opened again for the rest, a connection that cannot be opened counts as a
+# failed attempt of every message it did not get to
+def drain_outbox(batch_size=EMAIL_OUTBOX_BATCH_SIZE):
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0
+
+    sent, attempted = [], set()
+    try:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        try:
+            for email in emails:
+                attempted.add(email.pk)
+                try:
+                    connection.send_messages([email_message(email, connection)])
+                except Exception as error:
+                    record_failures([email], error)
+                    connection.close()
+                    connection.open()
+                else:
+                    sent.append(email.pk)
+        finally:
+            connection.close()
+    except Exception as error:
+        record_failures([email for email in emails if email.pk not in attempted], error)
+        raise
+    finally:
+        OutgoingEmail.objects.filter(pk__in=sent).update(
+            status=EmailStatus.SENT, sent_at=timezone.now(), last_error=""
+        )
+    return len(emails)
@@ -0,0 +1,148 @@
+import time
+from hashlib import md5
+from urllib.parse import urlencode
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from userauths.models import User, Vendor, Client
+from .models import (
+    Sector,
+    Category,
+    SubCategory,
+    SubscriptionPlan,
+    Testimonial,
+    Product,
+    ProductImages,
+    ProductColor,
+    ProductSize,
+    ProductReview,
+    FoodProduct,
+    FoodProductImage,
+)
+
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+
+CATALOG_DEPENDENCIES = [ProductReview, SubCategory, Category, Sector, Vendor, Client]
+
+# every cached view belongs to one group, a write on any of its models drops the group
+CACHE_GROUP_MODELS = {
+    "sector": [Sector],
+    "category": [Category, Sector],
+    "sub_category": [SubCategory, Category, Sector],
+    "subscription_plan": [SubscriptionPlan],
+    "testimonial": [Testimonial, User],
+    "product": [Product, ProductImages, ProductColor, ProductSize, User]
+    + CATALOG_DEPENDENCIES,
+    "food_product": [FoodProduct, FoodProductImage, User] + CATALOG_DEPENDENCIES,
+}
+
+MODEL_CACHE_GROUPS = {}
+for group, group_models in CACHE_GROUP_MODELS.items():
+    for model in group_models:
+        MODEL_CACHE_GROUPS.setdefault(model, []).append(group)
+
+
+def group_version(group):
+    return cache.get_or_set(f"response_cache_version:{group}", time.time_ns, None)
+
+
+def bump_group_versions(groups):
+    for group in groups:
+        cache.set(f"response_cache_version:{group}", time.time_ns(), None)
+
+
+# the bump waits for the writer to commit, a reader in between would otherwise
+# cache the old rows under the new version
+def invalidate_response_cache(model):
+    groups = MODEL_CACHE_GROUPS.get(model, [])
+    if groups:
+        transaction.on_commit(lambda: bump_group_versions(groups))
+
+
+def response_cache_key(group, request):
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+        if value != ""
+    )
+    raw = "|".join(
+        [
+            request.get_host(),
+            request.path,
+            request.accepted_renderer.format,
+            urlencode(params),
+        ]
+    )
+    digest = md5(raw.encode()).hexdigest()
+    return f"response_cache:{group}:{group_version(group)}:{digest}"
+
+
+def record_cache_access(group, hit):
+    key = f"response_cache_stats:{group}:{'hits' if hit else 'misses'}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_response_cache_stats():
+    stats = {}
+    for group in CACHE_GROUP_MODELS:
+        hits = cache.get(f"response_cache_stats:{group}:hits", 0)
+        misses = cache.get(f"response_cache_stats:{group}:misses", 0)
+        total = hits + misses
+        stats[group] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else None,
+        }
+    return stats
+
+
+def reset_response_cache_stats():
+    cache.delete_many(
+        [
+            f"response_cache_stats:{group}:{kind}"
+            for group in CACHE_GROUP_MODELS
+            for kind in ["hits", "misses"]
+        ]
+    )
+
+
+class AnonymousCacheMixin:
+    cache_group = None
+    cache_timeout = RESPONSE_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+
+        key = response_cache_key(self.cache_group, request)
+        cached = cache.get(key)
+        if cached is not None:
+            record_cache_access(self.cache_group, hit=True)
+            content, headers = cached
+            response = HttpResponse(content, headers=headers)
+            response["X-Cache"] = "HIT"
+            return response
+
+        record_cache_access(self.cache_group, hit=False)
+        response = handler(request, *args, **kwargs)
+        response["X-Cache"] = "MISS"
+        if response.status_code == 200:
+            response.add_post_render_callback(
+                lambda rendered: cache.set(
+                    key,
+                    (rendered.content, dict(rendered.items())),
+                    self.cache_timeout,
+                )
+            )
+        return response
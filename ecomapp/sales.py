@@ -0,0 +1,237 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.apps import apps as global_apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, F, Sum
+from django.db.models.functions import (
+    Coalesce,
+    TruncDate,
+    TruncDay,
+    TruncWeek,
+    TruncMonth,
+)
+from django.utils import timezone
+from .models import VendorDailySales, VendorDailyOrders, CartOrderItem
+
+ITEM_SOURCES = {
+    "product": "cart_item__product",
+    "foodproduct": "cart_item__food_product",
+}
+
+SALES_GRANULARITIES = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+
+
+def add_to_rollup(model, lookup, defaults, sign, **values):
+    if sign > 0:
+        row, _ = model.objects.get_or_create(**lookup, defaults=defaults)
+        rows = model.objects.filter(pk=row.pk)
+    else:
+        rows = model.objects.filter(**lookup)
+    rows.update(**{field: F(field) + sign * value for field, value in values.items()})
+    # a day the order was taken back from is dropped once it has no order left,
+    # the same rows rebuild_vendor_sales would produce
+    if sign < 0:
+        rows.filter(orders=0).delete()
+
+
+# sign is -1 when a delivered order leaves the delivered status, its quantities
+# and revenue are taken back from the day it was counted on
+def record_order_sales(order, sign=1):
+    if not order.vendor_id:
+        return
+
+    day = timezone.localdate(order.order_date)
+    add_to_rollup(
+        VendorDailyOrders,
+        {"vendor_id": order.vendor_id, "date": day},
+        {},
+        sign,
+        orders=1,
+        revenue=order.total_payed,
+    )
+
+    for model_name, path in ITEM_SOURCES.items():
+        content_type = ContentType.objects.get_by_natural_key("ecomapp", model_name)
+        items = (
+            CartOrderItem.objects.filter(order=order, **{f"{path}__isnull": False})
+            .values(
+                object_id=F(f"{path}_id"),
+                category_id=F(f"{path}__sub_category__category_id"),
+            )
+            .annotate(quantity=Sum("cart_item__quantity"), revenue=Sum("total_payed"))
+        )
+        for item in items:
+            add_to_rollup(
+                VendorDailySales,
+                {
+                    "vendor_id": order.vendor_id,
+                    "date": day,
+                    "content_type": content_type,
+                    "object_id": item["object_id"],
+                },
+                {"category_id": item["category_id"]},
+                sign,
+                quantity=item["quantity"],
+                orders=1,
+                revenue=item["revenue"],
+            )
+
+
+# apps is the migration state when called from a migration
+def rebuild_vendor_sales(vendor_ids=None, apps=global_apps, batch_size=500):
+    VendorDailySales = apps.get_model("ecomapp", "VendorDailySales")
+    VendorDailyOrders = apps.get_model("ecomapp", "VendorDailyOrders")
+    CartOrderItem = apps.get_model("ecomapp", "CartOrderItem")
+    CartOrder = apps.get_model("ecomapp", "CartOrder")
+    ContentType = apps.get_model("contenttypes", "ContentType")
+
+    orders = CartOrder.objects.filter(order_status="delivered", vendor__isnull=False)
+    order_items = CartOrderItem.objects.filter(order__order_status="delivered")
+    daily_sales = VendorDailySales.objects.all()
+    daily_orders = VendorDailyOrders.objects.all()
+    if vendor_ids is not None:
+        orders = orders.filter(vendor_id__in=vendor_ids)
+        order_items = order_items.filter(order__vendor_id__in=vendor_ids)
+        daily_sales = daily_sales.filter(vendor_id__in=vendor_ids)
+        daily_orders = daily_orders.filter(vendor_id__in=vendor_ids)
+    daily_sales.delete()
+    daily_orders.delete()
+
+    VendorDailyOrders.objects.bulk_create(
+        [
+            VendorDailyOrders(**row)
+            for row in orders.annotate(date=TruncDate("order_date"))
+            .values("vendor_id", "date")
+            .annotate(
+                orders=Count("id"), revenue=Coalesce(Sum("total_payed"), Decimal(0))
+            )
+            .order_by()
+        ],
+        batch_size=batch_size,
+    )
+
+    rows = 0
+    for model_name, path in ITEM_SOURCES.items():
+        content_type, _ = ContentType.objects.get_or_create(
+            app_label="ecomapp", model=model_name
+        )
+        grouped = (
+            order_items.filter(**{f"{path}__isnull": False})
+            .annotate(date=TruncDate("order__order_date"))
+            .values(
+                "date",
+                vendor_id=F("order__vendor_id"),
+                object_id=F(f"{path}_id"),
+                category_id=F(f"{path}__sub_category__category_id"),
+            )
+            .annotate(
+                quantity=Sum("cart_item__quantity"),
+                orders=Count("order_id", distinct=True),
+                revenue=Sum("total_payed"),
+            )
+            .order_by()
+        )
+        created = VendorDailySales.objects.bulk_create(
+            [
+                VendorDailySales(content_type_id=content_type.pk, **row)
+                for row in grouped.iterator(chunk_size=batch_size)
+            ],
+            batch_size=batch_size,
+        )
+        rows += len(created)
+    return rows
+
+
+def get_order_totals(vendor, start, end=None):
+    rows = VendorDailyOrders.objects.filter(vendor=vendor, date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lt=end)
+    return rows.aggregate(
+        total_delivered_orders=Coalesce(Sum("orders"), 0),
+        total_earned=Sum("revenue"),
+    )
+
+
+def item_sales(vendor, model, start):
+    return VendorDailySales.objects.filter(
+        vendor=vendor,
+        content_type=ContentType.objects.get_for_model(model),
+        date__gte=start,
+    )
+
+
+def get_top_items(vendor, model, start, limit):
+    rows = list(
+        item_sales(vendor, model, start)
+        .values("object_id")
+        .annotate(
+            total_quantity_sold=Sum("quantity"),
+            total_orders=Sum("orders"),
+            total_earned=Sum("revenue"),
+        )
+        .order_by("-total_quantity_sold")[:limit]
+    )
+    items = model.objects.in_bulk([row["object_id"] for row in rows])
+    top_items = []
+    for row in rows:
+        item = items.get(row.pop("object_id"))
+        if item is None:
+            continue
+        for key, value in row.items():
+            setattr(item, key, value)
+        top_items.append(item)
+    return top_items
+
+
+def get_category_sales(vendor, model, start):
+    return list(
+        item_sales(vendor, model, start)
+        .filter(category__isnull=False)
+        .values("category_id", title=F("category__title"))
+        .annotate(total_sold=Sum("quantity"), total_earned=Sum("revenue"))
+        .order_by("-total_sold")
+    )
+
+
+def bucket_start(day, granularity):
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, granularity):
+    if granularity == "week":
+        return day + timedelta(days=7)
+    if granularity == "month":
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+# one row per bucket between start and end, empty buckets included, so the
+# payload grows with the window and not with the number of orders
+def get_sales_over_time(vendor, start, end, granularity="day", fee=0):
+    rows = (
+        VendorDailyOrders.objects.filter(vendor=vendor, date__gte=start, date__lte=end)
+        .annotate(bucket=SALES_GRANULARITIES[granularity]("date"))
+        .values("bucket")
+        .annotate(orders=Sum("orders"), total_payed=Sum("revenue"))
+        .order_by("bucket")
+    )
+    buckets = {row["bucket"]: row for row in rows}
+
+    sales = []
+    day = bucket_start(start, granularity)
+    while day <= end:
+        row = buckets.get(day, {"orders": 0, "total_payed": Decimal(0)})
+        sales.append(
+            {
+                "date": day,
+                "orders": row["orders"],
+                "total_payed": row["total_payed"],
+                "total_earned": row["total_payed"] - row["orders"] * fee,
+            }
+        )
+        day = next_bucket(day, granularity)
+    return sales
@@ -0,0 +1,243 @@
+import re
+from itertools import islice
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from .models import Product, FoodProduct
+
+SEARCH_TABLE = "ecomapp_catalogsearch"
+
+# every indexed row is keyed by object_id * 2 + kind so deletes hit the primary key
+KINDS = {"product": 0, "foodproduct": 1}
+
+COLUMNS = ["title", "description", "tags", "specifications", "vendor", "ingredients"]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def search_key(instance):
+    return instance.pk * 2 + KINDS[instance._meta.model_name]
+
+
+def search_terms(query):
+    return re.findall(r"\w+", query.lower())[:10]
+
+
+def build_document(instance):
+    vendor = instance.vendor
+    return {
+        "title": instance.title,
+        "description": instance.description or "",
+        "tags": " ".join(tag.name for tag in instance.tags.all()),
+        "specifications": instance.specifications or "",
+        "vendor": f"{vendor.title} {vendor.user.first_name} {vendor.user.last_name}",
+        "ingredients": getattr(instance, "ingredients", None) or "",
+    }
+
+
+class SQLiteSearchBackend:
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"{', '.join(COLUMNS)}, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index(self, cursor, key, document):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [key])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(COLUMNS)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(COLUMNS))})",
+            [key] + [document[column] for column in COLUMNS],
+        )
+
+    def index_many(self, cursor, rows):
+        cursor.executemany(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [[key] for key, _ in rows]
+        )
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(COLUMNS)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(COLUMNS))})",
+            [
+                [key] + [document[column] for column in COLUMNS]
+                for key, document in rows
+            ],
+        )
+
+    def remove(self, cursor, key):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [key])
+
+    def match(self, terms):
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def matching_ids(self, terms, kind):
+        return (
+            f"SELECT rowid / 2 FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid %% 2 = %s",
+            [self.match(terms), kind],
+        )
+
+    # bm25 is lower for better matches, it is negated so both backends rank desc
+    def rank(self, terms, kind, pk_column):
+        return (
+            f"(SELECT -bm25({SEARCH_TABLE}, 10.0, 2.0, 5.0, 1.0, 3.0, 2.0) "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"AND rowid = {pk_column} * 2 + %s)",
+            [self.match(terms), kind],
+        )
+
+
+class PostgresSearchBackend:
+    weights = {
+        "title": "A",
+        "tags": "A",
+        "vendor": "B",
+        "description": "B",
+        "ingredients": "C",
+        "specifications": "D",
+    }
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            "(id bigint PRIMARY KEY, document tsvector NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document "
+            f"ON {SEARCH_TABLE} USING GIN (document)"
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def upsert(self):
+        vector = " || ".join(
+            f"setweight(to_tsvector('simple', %s), '{weight}')"
+            for weight in self.weights.values()
+        )
+        return (
+            f"INSERT INTO {SEARCH_TABLE} (id, document) VALUES (%s, {vector}) "
+            "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document"
+        )
+
+    def index(self, cursor, key, document):
+        cursor.execute(
+            self.upsert(), [key] + [document[column] for column in self.weights]
+        )
+
+    def index_many(self, cursor, rows):
+        cursor.executemany(
+            self.upsert(),
+            [
+                [key] + [document[column] for column in self.weights]
+                for key, document in rows
+            ],
+        )
+
+    def remove(self, cursor, key):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE id = %s", [key])
+
+    def match(self, terms):
+        return " & ".join(f"{term}:*" for term in terms)
+
+    def matching_ids(self, terms, kind):
+        return (
+            f"SELECT id / 2 FROM {SEARCH_TABLE} "
+            "WHERE document @@ to_tsquery('simple', %s) AND id %% 2 = %s",
+            [self.match(terms), kind],
+        )
+
+    def rank(self, terms, kind, pk_column):
+        return (
+            f"(SELECT ts_rank(document, to_tsquery('simple', %s)) "
+            f"FROM {SEARCH_TABLE} WHERE id = {pk_column} * 2 + %s)",
+            [self.match(terms), kind],
+        )
+
+
+BACKENDS = {"sqlite": SQLiteSearchBackend, "postgresql": PostgresSearchBackend}
+
+
+def get_search_backend(db_connection=None):
+    backend_class = BACKENDS.get((db_connection or connection).vendor)
+    return backend_class() if backend_class else None
+
+
+def index_catalog_item(instance):
+    backend = get_search_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.index(cursor, search_key(instance), build_document(instance))
+
+
+# items are written batch_size rows per statement batch, items can be an iterator
+def index_catalog_items(items, batch_size=500):
+    backend = get_search_backend()
+    if backend is None:
+        return 0
+    indexed = 0
+    with connection.cursor() as cursor:
+        for chunk in chunked(items, batch_size):
+            backend.index_many(
+                cursor, [(search_key(item), build_document(item)) for item in chunk]
+            )
+            indexed += len(chunk)
+    return indexed
+
+
+def remove_catalog_item(instance):
+    backend = get_search_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, search_key(instance))
+
+
+# the match stays a subquery of the catalog queryset, so counts and pagination
+# see every matching row, the rank is a correlated subquery to order by
+def search_catalog(model, query):
+    backend = get_search_backend()
+    terms = search_terms(query)
+    if backend is None or not terms:
+        return None
+    kind = KINDS[model._meta.model_name]
+    pk_column = ".".join(
+        connection.ops.quote_name(name)
+        for name in [model._meta.db_table, model._meta.pk.column]
+    )
+    return (
+        RawSQL(*backend.matching_ids(terms, kind)),
+        RawSQL(*backend.rank(terms, kind, pk_column), output_field=FloatField()),
+    )
+
+
+def rebuild_search_index(
+    models=(Product, FoodProduct), db_connection=None, batch_size=500
+):
+    db_connection = db_connection or connection
+    backend = get_search_backend(db_connection)
+    if backend is None:
+        return 0
+
+    indexed = 0
+    with db_connection.cursor() as cursor:
+        backend.drop_index(cursor)
+        backend.create_index(cursor)
+        for model in models:
+            items = (
+                model.objects.select_related("vendor__user")
+                .prefetch_related("tags")
+                .order_by("pk")
+            )
+            for item in items.iterator(chunk_size=batch_size):
+                backend.index(cursor, search_key(item), build_document(item))
+                indexed += 1
+    return indexed
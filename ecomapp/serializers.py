@@ -6,6 +6,11 @@ from taggit.serializers import TaggitSerializer, TagListSerializerField
 from .helpers import is_valid_client_and_order
 from userauths.serializers import VendorSerializer, UserSerializer, ClientSerializer
 from django.db.models import Avg
+from django.utils.functional import cached_property
+from rest_framework.permissions import SAFE_METHODS
+from django.core.files.storage import default_storage
+from .images import image_srcset
+from .transitions import transition_order
 
 
 class StockAlertChoices(models.TextChoices):
@@ -56,12 +61,21 @@ class SectorSerializer(serializers.ModelSerializer):
 
 class CategorySerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     sector = serializers.PrimaryKeyRelatedField(queryset=Sector.objects.all())
 
     class Meta:
         model = Category
-        fields = ["id", "sector", "title", "description", "image", "image_url"]
-        read_only_fields = ["id", "image_url"]
+        fields = [
+            "id",
+            "sector",
+            "title",
+            "description",
+            "image",
+            "image_url",
+            "image_srcset",
+        ]
+        read_only_fields = ["id", "image_url", "image_srcset"]
 
     def create(self, validated_data):
         user = self.context["request"].user
@@ -82,6 +96,9 @@ class CategorySerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         return request.build_absolute_uri(obj.image.url) if obj.image else None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj, self.context.get("request"))
+
 
 class SubCategorySerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
@@ -133,15 +150,19 @@ class SubCategorySerializer(serializers.ModelSerializer):
 
 class ProductImagesSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImages
-        fields = ["id", "image", "image_url"]
+        fields = ["id", "image", "image_url", "image_srcset"]
 
     def get_image_url(self, obj):
         request = self.context.get("request")
         return request.build_absolute_uri(obj.image.url) if obj.image else None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj, self.context.get("request"))
+
     def validate(self, data):
         user = self.context["request"].user
         if not hasattr(user, "vendor"):
@@ -161,15 +182,19 @@ class ProductImagesSerializer(serializers.ModelSerializer):
 
 class FoodProductImagesSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = FoodProductImage
-        fields = ["id", "image", "image_url"]
+        fields = ["id", "image", "image_url", "image_srcset"]
 
     def get_image_url(self, obj):
         request = self.context.get("request")
         return request.build_absolute_uri(obj.image.url) if obj.image else None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj, self.context.get("request"))
+
     def validate(self, data):
         user = self.context["request"].user
         if not hasattr(user, "vendor"):
@@ -288,7 +313,63 @@ class ProductSizeSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class ProductSerializer(TaggitSerializer, serializers.ModelSerializer):
+def split_query_param(request, name):
+    values = request.query_params.get(name, "").split(",")
+    return {value.strip() for value in values if value.strip()}
+
+
+# ?fields=id,title picks the fields, ?mode=card picks the card_fields and
+# ?expand=vendor,sub_category embeds those relations instead of their ids
+class CatalogFieldsMixin:
+    card_fields = []
+    expandable_fields = ["vendor", "sub_category"]
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        fields = split_query_param(request, "fields")
+        if not fields and request.query_params.get("mode") == "card":
+            fields = set(cls.card_fields)
+        if not fields:
+            return None
+        return fields | split_query_param(request, "expand")
+
+    @cached_property
+    def requested_fields(self):
+        return self.get_requested_fields(self.context.get("request"))
+
+    @cached_property
+    def expanded_fields(self):
+        if self.requested_fields is None:
+            return set(self.expandable_fields)
+        request = self.context.get("request")
+        return split_query_param(request, "expand") & set(self.expandable_fields)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.requested_fields is None:
+            return fields
+        if "vendor" not in self.expanded_fields:
+            fields["vendor"] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return {
+            name: field
+            for name, field in fields.items()
+            if name in self.requested_fields
+        }
+
+    def to_representation(self, instance):
+        rep = super().to_representation(instance)
+        if "sub_category" in rep and "sub_category" in self.expanded_fields:
+            rep["sub_category"] = SubCategorySerializer(
+                instance.sub_category, context=self.context
+            ).data
+        return rep
+
+
+class ProductSerializer(
+    CatalogFieldsMixin, TaggitSerializer, serializers.ModelSerializer
+):
     sizes = ProductSizeSerializer(many=True, read_only=True)
     colors = serializers.ListField(
         child=serializers.ChoiceField(choices=ColorChoices.choices),
@@ -302,6 +383,7 @@ class ProductSerializer(TaggitSerializer, serializers.ModelSerializer):
         child=serializers.ImageField(), write_only=True, required=False
     )
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     tags = TagListSerializerField()
     vendor = VendorSerializer(read_only=True)
     sub_category = serializers.PrimaryKeyRelatedField(
@@ -310,6 +392,20 @@ class ProductSerializer(TaggitSerializer, serializers.ModelSerializer):
     average_reviews = serializers.SerializerMethodField()
     total_reviews = serializers.SerializerMethodField()
     sector = serializers.SerializerMethodField(read_only=True)
+    card_fields = [
+        "id",
+        "title",
+        "price",
+        "old_price",
+        "discount_percentage",
+        "image_url",
+        "image_srcset",
+        "in_stock",
+        "average_reviews",
+        "total_reviews",
+        "vendor",
+        "sector",
+    ]
 
     class Meta:
         model = Product
@@ -324,6 +420,7 @@ class ProductSerializer(TaggitSerializer, serializers.ModelSerializer):
             "is_digital",
             "image",
             "image_url",
+            "image_srcset",
             "specifications",
             "is_active",
             "in_stock",
@@ -353,38 +450,39 @@ class ProductSerializer(TaggitSerializer, serializers.ModelSerializer):
             "color_list",
             "images",
             "image_url",
+            "image_srcset",
             "reviews",
             "created_at",
             "updated_at",
             "sizes",
         ]
 
-    def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        rep["sub_category"] = SubCategorySerializer(
-            instance.sub_category, context=self.context
-        ).data
-        return rep
-
     def get_sector(self, obj):
         sector = obj.sub_category.category.sector.title
         if sector:
             return sector
 
     def get_average_reviews(self, obj):
+        if hasattr(obj, "average_reviews"):
+            return round(obj.average_reviews or 0.0)
         average_rating = obj.reviews.all().aggregate(Avg("rating"))["rating__avg"]
         return round(average_rating or 0.0)
 
     def get_total_reviews(self, obj):
+        if hasattr(obj, "total_reviews"):
+            return obj.total_reviews or 0
         return obj.reviews.all().count()
 
     def get_color_list(self, obj):
-        return list(obj.colors.values_list("color", flat=True))
+        return [product_color.color for product_color in obj.colors.all()]
 
     def get_image_url(self, obj):
         request = self.context.get("request")
         return request.build_absolute_uri(obj.image.url) if obj.image else None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj, self.context.get("request"))
+
     def validate_vendor(self, value):
         user = self.context["request"].user
         if not hasattr(user, "vendor"):
@@ -424,13 +522,16 @@ class ProductSerializer(TaggitSerializer, serializers.ModelSerializer):
         return list(obj.tags.names())
 
 
-class FoodProductSerializer(TaggitSerializer, serializers.ModelSerializer):
+class FoodProductSerializer(
+    CatalogFieldsMixin, TaggitSerializer, serializers.ModelSerializer
+):
     reviews = ProductReviewSerializer(many=True, read_only=True)
     images = FoodProductImagesSerializer(many=True, read_only=True)
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(), write_only=True, required=False
     )
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     tags = TagListSerializerField()
     vendor = VendorSerializer(read_only=True)
     sub_category = serializers.PrimaryKeyRelatedField(
@@ -439,6 +540,23 @@ class FoodProductSerializer(TaggitSerializer, serializers.ModelSerializer):
     average_reviews = serializers.SerializerMethodField()
     total_reviews = serializers.SerializerMethodField()
     sector = serializers.SerializerMethodField(read_only=True)
+    card_fields = [
+        "id",
+        "title",
+        "price",
+        "old_price",
+        "discount_percentage",
+        "image_url",
+        "image_srcset",
+        "in_stock",
+        "average_reviews",
+        "total_reviews",
+        "vendor",
+        "sector",
+        "is_vegan",
+        "calories",
+        "weight_in_grams",
+    ]
 
     class Meta:
         model = FoodProduct
@@ -452,6 +570,7 @@ class FoodProductSerializer(TaggitSerializer, serializers.ModelSerializer):
             "tags",
             "image",
             "image_url",
+            "image_srcset",
             "specifications",
             "is_active",
             "in_stock",
@@ -477,6 +596,7 @@ class FoodProductSerializer(TaggitSerializer, serializers.ModelSerializer):
         read_only_fields = [
             "id",
             "image_url",
+            "image_srcset",
             "discount_percentage",
             "details",
             "images",
@@ -485,29 +605,29 @@ class FoodProductSerializer(TaggitSerializer, serializers.ModelSerializer):
             "expired_at",
         ]
 
-    def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        rep["sub_category"] = SubCategorySerializer(
-            instance.sub_category, context=self.context
-        ).data
-        return rep
-
     def get_sector(self, obj):
         sector = obj.sub_category.category.sector.title
         if sector:
             return sector
 
     def get_average_reviews(self, obj):
+        if hasattr(obj, "average_reviews"):
+            return round(obj.average_reviews or 0.0)
         average_reviews = obj.reviews.all().aggregate(Avg("rating"))["rating__avg"]
         return round(average_reviews or 0.0)
 
     def get_total_reviews(self, obj):
+        if hasattr(obj, "total_reviews"):
+            return obj.total_reviews or 0
         return obj.reviews.all().count()
 
     def get_image_url(self, obj):
         request = self.context.get("request")
         return request.build_absolute_uri(obj.image.url) if obj.image else None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj, self.context.get("request"))
+
     def create(self, validated_data):
         user = self.context["request"].user
         if not hasattr(user, "vendor"):
@@ -609,7 +729,7 @@ class CartOrderSerializer(serializers.ModelSerializer):
             if instance.order_status == "confirmed":
                 raise serializers.ValidationError("you cannot update a confirmed order")
 
-        return super().update(instance, validated_data)
+        return transition_order(instance, **validated_data)
 
     # def validate(self, data):
     #     user = self.context["request"].user
@@ -1265,8 +1385,7 @@ class ClaimOrderSerializer(serializers.ModelSerializer):
                     and not instance.order.order_status == "delivered"
                     and instance.is_confirmed_by_vendor
                 ):
-                    instance.order.order_status = "delivered"
-                    instance.order.save(update_fields=["order_status"])
+                    transition_order(instance.order, order_status="delivered")
 
         if hasattr(user, "vendor"):
             order_vendor = instance.order.vendor
@@ -1453,16 +1572,11 @@ class TopProductSerializer(serializers.ModelSerializer):
         ]
 
 
-class SalesOverTimeSerializer(serializers.ModelSerializer):
-    total_earned = serializers.SerializerMethodField()
-
-    def get_total_earned(self, obj):
-
-        return getattr(obj, "total_earned", None)
-
-    class Meta:
-        model = CartOrder
-        fields = ["id", "order_date", "total_payed", "total_earned"]
+class SalesOverTimeSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    orders = serializers.IntegerField()
+    total_payed = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total_earned = serializers.DecimalField(max_digits=12, decimal_places=2)
 
 
 class TopFoodProductsSerializer(serializers.ModelSerializer):
@@ -1488,9 +1602,13 @@ class StockAlertSerializer(serializers.ModelSerializer):
     is_alert = serializers.SerializerMethodField()
 
     average_sales = serializers.FloatField()
+    smoothed_demand = serializers.FloatField()
     days_left = serializers.FloatField()
+    reorder_point = serializers.IntegerField()
+    needs_reorder = serializers.BooleanField()
     total_sold = serializers.IntegerField()
     last_order_date = serializers.DateTimeField()
+    size_forecasts = serializers.ListField(child=serializers.DictField())
 
     class Meta:
         model = Product
@@ -1503,12 +1621,19 @@ class StockAlertSerializer(serializers.ModelSerializer):
             "stock_status",
             "total_sold",
             "average_sales",
+            "smoothed_demand",
             "days_left",
+            "reorder_point",
+            "needs_reorder",
             "last_order_date",
             "is_alert",
+            "size_forecasts",
         ]
 
+    # an untracked quantity has no status and never raises an alert
     def get_stock_status(self, obj):
+        if obj.quantity is None:
+            return None
         if obj.quantity == 0:
             return StockAlertChoices.OUT_OF_STOCK
         elif obj.quantity <= 5:
@@ -1518,4 +1643,49 @@ class StockAlertSerializer(serializers.ModelSerializer):
         return StockAlertChoices.HEALTHY
 
     def get_is_alert(self, obj):
+        if obj.quantity is None:
+            return None
         return obj.quantity <= 10 and obj.average_sales > 1
+
+
+class FoodStockAlertSerializer(StockAlertSerializer):
+    size_forecasts = None
+
+    class Meta:
+        model = FoodProduct
+        fields = [
+            field
+            for field in StockAlertSerializer.Meta.fields
+            if field != "size_forecasts"
+        ]
+
+
+class CatalogFeedSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    kind = serializers.CharField()
+    title = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    old_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, allow_null=True
+    )
+    discount_percentage = serializers.IntegerField()
+    image_url = serializers.SerializerMethodField()
+    in_stock = serializers.BooleanField()
+    vendor = serializers.IntegerField(source="vendor_id")
+    sub_category = serializers.IntegerField(source="sub_category_id")
+    city = serializers.CharField(allow_null=True)
+    average_reviews = serializers.SerializerMethodField()
+    total_reviews = serializers.SerializerMethodField()
+    created_at = serializers.DateTimeField()
+
+    def get_image_url(self, obj):
+        request = self.context.get("request")
+        if not obj["image"]:
+            return None
+        return request.build_absolute_uri(default_storage.url(obj["image"]))
+
+    def get_average_reviews(self, obj):
+        return round(obj["average_reviews"] or 0.0)
+
+    def get_total_reviews(self, obj):
+        return obj["total_reviews"] or 0
@@ -0,0 +1,92 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+from django.utils import timezone
+from userauths.models import Vendor
+from .models import RatingSummary
+
+STAR_FIELDS = [f"stars_{rating}" for rating in range(1, 6)]
+
+
+def get_rating_summary(obj):
+    return RatingSummary.objects.filter(
+        content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk
+    ).first()
+
+
+# fills the cached rating_summary of a page of vendors with one query
+def prefetch_rating_summaries(objs):
+    objs = list(objs)
+    if not objs:
+        return objs
+    summaries = {
+        summary.object_id: summary
+        for summary in RatingSummary.objects.filter(
+            content_type=ContentType.objects.get_for_model(objs[0]),
+            object_id__in=[obj.pk for obj in objs],
+        )
+    }
+    for obj in objs:
+        obj.__dict__["rating_summary"] = summaries.get(obj.pk)
+    return objs
+
+
+def get_item_vendor_id(content_type, object_id):
+    model_class = content_type.model_class()
+    if model_class is None or not hasattr(model_class, "vendor"):
+        return None
+    return (
+        model_class.objects.filter(pk=object_id)
+        .values_list("vendor_id", flat=True)
+        .first()
+    )
+
+
+def touch_updated_at(model, pk):
+    model.objects.filter(pk=pk).update(updated_at=timezone.now())
+
+
+def update_rating_summary(content_type, object_id, delta, changes):
+    summaries = RatingSummary.objects.filter(
+        content_type=content_type, object_id=object_id
+    )
+    if delta > 0:
+        RatingSummary.objects.get_or_create(
+            content_type=content_type, object_id=object_id
+        )
+    return summaries.update(
+        updated_at=timezone.now(),
+        **{field: F(field) + value for field, value in changes.items()},
+    )
+
+
+def apply_rating(content_type_id, object_id, rating, delta):
+    content_type = ContentType.objects.get_for_id(content_type_id)
+    changes = {"count": delta, "total": delta * rating, f"stars_{rating}": delta}
+
+    # a missing item summary means the item is being deleted and its totals
+    # were already taken out of the vendor summary by discard_rating_summary
+    if not update_rating_summary(content_type, object_id, delta, changes):
+        return
+
+    # ratings are rendered with the item and its vendor, so both count as modified
+    touch_updated_at(content_type.model_class(), object_id)
+    vendor_id = get_item_vendor_id(content_type, object_id)
+    if vendor_id:
+        update_rating_summary(
+            ContentType.objects.get_for_model(Vendor), vendor_id, delta, changes
+        )
+        touch_updated_at(Vendor, vendor_id)
+
+
+def discard_rating_summary(instance):
+    summary = get_rating_summary(instance)
+    if summary is None:
+        return
+
+    changes = {
+        field: -getattr(summary, field) for field in ["count", "total"] + STAR_FIELDS
+    }
+    update_rating_summary(
+        ContentType.objects.get_for_model(Vendor), instance.vendor_id, -1, changes
+    )
+    summary.delete()
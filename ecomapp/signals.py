@@ -1,4 +1,10 @@
-from django.db.models.signals import post_save, pre_delete, post_delete, pre_save
+from django.db.models.signals import (
+    post_save,
+    pre_delete,
+    post_delete,
+    pre_save,
+    m2m_changed,
+)
 from django.dispatch import receiver
 from .models import (
     Product,
@@ -15,7 +21,31 @@ from .models import (
     ClientStrike,
     VendorStrike,
     DeliveryAgentStrike,
+    ProductReview,
+    FoodProduct,
+    Sector,
+    Category,
+    SubCategory,
+    ProductImages,
+    ProductColor,
+    ProductSize,
+    FoodProductImage,
 )
+from .services import apply_rating, discard_rating_summary, touch_updated_at
+from .search import index_catalog_item, index_catalog_items, remove_catalog_item
+from .facets import invalidate_catalog_facets
+from .response_cache import invalidate_response_cache
+from .category_tree import invalidate_category_tree
+from .forecasting import invalidate_stock_forecast
+from .counters import increment_vendor_counters, transition_delta
+from .images import needs_image_variants
+from .tasks import generate_image_variants, notify_new_orders
+from .bulk_updates import catalog_items_updated
+from .inventory import release_stock, invalidate_stock_caches, sync_cart_items
+from .transitions import transition_order
+from .notifications import fan_out, notification, notification_email
+from .outbox import queue_emails
+from django.db import transaction
 from django.core.exceptions import ValidationError
 from userauths.models import User, Vendor, Client
 import threading
@@ -24,7 +54,7 @@ import json
 from django.contrib.contenttypes.models import ContentType
 import os
 from openai import OpenAI
-from django.core.mail import send_mail
+from django.utils import timezone
 
 
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
@@ -122,7 +152,9 @@ def fetch_product_details(
 
             if details:
                 print("details exist !!")
-                Product.objects.filter(id=product_id).update(details=details)
+                Product.objects.filter(id=product_id).update(
+                    details=details, updated_at=timezone.now()
+                )
                 print("it s saved successfully!!")
 
     except requests.exceptions.RequestException as e:
@@ -142,33 +174,6 @@ def check_stock(sender, instance, **kwargs):
         instance.save(update_fields=["in_stock"])
 
 
-@receiver(pre_save, sender=CartOrder)
-def reduce_stock_after_vendor_confirmation(sender, instance, **kwargs):
-    if not instance.pk:
-        return
-    try:
-        previous = CartOrder.objects.get(pk=instance.pk)
-
-    except CartOrder.DoesNotExist:
-        previous = None
-
-    if (
-        previous is not None
-        and previous.order_status != "confirmed"
-        and (
-            instance.order_status == "confirmed" or instance.order_status == "delivered"
-        )
-    ):
-        print("updating order status to confirmed")
-        related_cart_order_items = instance.cart_order_items.all()
-        for cart_order_item in related_cart_order_items:
-            if cart_order_item.cart_item.product:
-                cart_order_item.cart_item.product.quantity -= (
-                    cart_order_item.cart_item.quantity
-                )
-                cart_order_item.cart_item.product.save(update_fields=["quantity"])
-
-
 @receiver(post_save, sender=CartOrderItem)
 def deactivate_cart_order_item_after_vendor_canceled(sender, instance, **kwargs):
     if instance.is_active and instance.is_canceled_by_vendor:
@@ -320,6 +325,198 @@ def get_details(sender, instance, created, **kwargs):
 #         raise ValidationError("this user is already related to an existing vendor")
 
 
+@receiver(pre_save, sender=ProductReview)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            ProductReview.objects.filter(pk=instance.pk)
+            .values_list("content_type_id", "object_id", "rating")
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductReview)
+def update_rating_summary_after_save(sender, instance, **kwargs):
+    current = (instance.content_type_id, instance.object_id, instance.rating)
+    previous = getattr(instance, "_previous_rating", None)
+    if previous == current:
+        return
+
+    if previous is not None:
+        apply_rating(*previous, delta=-1)
+    apply_rating(*current, delta=1)
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_rating_summary_after_delete(sender, instance, **kwargs):
+    apply_rating(
+        instance.content_type_id, instance.object_id, instance.rating, delta=-1
+    )
+
+
+@receiver(pre_delete, sender=Product)
+@receiver(pre_delete, sender=FoodProduct)
+def delete_rating_summary(sender, instance, **kwargs):
+    discard_rating_summary(instance)
+
+
+SEARCH_INDEXED_FIELDS = {"title", "description", "specifications", "ingredients"}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=FoodProduct)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCH_INDEXED_FIELDS.intersection(update_fields):
+        return
+    index_catalog_item(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=FoodProduct)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_catalog_item(instance)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_search_index_after_tags_change(sender, instance, action, **kwargs):
+    if action in ["post_add", "post_remove", "post_clear"] and isinstance(
+        instance, (Product, FoodProduct)
+    ):
+        index_catalog_item(instance)
+
+
+@receiver(pre_save, sender=Vendor)
+def remember_previous_vendor_title(sender, instance, update_fields=None, **kwargs):
+    instance._previous_title = None
+    if instance.pk and not (update_fields and "title" not in update_fields):
+        instance._previous_title = (
+            Vendor.objects.filter(pk=instance.pk)
+            .values_list("title", flat=True)
+            .first()
+        )
+
+
+def with_vendor(items, vendor):
+    for item in items:
+        item.vendor = vendor
+        yield item
+
+
+# only a new title changes the documents of the vendor items, they are then
+# written in batches instead of one statement per item
+@receiver(post_save, sender=Vendor)
+def update_vendor_items_search_index(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_title", None)
+    if created or previous is None or previous == instance.title:
+        return
+    for model in [Product, FoodProduct]:
+        items = (
+            model.objects.filter(vendor=instance)
+            .prefetch_related("tags")
+            .order_by("pk")
+            .iterator(chunk_size=500)
+        )
+        index_catalog_items(with_vendor(items, instance))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=FoodProduct)
+@receiver(post_delete, sender=FoodProduct)
+def invalidate_item_facets(sender, **kwargs):
+    invalidate_catalog_facets(sender)
+
+
+@receiver(post_save, sender=Vendor)
+@receiver(post_save, sender=Sector)
+@receiver(post_delete, sender=Sector)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_all_facets(sender, **kwargs):
+    invalidate_catalog_facets(Product, FoodProduct)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_responses(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {"last_login"}:
+        return
+    invalidate_response_cache(sender)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_cached_responses_after_tags_change(sender, instance, action, **kwargs):
+    if action in ["post_add", "post_remove", "post_clear"]:
+        invalidate_response_cache(type(instance))
+
+
+@receiver(post_save, sender=Sector)
+@receiver(post_delete, sender=Sector)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=FoodProduct)
+def rebuild_category_tree(sender, **kwargs):
+    invalidate_category_tree()
+
+
+CATEGORY_TREE_FIELDS = {"sub_category", "sub_category_id", "is_active"}
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=FoodProduct)
+def remember_category_tree_state(sender, instance, update_fields=None, **kwargs):
+    instance._previous_tree_state = None
+    if instance.pk and not (
+        update_fields and not CATEGORY_TREE_FIELDS.intersection(update_fields)
+    ):
+        instance._previous_tree_state = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("sub_category_id", "is_active")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=FoodProduct)
+def rebuild_category_tree_after_item_change(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_tree_state", None)
+    if created or (
+        previous is not None
+        and previous != (instance.sub_category_id, instance.is_active)
+    ):
+        invalidate_category_tree()
+
+
+@receiver(post_save, sender=ProductImages)
+@receiver(post_delete, sender=ProductImages)
+@receiver(post_save, sender=ProductColor)
+@receiver(post_delete, sender=ProductColor)
+@receiver(post_save, sender=ProductSize)
+@receiver(post_delete, sender=ProductSize)
+def touch_product(sender, instance, **kwargs):
+    touch_updated_at(Product, instance.product_id)
+
+
+@receiver(post_save, sender=FoodProductImage)
+@receiver(post_delete, sender=FoodProductImage)
+def touch_food_product(sender, instance, **kwargs):
+    touch_updated_at(FoodProduct, instance.food_product_id)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def touch_item_after_tags_change(sender, instance, action, **kwargs):
+    if action in ["post_add", "post_remove", "post_clear"] and isinstance(
+        instance, (Product, FoodProduct)
+    ):
+        touch_updated_at(type(instance), instance.pk)
+
+
 @receiver(post_save, sender=Client)
 def create_related_client_resources(sender, instance, created, **kwargs):
     if created:
@@ -344,77 +541,6 @@ def create_related_client_resources(sender, instance, created, **kwargs):
 #         raise ValidationError("this user is a staff user")
 
 
-@receiver(post_save, sender=CartOrder)
-def increment_total_sold_products(sender, instance, created, **kwargs):
-    if not created:
-        try:
-            previous_order_state = CartOrder.objects.get(pk=instance.pk)
-        except CartOrder.DoesNotExist:
-            return
-        if (
-            previous_order_state.order_status != "delivered"
-            and instance.order_status == "delivered"
-        ):
-            vendor = instance.vendor
-            vendor.total_sold += 1
-            vendor.save(update_fields=["total_sold"])
-
-
-def cancel_and_notify_delivery_agent(claimed_order: ClaimedOrder):
-    claimed_order.delivery_status = "canceled"
-    claimed_order.save(update_fields=["delivery_status"])
-    Notification.objects.create(
-        user=claimed_order.delivery_agent.user,
-        message=f"your order has been canceled , claimed order id : {claimed_order.id}, client name : {claimed_order.order.client.user.get_full_name()}, vendor name : {claimed_order.order.vendor.user.get_full_name()}",
-        content_type=ContentType.objects.get_for_model(ClaimedOrder),
-        object_id=claimed_order.id,
-        notification_type=NotificationType.ORDER,
-    )
-
-
-@receiver(post_save, sender=CartOrder)
-def cancel_cart_order_items(sender, instance, **kwargs):
-    if instance.is_canceled and instance.is_active:
-        CartOrder.objects.filter(pk=instance.pk).update(is_active=False)
-        ClientStrike.objects.create(
-            client=instance.client,
-            reason="You have canceled an order",
-        )
-        related_cart_order_items = instance.cart_order_items.all()
-        for cart_order_item in related_cart_order_items:
-            cart_order_item.is_canceled = True
-            cart_order_item.save(update_fields=["is_canceled"])
-
-        claimed_order = (
-            instance.claimed_orders.filter(is_failed=False)
-            .exclude(delivery_status="delivered")
-            .first()
-        )
-
-        if claimed_order:
-            cancel_and_notify_delivery_agent(claimed_order)
-
-        # TODO : create a strike for the client
-
-    if instance.order_status == "canceled" and instance.is_active:
-        CartOrder.objects.filter(pk=instance.pk).update(is_active=False)
-        related_cart_order_items = instance.cart_order_items.all()
-        for cart_order_item in related_cart_order_items:
-            cart_order_item.is_canceled_by_vendor = True
-            cart_order_item.save(update_fields=["is_canceled_by_vendor"])
-
-        claimed_order = (
-            instance.claimed_orders.filter(is_failed=False)
-            .exclude(delivery_status="delivered")
-            .first()
-        )
-
-        if claimed_order:
-            cancel_and_notify_delivery_agent(claimed_order)
-
-        # TODO : here i should update is canceled by vendor rather than is_canceled
-
-
 # @receiver(post_save, sender=CartOrderItem)
 # def incrementing_amount_of_cart_order_item_canceled(sender, instance, **kwargs):
 #     if instance.is_canceled and instance.is_active:
@@ -438,8 +564,10 @@ def cancel_cart_order_items(sender, instance, **kwargs):
 @receiver(post_save, sender=CartOrderItem)
 def readjust_amount_of_products_after_cancellation(sender, instance, **kwargs):
     if (instance.is_canceled or instance.is_canceled_by_vendor) and instance.is_active:
-        instance.cart_item.product.quantity += instance.cart_item.quantity
-        instance.cart_item.product.save(update_fields=["quantity"])
+        # stock only comes back if the confirmation of the order had taken it
+        if instance.order.stock_reserved:
+            release_stock([instance])
+            invalidate_stock_caches(instance.order.vendor_id)
         instance.is_active = False
         instance.save(update_fields=["is_active"])
         if instance.is_canceled:
@@ -452,24 +580,14 @@ def readjust_amount_of_products_after_cancellation(sender, instance, **kwargs):
 @receiver(post_save, sender=Notification)
 def send_an_email(sender, instance, created, **kwargs):
     if created:
-        user_full_name = instance.user.get_full_name()
-        user_email = instance.user.email
-        message = instance.message
-        send_mail(
-            f"Hello, {user_full_name}",
-            message,
-            "mouadhoumada@gmail.com",
-            [user_email],
-            fail_silently=False,
-        )
+        queue_emails([notification_email(instance, instance.user)])
 
 
 @receiver(post_save, sender=CancellationRequestByDeliveryAgent)
 def check_if_cancellation_request_approved(sender, instance, **kwargs):
     if instance.is_approved and not instance.is_active:
         if instance.cancellation_reason == "CNR":
-            instance.claimed_order.order.is_canceled = True
-            instance.claimed_order.order.save(update_fields=["is_canceled"])
+            transition_order(instance.claimed_order.order, is_canceled=True)
             instance.is_active = False
             instance.save(update_fields=["is_active"])
 
@@ -477,76 +595,135 @@ def check_if_cancellation_request_approved(sender, instance, **kwargs):
 @receiver(post_save, sender=ClaimedOrder)
 def update_order_status(sender, instance, **kwargs):
     if instance.delivery_status == "delivered":
-        instance.order.order_status = "delivered"
         instance.is_active = False
-        instance.order.save(update_fields=["order_status", "is_active"])
+        if instance.order.order_status != "delivered":
+            transition_order(instance.order, order_status="delivered")
 
 
 @receiver(post_save, sender=ClaimedOrder)
 def create_notifications(sender, instance, created, **kwargs):
     if created:
-        Notification.objects.create(
-            user=instance.order.client.user,
-            message=f"A delivery agent has claimed your order : full name : {instance.delivery_agent.user.get_full_name()}",
-            content_type=ContentType.objects.get_for_model(instance),
-            object_id=instance.id,
-            notification_type=NotificationType.ORDER,
-        )
-
-        Notification.objects.create(
-            user=instance.order.vendor.user,
-            message=f"A delivery agent has claimed an order of yours : full name : {instance.delivery_agent.user.get_full_name()}",
-            content_type=ContentType.objects.get_for_model(instance),
-            object_id=instance.id,
-            notification_type=NotificationType.ORDER,
-        )
-
-        Notification.objects.create(
-            user=instance.delivery_agent.user,
-            message=f"Congratulations ! you have successfully claimed an order , you have 2 hours to get it from the vendor",
-            content_type=ContentType.objects.get_for_model(instance),
-            object_id=instance.id,
-            notification_type=NotificationType.ORDER,
+        agent_name = instance.delivery_agent.user.get_full_name()
+        fan_out(
+            [
+                notification(
+                    instance.order.client.user_id,
+                    f"A delivery agent has claimed your order : full name : {agent_name}",
+                    instance,
+                    NotificationType.ORDER,
+                ),
+                notification(
+                    instance.order.vendor.user_id,
+                    f"A delivery agent has claimed an order of yours : full name : {agent_name}",
+                    instance,
+                    NotificationType.ORDER,
+                ),
+                notification(
+                    instance.delivery_agent.user_id,
+                    f"Congratulations ! you have successfully claimed an order , you have 2 hours to get it from the vendor",
+                    instance,
+                    NotificationType.ORDER,
+                ),
+            ]
         )
 
 
+# status changes go through transition_order, only orders created one by one
+# are announced here, checkout queues its own notifications
 @receiver(post_save, sender=CartOrder)
 def sending_notification_to_vendor_client_delivery_agents(
     sender, instance, created, **kwargs
 ):
     if created:
-        Notification.objects.create(
-            user=instance.vendor.user,
-            message=f"A new order has been placed",
-            content_type=ContentType.objects.get_for_model(instance),
-            object_id=instance.id,
-            notification_type=NotificationType.ORDER,
-        )
+        transaction.on_commit(lambda: notify_new_orders.delay([instance.pk]))
 
-        Notification.objects.create(
-            user=instance.client.user,
-            message=f"Congratulations You have successfully placed a new order",
-            content_type=ContentType.objects.get_for_model(instance),
-            object_id=instance.id,
-            notification_type=NotificationType.ORDER,
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=FoodProduct)
+@receiver(post_delete, sender=FoodProduct)
+def invalidate_item_stock_forecast(sender, instance, **kwargs):
+    invalidate_stock_forecast(instance.vendor_id)
+
+
+@receiver(post_save, sender=ProductSize)
+@receiver(post_delete, sender=ProductSize)
+def invalidate_size_stock_forecast(sender, instance, **kwargs):
+    vendor_id = (
+        Product.objects.filter(pk=instance.product_id)
+        .values_list("vendor_id", flat=True)
+        .first()
+    )
+    if vendor_id:
+        invalidate_stock_forecast(vendor_id)
+
+
+VENDOR_COUNTER_FIELDS = {"vendor", "vendor_id", "is_active"}
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=FoodProduct)
+def remember_vendor_counter_state(sender, instance, update_fields=None, **kwargs):
+    instance._previous_counter_state = (None, False)
+    if instance.pk:
+        if update_fields and not VENDOR_COUNTER_FIELDS.intersection(update_fields):
+            instance._previous_counter_state = None
+            return
+        instance._previous_counter_state = sender.objects.filter(
+            pk=instance.pk
+        ).values_list("vendor_id", "is_active").first() or (None, False)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=FoodProduct)
+def update_vendor_products_count(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_counter_state", None)
+    if previous is None:
+        return
+    previous_vendor_id, was_active = previous
+    if previous_vendor_id == instance.vendor_id:
+        increment_vendor_counters(
+            instance.vendor_id,
+            products_count=transition_delta(was_active, instance.is_active),
         )
+        return
+    increment_vendor_counters(previous_vendor_id, products_count=-int(was_active))
+    increment_vendor_counters(
+        instance.vendor_id, products_count=int(instance.is_active)
+    )
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=FoodProduct)
+def decrement_vendor_products_count(sender, instance, **kwargs):
+    if instance.is_active:
+        increment_vendor_counters(instance.vendor_id, products_count=-1)
 
-    if (
-        instance.delivery_option
-        and instance.order_status == "confirmed"
-        and instance.is_active
-        and not (ClaimedOrder.objects.filter(order=instance, is_failed=False))
-    ):
 
-        interested_delivery_agents = DeliveryAgent.objects.filter(
-            city=instance.vendor.city
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImages)
+@receiver(post_save, sender=FoodProduct)
+@receiver(post_save, sender=FoodProductImage)
+@receiver(post_save, sender=Vendor)
+def schedule_image_variants(sender, instance, **kwargs):
+    if needs_image_variants(instance):
+        transaction.on_commit(
+            lambda: generate_image_variants.delay(sender._meta.label, instance.pk)
         )
 
-        for delivery_agent in interested_delivery_agents:
-            Notification.objects.create(
-                user=delivery_agent.user,
-                message=f"A new order is ready to be claimed",
-                content_type=ContentType.objects.get_for_model(instance),
-                object_id=instance.id,
-                notification_type=NotificationType.ORDER,
-            )
+
+# one event for a whole bulk update instead of the receivers above for every row
+@receiver(catalog_items_updated)
+def refresh_after_bulk_update(sender, vendor_id, ids, fields, **kwargs):
+    if SEARCH_INDEXED_FIELDS.intersection(fields):
+        index_catalog_items(
+            sender.objects.filter(pk__in=ids)
+            .select_related("vendor__user")
+            .prefetch_related("tags")
+        )
+    if "quantity" in fields:
+        sync_cart_items(sender, ids)
+    invalidate_catalog_facets(sender)
+    invalidate_response_cache(sender)
+    invalidate_stock_forecast(vendor_id)
@@ -1,55 +1,242 @@
+from smtplib import SMTPException
 from celery import shared_task
 from django.utils import timezone
 from .models import (
     ClaimedOrder,
-    Notification,
     DeliveryAgentStrike,
     NotificationType,
     DeliveryAgent,
     CartOrder,
+    Product,
+)
+from .trending import refresh_trending_scores
+from .images import build_image_variants
+from .idempotency import prune_idempotency_keys
+from .response_cache import invalidate_response_cache
+from .notifications import (
+    NOTIFICATION_BATCH_SIZE,
+    fan_out,
+    notification,
+    notifications_for,
+)
+from .outbox import (
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_OUTBOX_BATCH_SIZE,
+    drain_outbox,
+    retry_delay,
 )
-from django.contrib.contenttypes.models import ContentType
 
 
+# expired claims are failed with one UPDATE, their strikes and notifications
+# are inserted in bulk and the agents of each city are loaded once
 @shared_task
 def check_and_fail_expired_claimed_orders():
     now = timezone.now()
-    expired_claimed_orders = ClaimedOrder.objects.filter(
-        expiration_date_time__lte=now, is_confirmed_by_vendor=False, is_failed=False
+    expired_claimed_orders = list(
+        ClaimedOrder.objects.filter(
+            expiration_date_time__lte=now, is_confirmed_by_vendor=False, is_failed=False
+        ).select_related("order__vendor__user", "delivery_agent__user")
     )
-    for claimed_order in expired_claimed_orders:
-        claimed_order.is_failed = True
-        claimed_order.is_active = False
-        claimed_order.save()
-        Notification.objects.create(
-            user=claimed_order.order.vendor.user,
-            message=f"The delivery agent : {claimed_order.delivery_agent.user.get_full_name()} has failed reaching you to get the order",
-            content_type=ContentType.objects.get_for_model(ClaimedOrder),
-            object_id=claimed_order.id,
-            notification_type=NotificationType.CLAIMEDORDER,
-        )
+    if not expired_claimed_orders:
+        return 0
+
+    ClaimedOrder.objects.filter(
+        pk__in=[claimed_order.pk for claimed_order in expired_claimed_orders]
+    ).update(is_failed=True, is_active=False, updated_at=now)
+    invalidate_response_cache(ClaimedOrder)
+
+    DeliveryAgentStrike.objects.bulk_create(
+        [
+            DeliveryAgentStrike(
+                delivery_agent=claimed_order.delivery_agent,
+                reason=f"You have failed to get the order from the vendor in less than 2 hours, vendor owner name : {claimed_order.order.vendor.user.get_full_name()}",
+            )
+            for claimed_order in expired_claimed_orders
+        ]
+    )
+
+    agents_by_city = {}
+    for agent_id, user_id, city in DeliveryAgent.objects.filter(
+        city__in={
+            claimed_order.order.vendor.city for claimed_order in expired_claimed_orders
+        }
+    ).values_list("pk", "user_id", "city"):
+        agents_by_city.setdefault(city, []).append((agent_id, user_id))
+
+    def notifications():
+        for claimed_order in expired_claimed_orders:
+            yield notification(
+                claimed_order.order.vendor.user_id,
+                f"The delivery agent : {claimed_order.delivery_agent.user.get_full_name()} has failed reaching you to get the order",
+                claimed_order,
+                NotificationType.CLAIMEDORDER,
+            )
+            yield notification(
+                claimed_order.delivery_agent.user_id,
+                f"You have failed in getting the order , therefore you are receiving a strike",
+                claimed_order,
+                NotificationType.CLAIMEDORDER,
+            )
+            yield from notifications_for(
+                [
+                    user_id
+                    for agent_id, user_id in agents_by_city.get(
+                        claimed_order.order.vendor.city, []
+                    )
+                    if agent_id != claimed_order.delivery_agent_id
+                ],
+                f"A new order ready to be claimed, hurry up and get it",
+                claimed_order.order,
+                NotificationType.CLAIMEDORDER,
+            )
+
+    fan_out(notifications())
+    return len(expired_claimed_orders)
 
-        Notification.objects.create(
-            user=claimed_order.delivery_agent.user,
-            message=f"You have failed in getting the order , therefore you are receiving a strike",
-            content_type=ContentType.objects.get_for_model(ClaimedOrder),
-            object_id=claimed_order.id,
-            notification_type=NotificationType.CLAIMEDORDER,
+
+@shared_task
+def refresh_trending():
+    return refresh_trending_scores()
+
+
+@shared_task
+def generate_image_variants(model_label, pk):
+    variants = build_image_variants(model_label, pk)
+    return variants and variants["source"]
+
+
+# one message per imported chunk, an image that cannot be read is skipped so
+# it does not hold back the rest of the chunk
+@shared_task
+def generate_image_variants_batch(model_label, pks):
+    built = 0
+    for pk in pks:
+        try:
+            built += bool(build_image_variants(model_label, pk))
+        except (OSError, ValueError):
+            continue
+    return built
+
+
+# one job for a whole import instead of one thread per product
+@shared_task
+def generate_product_details(product_ids):
+    from .signals import fetch_product_details
+
+    products = Product.objects.filter(pk__in=product_ids).select_related(
+        "sub_category__category"
+    )
+    for product in products.iterator():
+        if product.title and product.description:
+            fetch_product_details(
+                product.id,
+                product.title,
+                product.description,
+                product.sub_category.category.title,
+                product.sub_category.title,
+            )
+    return len(product_ids)
+
+
+# the notifications of a checkout are sent after it commits, fan_out inserts
+# them in bulk and queues their emails itself
+@shared_task
+def notify_new_orders(order_ids):
+    orders = CartOrder.objects.filter(pk__in=order_ids).select_related(
+        "vendor", "client"
+    )
+
+    def notifications():
+        for order in orders:
+            yield notification(
+                order.vendor.user_id,
+                f"A new order has been placed",
+                order,
+                NotificationType.ORDER,
+            )
+            yield notification(
+                order.client.user_id,
+                f"Congratulations You have successfully placed a new order",
+                order,
+                NotificationType.ORDER,
+            )
+
+    fan_out(notifications())
+    return len(order_ids)
+
+
+@shared_task
+def notify_order_ready(order_id):
+    order = CartOrder.objects.select_related("vendor").filter(pk=order_id).first()
+    if order is None:
+        return 0
+    interested_delivery_agents = DeliveryAgent.objects.filter(
+        city=order.vendor.city
+    ).values_list("user_id", flat=True)
+    return fan_out(
+        notifications_for(
+            interested_delivery_agents.iterator(chunk_size=NOTIFICATION_BATCH_SIZE),
+            f"A new order is ready to be claimed",
+            order,
+            NotificationType.ORDER,
         )
+    )
 
-        DeliveryAgentStrike.objects.create(
-            delivery_agent=claimed_order.delivery_agent,
-            reason=f"You have failed to get the order from the vendor in less than 2 hours, vendor owner name : {claimed_order.order.vendor.user.get_full_name()}",
+
+@shared_task
+def notify_order_canceled(order_id, claimed_order_id=None, canceled_by="client"):
+    order = (
+        CartOrder.objects.select_related("client__user", "vendor__user")
+        .filter(pk=order_id)
+        .first()
+    )
+    if order is None:
+        return None
+    notifications = []
+    if canceled_by == "vendor":
+        notifications.append(
+            notification(
+                order.client.user_id,
+                f"The vendor has canceled your order",
+                order,
+                NotificationType.ORDER,
+            )
         )
 
-        interested_delivery_agents = DeliveryAgent.objects.filter(
-            city=claimed_order.order.vendor.city
-        ).exclude(pk=claimed_order.delivery_agent.pk)
-        for delivery_agent in interested_delivery_agents:
-            Notification.objects.create(
-                user=delivery_agent.user,
-                message=f"A new order ready to be claimed, hurry up and get it",
-                content_type=ContentType.objects.get_for_model(CartOrder),
-                object_id=claimed_order.order.id,
-                notification_type=NotificationType.CLAIMEDORDER,
+    claimed_order = (
+        ClaimedOrder.objects.select_related("delivery_agent")
+        .filter(pk=claimed_order_id)
+        .first()
+    )
+    if claimed_order:
+        notifications.append(
+            notification(
+                claimed_order.delivery_agent.user_id,
+                f"your order has been canceled , claimed order id : {claimed_order.id}, client name : {order.client.user.get_full_name()}, vendor name : {order.vendor.user.get_full_name()}",
+                claimed_order,
+                NotificationType.ORDER,
             )
+        )
+    fan_out(notifications)
+    return order_id
+
+
+# a full batch may mean more is waiting, a broken mail server is tried again
+# later, the rows stay pending meanwhile
+@shared_task(bind=True, max_retries=EMAIL_MAX_ATTEMPTS)
+def send_outgoing_emails(self):
+    try:
+        processed = drain_outbox()
+    except (SMTPException, OSError) as error:
+        raise self.retry(
+            exc=error,
+            countdown=retry_delay(self.request.retries + 1).total_seconds(),
+        )
+    if processed == EMAIL_OUTBOX_BATCH_SIZE:
+        send_outgoing_emails.delay()
+    return processed
+
+
+@shared_task
+def prune_expired_idempotency_keys():
+    return prune_idempotency_keys()
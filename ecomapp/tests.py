@@ -1,3 +1,1450 @@
-from django.test import TestCase
+import csv
+import json
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from PIL import Image as PILImage
+from django.db import OperationalError, connection
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db.models import Sum
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from userauths.models import User, Vendor, Client, DeliveryAgent
+from .models import (
+    Sector,
+    Category,
+    SubCategory,
+    Product,
+    ProductSize,
+    FoodProduct,
+    ShoppingCart,
+    CartItem,
+    GlobalOrder,
+    CartOrder,
+    CartOrderItem,
+    ClaimedOrder,
+    ClientStrike,
+    VendorDailyOrders,
+    VendorDailySales,
+    RatingSummary,
+    IdempotencyKey,
+    OutgoingEmail,
+    EmailStatus,
+    TrendingScore,
+    Notification,
+    NotificationType,
+)
+from .inventory import OutOfStock
+from .transitions import transition_order
+from .forecasting import build_stock_forecast
+from .bulk_updates import bulk_update_items
+from .search import rebuild_search_index, search_catalog
+from .serializers import ProductSerializer
+from .tasks import notify_new_orders
+from .notifications import fan_out, notifications_for
+from .images import build_image_variants, variant_files
+from .outbox import EMAIL_MAX_ATTEMPTS, drain_outbox
+from .sales import get_sales_over_time, rebuild_vendor_sales
+from .counters import increment_vendor_counters
+from .exports import export_columns
 
-# Create your tests here.
+
+def create_user(number, role):
+    return User.objects.create_user(
+        email=f"user{number}@example.com",
+        username=f"user{number}",
+        password="password",
+        first_name="first",
+        last_name="last",
+        phone_number=f"+2126{number:08d}",
+        role=role,
+    )
+
+
+# the tests never need the shared redis cache of the settings
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+CACHE_MODULES = [
+    "ecomapp.response_cache",
+    "ecomapp.facets",
+    "ecomapp.category_tree",
+]
+
+
+# images and descriptions are left empty so no image or ai job is started
+class MarketplaceFixtures:
+    def create_catalog(self):
+        sector = Sector.objects.create(title="Sector", description="sector")
+        category = Category.objects.create(
+            sector=sector, title="Category", description="category"
+        )
+        self.sub_category = SubCategory.objects.create(
+            category=category, title="Sub category", description="sub category"
+        )
+        self.vendor = Vendor.objects.create(
+            user=create_user(1, "VENDOR"),
+            title="Vendor",
+            address="address",
+            city="Casablanca",
+            field="Products",
+        )
+        self.clients = []
+
+    def create_product(self, quantity, **kwargs):
+        return Product.objects.create(
+            vendor=self.vendor,
+            sub_category=self.sub_category,
+            quantity=quantity,
+            **{"title": "Product", "price": 10, **kwargs},
+        )
+
+    def create_food_product(self, quantity, **kwargs):
+        return FoodProduct.objects.create(
+            vendor=self.vendor,
+            sub_category=self.sub_category,
+            quantity=quantity,
+            **{"title": "Food product", "price": 5, **kwargs},
+        )
+
+    def create_order(self, lines):
+        client = Client.objects.create(
+            user=create_user(100 + len(self.clients), "CLIENT")
+        )
+        self.clients.append(client)
+        cart = ShoppingCart.objects.get(client=client)
+        global_order = GlobalOrder.objects.create(shopping_cart=cart, address="address")
+        # created in bulk like the checkout does, so no notification is queued
+        order = CartOrder.objects.bulk_create(
+            [CartOrder(client=client, vendor=self.vendor, global_order=global_order)]
+        )[0]
+        for item, quantity, size in lines:
+            field = "product" if isinstance(item, Product) else "food_product"
+            cart_item = CartItem.objects.create(
+                shopping_cart=cart,
+                quantity=quantity,
+                size=size,
+                total_price=item.price * quantity,
+                is_ordered=True,
+                **{field: item},
+            )
+            CartOrderItem.objects.create(
+                client=client,
+                order=order,
+                cart_item=cart_item,
+                total_payed=cart_item.total_price,
+            )
+        return order
+
+
+def confirm(order):
+    transition_order(order, order_status="confirmed")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class InventoryTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+
+    def test_confirmation_takes_product_food_product_and_size_stock(self):
+        product = self.create_product(10)
+        ProductSize.objects.create(product=product, size="M", quantity=4)
+        food_product = self.create_food_product(3)
+        order = self.create_order([(product, 3, "M"), (food_product, 3, None)])
+
+        confirm(order)
+
+        product.refresh_from_db()
+        food_product.refresh_from_db()
+        self.assertEqual(product.quantity, 7)
+        self.assertEqual(ProductSize.objects.get(product=product).quantity, 1)
+        self.assertEqual(food_product.quantity, 0)
+        self.assertFalse(food_product.in_stock)
+        self.assertTrue(CartOrder.objects.get(pk=order.pk).stock_reserved)
+
+    def test_stock_is_only_taken_once(self):
+        product = self.create_product(10)
+        order = self.create_order([(product, 2, None)])
+
+        confirm(order)
+        transition_order(order, order_status="delivered")
+
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 8)
+
+    def test_oversold_order_reports_conflicts_and_keeps_stock(self):
+        product = self.create_product(5)
+        ProductSize.objects.create(product=product, size="L", quantity=1)
+        food_product = self.create_food_product(10)
+        order = self.create_order([(product, 2, "L"), (food_product, 4, None)])
+
+        with self.assertRaises(OutOfStock) as raised:
+            confirm(order)
+
+        conflicts = raised.exception.conflicts
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(conflicts[0]["kind"], "product_size")
+        self.assertEqual(conflicts[0]["available"], 1)
+        product.refresh_from_db()
+        food_product.refresh_from_db()
+        self.assertEqual(product.quantity, 5)
+        self.assertEqual(food_product.quantity, 10)
+        self.assertFalse(CartOrder.objects.get(pk=order.pk).stock_reserved)
+
+    def test_canceled_item_gives_its_stock_back(self):
+        product = self.create_product(6)
+        food_product = self.create_food_product(6)
+        order = self.create_order([(product, 2, None), (food_product, 6, None)])
+        confirm(order)
+
+        order_item = order.cart_order_items.get(cart_item__food_product=food_product)
+        order_item.is_canceled = True
+        order_item.save()
+
+        product.refresh_from_db()
+        food_product.refresh_from_db()
+        self.assertEqual(product.quantity, 4)
+        self.assertEqual(food_product.quantity, 6)
+        self.assertTrue(food_product.in_stock)
+
+    def test_unconfirmed_order_does_not_restock(self):
+        product = self.create_product(6)
+        order = self.create_order([(product, 2, None)])
+
+        order_item = order.cart_order_items.get()
+        order_item.is_canceled = True
+        order_item.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 6)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConcurrentConfirmationTests(MarketplaceFixtures, TransactionTestCase):
+    orders_count = 12
+    stock = 5
+
+    def setUp(self):
+        self.create_catalog()
+
+    # sqlite locks the whole table while another thread writes, a locked or
+    # deadlocked confirmation is rolled back and simply tried again
+    def confirm_with_retry(self, order):
+        for attempt in range(100):
+            try:
+                confirm(order)
+                return "confirmed"
+            except OutOfStock:
+                return "oversold"
+            except OperationalError:
+                time.sleep(0.01 * (attempt % 10 + 1))
+        return "failed"
+
+    def confirm_in_parallel(self, order_ids):
+        barrier = threading.Barrier(len(order_ids))
+        results = []
+        lock = threading.Lock()
+
+        def run(order_id):
+            try:
+                order = CartOrder.objects.get(pk=order_id)
+                barrier.wait()
+                result = self.confirm_with_retry(order)
+                with lock:
+                    results.append(result)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(pk,)) for pk in order_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_parallel_confirmations_never_oversell(self):
+        product = self.create_product(self.stock)
+        orders = [
+            self.create_order([(product, 1, None)]) for _ in range(self.orders_count)
+        ]
+
+        results = self.confirm_in_parallel([order.pk for order in orders])
+
+        product.refresh_from_db()
+        self.assertEqual(len(results), self.orders_count)
+        self.assertEqual(results.count("confirmed"), self.stock)
+        self.assertEqual(results.count("oversold"), self.orders_count - self.stock)
+        self.assertEqual(product.quantity, 0)
+        self.assertFalse(product.in_stock)
+        self.assertEqual(
+            CartOrder.objects.filter(stock_reserved=True).count(), self.stock
+        )
+
+    def test_parallel_confirmations_of_one_order_take_stock_once(self):
+        product = self.create_product(10)
+        order = self.create_order([(product, 3, None)])
+
+        results = self.confirm_in_parallel([order.pk] * 6)
+
+        product.refresh_from_db()
+        self.assertEqual(results.count("confirmed"), 6)
+        self.assertEqual(product.quantity, 7)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderTransitionTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.product = self.create_product(20)
+        self.food_product = self.create_food_product(20)
+        # content types are cached per process, the counts must not depend on
+        # which test ran first
+        ContentType.objects.get_for_models(Product, FoodProduct, CartOrder)
+
+    def create_lines_order(self, count):
+        return self.create_order(
+            [(self.product, 1, None)] * count + [(self.food_product, 1, None)]
+        )
+
+    def transition(self, order, queries, callbacks, **changes):
+        with self.captureOnCommitCallbacks() as effects:
+            with self.assertNumQueries(queries):
+                transition_order(order, **changes)
+        # the cache invalidations also wait for the commit, only the other
+        # side effects are counted
+        effects = [
+            effect for effect in effects if effect.__module__ not in CACHE_MODULES
+        ]
+        self.assertEqual(len(effects), callbacks)
+
+    def test_confirmation(self):
+        DeliveryAgent.objects.create(user=create_user(2, "DELIVERY_AGENT"))
+        order = self.create_lines_order(2)
+
+        self.transition(order, 13, 1, order_status="confirmed", delivery_option=True)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 18)
+        self.assertTrue(order.stock_reserved)
+
+    def test_confirmation_queries_do_not_grow_with_the_lines(self):
+        counts = []
+        for lines in [1, 8]:
+            order = self.create_lines_order(lines)
+            with CaptureQueriesContext(connection) as queries:
+                transition_order(order, order_status="confirmed")
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_delivery(self):
+        order = self.create_lines_order(1)
+        transition_order(order, order_status="confirmed")
+
+        self.transition(order, 22, 0, order_status="delivered")
+
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.total_sold, 1)
+        self.assertEqual(
+            VendorDailyOrders.objects.filter(vendor=self.vendor).aggregate(
+                orders=Sum("orders")
+            )["orders"],
+            1,
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 19)
+
+    def test_client_cancellation(self):
+        order = self.create_lines_order(2)
+        transition_order(order, order_status="confirmed")
+        agent = DeliveryAgent.objects.create(user=create_user(2, "DELIVERY_AGENT"))
+        claimed_order = ClaimedOrder.objects.create(delivery_agent=agent, order=order)
+
+        self.transition(order, 15, 1, is_canceled=True)
+
+        self.assertFalse(order.is_active)
+        self.assertFalse(order.cart_order_items.filter(is_active=True).exists())
+        self.assertEqual(order.cart_order_items.filter(is_canceled=True).count(), 3)
+        self.assertEqual(ClientStrike.objects.filter(client=order.client).count(), 1)
+        claimed_order.refresh_from_db()
+        self.assertEqual(claimed_order.delivery_status, "canceled")
+        self.product.refresh_from_db()
+        self.food_product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 20)
+        self.assertEqual(self.food_product.quantity, 20)
+
+    def test_vendor_cancellation_of_an_unconfirmed_order(self):
+        order = self.create_lines_order(1)
+
+        self.transition(order, 7, 1, order_status="canceled")
+
+        self.assertFalse(order.is_active)
+        self.assertEqual(
+            order.cart_order_items.filter(is_canceled_by_vendor=True).count(), 2
+        )
+        self.assertFalse(ClientStrike.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 20)
+
+    def test_ready_order_is_announced_once(self):
+        order = self.create_lines_order(1)
+        transition_order(order, order_status="confirmed", delivery_option=True)
+
+        self.transition(order, 4, 0, delivery_option=True)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogListQueryTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.vendors = [self.vendor]
+
+    def add_vendors(self, count):
+        vendor_type = ContentType.objects.get_for_model(Vendor)
+        for _ in range(count):
+            number = 10 + len(self.vendors)
+            vendor = Vendor.objects.create(
+                user=create_user(number, "VENDOR"),
+                title=f"Vendor {number}",
+                address="address",
+                city="Casablanca",
+                field="Products",
+            )
+            RatingSummary.objects.create(
+                content_type=vendor_type, object_id=vendor.pk, count=2, total=9
+            )
+            self.vendors.append(vendor)
+            self.vendor = vendor
+            self.create_product(5)
+
+    def list_products(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_vendor_ratings_do_not_add_queries_per_row(self):
+        self.add_vendors(2)
+        # the first request loads the content types into their cache
+        self.list_products()
+        _, few_vendors = self.list_products()
+        self.add_vendors(4)
+
+        with self.assertNumQueries(few_vendors):
+            response, _ = self.list_products()
+
+        results = response.json()["results"]
+        self.assertEqual(len(results), 6)
+        self.assertEqual({row["vendor"]["average_reviews"] for row in results}, {4.5})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StockForecastTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.vendor.field = "Food_Products"
+        self.vendor.save(update_fields=["field"])
+        self.tracked = self.create_food_product(3)
+        self.untracked = self.create_food_product(None)
+        order = self.create_order([(self.tracked, 2, None), (self.untracked, 4, None)])
+        transition_order(order, order_status="confirmed")
+        transition_order(order, order_status="delivered")
+
+    def test_untracked_food_products_have_no_forecast(self):
+        forecast = build_stock_forecast(self.vendor)
+
+        self.assertEqual([row["id"] for row in forecast], [self.tracked.pk])
+        self.assertEqual(forecast[0]["quantity"], 1)
+
+    def test_stock_alert_skips_untracked_food_products(self):
+        client = APIClient()
+        client.force_authenticate(self.vendor.user)
+
+        response = client.post(
+            "/api/food-products/stock-alert/", {"days": 7}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.json()], [self.tracked.pk])
+        self.assertEqual(response.json()[0]["stock_status"], "LOW")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalCatalogTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.product = self.create_product(5)
+
+    def test_anonymous_revalidation_and_cache_hits_run_no_queries(self):
+        response = self.client.get("/api/products/")
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+            cached = self.client.get("/api/products/")
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(cached["X-Cache"], "HIT")
+        self.assertEqual(cached["ETag"], etag)
+
+    def test_a_write_changes_the_anonymous_etag(self):
+        etag = self.client.get("/api/products/")["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 12
+            self.product.save()
+
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_the_cache_is_dropped_only_once_the_write_committed(self):
+        etag = self.client.get("/api/products/")["ETag"]
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.price = 12
+            self.product.save()
+            # another request during the transaction still reads the old version
+            self.assertEqual(self.client.get("/api/products/")["ETag"], etag)
+        for callback in callbacks:
+            callback()
+
+        self.assertNotEqual(self.client.get("/api/products/")["ETag"], etag)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkStockUpdateTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.product = self.create_product(5)
+        self.food_product = self.create_food_product(5)
+        client = Client.objects.create(user=create_user(100, "CLIENT"))
+        self.cart = ShoppingCart.objects.get(client=client)
+
+    def add_to_cart(self, item, **kwargs):
+        field = "product" if isinstance(item, Product) else "food_product"
+        return CartItem.objects.create(
+            shopping_cart=self.cart, total_price=item.price, **{field: item}, **kwargs
+        )
+
+    def update_quantities(self, model, items, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_items(
+                model,
+                self.vendor,
+                [{"id": item.pk, "quantity": quantity} for item in items],
+            )
+
+    def test_sold_out_items_leave_the_carts_until_restocked(self):
+        line = self.add_to_cart(self.product)
+        food_line = self.add_to_cart(self.food_product)
+        ordered_line = self.add_to_cart(self.product, is_ordered=True)
+
+        self.update_quantities(Product, [self.product], 0)
+        self.update_quantities(FoodProduct, [self.food_product], 0)
+
+        line.refresh_from_db()
+        food_line.refresh_from_db()
+        ordered_line.refresh_from_db()
+        self.assertFalse(line.is_active)
+        self.assertFalse(food_line.is_active)
+        self.assertTrue(ordered_line.is_active)
+
+        self.update_quantities(Product, [self.product], 3)
+
+        line.refresh_from_db()
+        self.assertTrue(line.is_active)
+
+    def test_bulk_discounts_match_the_ones_save_computes(self):
+        prices = [(1, 3), (2, 3), (7, 9), (10, 8), (5, 5)]
+        products = [self.create_product(5) for _ in prices]
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_items(
+                Product,
+                self.vendor,
+                [
+                    {"id": product.pk, "price": price, "old_price": old_price}
+                    for product, (price, old_price) in zip(products, prices)
+                ],
+            )
+
+        for product in products:
+            product.refresh_from_db()
+            bulk_discount = product.discount_percentage
+            product.save()
+            product.refresh_from_db()
+            self.assertEqual(bulk_discount, product.discount_percentage)
+        self.assertEqual(
+            [product.discount_percentage for product in products], [67, 33, 22, 0, 0]
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IdempotencyKeyTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.product = self.create_product(5)
+        self.user = create_user(100, "CLIENT")
+        Client.objects.create(user=self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def add_to_cart(self):
+        return self.api.post(
+            "/api/cart-items/",
+            {"product": self.product.pk, "quantity": 1},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="cart-1",
+        )
+
+    # leaves the key and the cart as a request that died before answering would
+    def leave_pending(self, locked_until):
+        self.assertEqual(self.add_to_cart().status_code, 201)
+        CartItem.objects.all().delete()
+        IdempotencyKey.objects.filter(key="cart-1").update(
+            status_code=None, response=None, locked_until=locked_until
+        )
+
+    def test_pending_key_answers_conflict_while_locked(self):
+        self.leave_pending(timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(self.add_to_cart().status_code, 409)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_stale_pending_key_is_taken_over_by_a_retry(self):
+        self.leave_pending(timezone.now() - timedelta(seconds=1))
+
+        response = self.add_to_cart()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CartItem.objects.count(), 1)
+        record = IdempotencyKey.objects.get(key="cart-1")
+        self.assertEqual(record.status_code, 201)
+        self.assertEqual(self.add_to_cart()["Idempotent-Replayed"], "true")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogSearchTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+
+    # more matches than the old 500 ids cap of the index lookup
+    def test_search_paginates_over_every_match(self):
+        Product.objects.bulk_create(
+            [
+                Product(
+                    vendor=self.vendor,
+                    title=f"Trail runner {number}",
+                    sub_category=self.sub_category,
+                    price=10,
+                )
+                for number in range(505)
+            ]
+        )
+        rebuild_search_index()
+        best = self.create_product(5)
+        best.title = "Runner runner runner"
+        best.save()
+
+        url = "/api/products/list/?search=runner"
+        first_page = self.client.get(url).json()
+        last_page = self.client.get(f"{url}&page=26").json()
+
+        self.assertEqual(first_page["count"], 506)
+        self.assertEqual(first_page["results"][0]["id"], best.pk)
+        self.assertEqual(len(last_page["results"]), 6)
+
+    def test_only_a_new_vendor_title_reindexes_the_vendor_items(self):
+        products = [self.create_product(5) for _ in range(3)]
+        food_product = self.create_food_product(5)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.vendor.address = "another address"
+            self.vendor.save()
+        self.assertFalse(
+            [query for query in queries if "ecomapp_catalogsearch" in query["sql"]]
+        )
+
+        self.vendor.title = "Atlas outfitters"
+        self.vendor.save()
+
+        found = self.client.get("/api/products/list/?search=atlas").json()
+        self.assertCountEqual(
+            [row["id"] for row in found["results"]], [item.pk for item in products]
+        )
+        matches, _ = search_catalog(FoodProduct, "atlas")
+        self.assertEqual(
+            list(
+                FoodProduct.objects.filter(pk__in=matches).values_list("pk", flat=True)
+            ),
+            [food_product.pk],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(MarketplaceFixtures, TestCase):
+    url = "/api/products/list/"
+
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.products = [self.create_product(5) for _ in range(5)]
+        now = timezone.now()
+        for offset, product in enumerate(self.products):
+            Product.objects.filter(pk=product.pk).update(
+                created_at=now - timedelta(minutes=offset)
+            )
+
+    def page(self, url=None, **params):
+        response = self.client.get(
+            url or self.url, None if url else {"pagination": "cursor", **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, page):
+        return [row["id"] for row in page["results"]]
+
+    def walk(self, page_size):
+        page = self.page(page_size=page_size)
+        ids = self.ids(page)
+        while page["next"]:
+            page = self.page(page["next"])
+            ids += self.ids(page)
+        return ids, page
+
+    def test_next_and_previous_links_round_trip(self):
+        first = self.page(page_size=2)
+        second = self.page(first["next"])
+        back = self.page(second["previous"])
+
+        newest = [product.pk for product in self.products]
+        self.assertEqual(self.ids(first), newest[:2])
+        self.assertEqual(self.ids(second), newest[2:4])
+        self.assertEqual(self.ids(back), newest[:2])
+        self.assertIsNone(first["previous"])
+
+        ids, last = self.walk(2)
+        self.assertEqual(ids, newest)
+        self.assertIsNone(last["next"])
+
+    def test_equal_timestamps_are_ordered_by_id(self):
+        Product.objects.update(created_at=timezone.now())
+
+        ids, _ = self.walk(2)
+
+        self.assertEqual(
+            ids, sorted((product.pk for product in self.products), reverse=True)
+        )
+
+    def test_invalid_cursor_and_ordering_are_refused(self):
+        self.assertEqual(
+            self.client.get(self.url, {"cursor": "not-a-cursor"}).status_code, 404
+        )
+        response = self.client.get(
+            self.url, {"pagination": "cursor", "ordering": "price"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ordering", response.json())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogFacetsTests(MarketplaceFixtures, TestCase):
+    url = "/api/products/facets/"
+
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.create_product(5)
+        self.create_product(5, price=60)
+        # a sold out item saved through save() loops in the check_stock receiver
+        sold_out = self.create_product(5, price=75)
+        Product.objects.filter(pk=sold_out.pk).update(quantity=0, in_stock=False)
+
+    def test_counts_of_every_dimension(self):
+        facets = self.client.get(self.url).json()
+
+        self.assertEqual(facets["count"], 3)
+        self.assertEqual(facets["in_stock"], {"true": 2, "false": 1})
+        self.assertEqual(
+            facets["price"],
+            [
+                {"min_price": 0, "max_price": 50, "count": 1},
+                {"min_price": 50, "max_price": 100, "count": 2},
+            ],
+        )
+        self.assertEqual(
+            facets["sub_category"],
+            [{"id": self.sub_category.pk, "title": "Sub category", "count": 3}],
+        )
+        self.assertEqual(facets["city"], [{"value": "Casablanca", "count": 3}])
+
+        filtered = self.client.get(self.url, {"min_price": 50}).json()
+        self.assertEqual(filtered["count"], 2)
+        self.assertEqual(filtered["in_stock"], {"true": 1, "false": 1})
+
+    def test_an_item_write_drops_the_cached_counts(self):
+        self.assertEqual(self.client.get(self.url).json()["count"], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product(5)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).json()["count"], 4)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).json()["count"], 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogFieldsTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.product = self.create_product(5)
+
+    def first_row(self, **params):
+        response = self.client.get("/api/products/list/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"][0]
+
+    def test_fields_picks_the_fields(self):
+        self.assertEqual(
+            self.first_row(fields="id, title,price"),
+            {"id": self.product.pk, "title": "Product", "price": "10.00"},
+        )
+
+    def test_card_mode_sends_the_card_fields_with_a_vendor_id(self):
+        row = self.first_row(mode="card")
+
+        self.assertEqual(set(row), set(ProductSerializer.card_fields))
+        self.assertEqual(row["vendor"], self.vendor.pk)
+
+    def test_expand_embeds_the_relations(self):
+        row = self.first_row(
+            fields="id,vendor,sub_category", expand="vendor,sub_category"
+        )
+
+        self.assertEqual(set(row), {"id", "vendor", "sub_category"})
+        self.assertEqual(row["vendor"]["vid"], self.vendor.vid)
+        self.assertEqual(row["sub_category"]["title"], "Sub category")
+
+        row = self.first_row(fields="id,vendor,sub_category")
+        self.assertEqual(row["vendor"], self.vendor.pk)
+        self.assertEqual(row["sub_category"], self.sub_category.pk)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VendorCounterTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.other_vendor = Vendor.objects.create(
+            user=create_user(2, "VENDOR"),
+            title="Other vendor",
+            address="address",
+            city=self.vendor.city,
+            field="Products",
+        )
+
+    def counters(self):
+        return list(
+            Vendor.objects.order_by("pk").values_list("products_count", "total_sold")
+        )
+
+    def test_item_and_order_transitions_move_the_counters(self):
+        product = self.create_product(5)
+        self.create_product(5)
+        self.create_food_product(5)
+        self.assertEqual(self.counters(), [(3, 0), (0, 0)])
+
+        product.is_active = False
+        product.save()
+        self.assertEqual(self.counters(), [(2, 0), (0, 0)])
+        product.is_active = True
+        product.vendor = self.other_vendor
+        product.save()
+        self.assertEqual(self.counters(), [(2, 0), (1, 0)])
+        product.delete()
+        self.assertEqual(self.counters(), [(2, 0), (0, 0)])
+
+        order = self.create_order([(self.create_product(5), 1, None)])
+        confirm(order)
+        transition_order(order, order_status="delivered")
+        self.assertEqual(self.counters(), [(3, 1), (0, 0)])
+        transition_order(order, order_status="confirmed")
+        self.assertEqual(self.counters(), [(3, 0), (0, 0)])
+
+        incremental = self.counters()
+        Vendor.objects.update(products_count=0, total_sold=7)
+        call_command("reconcile_vendor_counters", stdout=StringIO())
+        self.assertEqual(self.counters(), incremental)
+
+    def test_counters_never_go_below_zero(self):
+        increment_vendor_counters(self.vendor.pk, products_count=-2, total_sold=-1)
+
+        self.assertEqual(self.counters()[0], (0, 0))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VendorExportTests(MarketplaceFixtures, TestCase):
+    url = "/api/exports/products/"
+
+    def setUp(self):
+        self.create_catalog()
+        self.products = [self.create_product(5, title=f"Item {n}") for n in range(3)]
+        Product.objects.filter(pk=self.products[0].pk).update(
+            updated_at=timezone.now() - timedelta(days=10)
+        )
+        other_vendor = Vendor.objects.create(
+            user=create_user(2, "VENDOR"),
+            title="Other vendor",
+            address="address",
+            city=self.vendor.city,
+            field="Products",
+        )
+        Product.objects.create(
+            vendor=other_vendor,
+            title="Not mine",
+            sub_category=self.sub_category,
+            price=1,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.vendor.user)
+
+    def export(self, **params):
+        response = self.api.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_csv_streams_the_vendor_rows(self):
+        response, content = self.export()
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(list(rows[0]), export_columns("products"))
+        self.assertEqual(
+            [(row["id"], row["title"]) for row in rows],
+            [(str(product.pk), product.title) for product in self.products],
+        )
+
+    def test_jsonl_and_since(self):
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response, content = self.export(export_format="jsonl", since=since)
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [row["id"] for row in rows], [product.pk for product in self.products[1:]]
+        )
+        self.assertEqual(rows[0]["price"], "10.00")
+
+    def test_invalid_parameters_are_refused(self):
+        self.assertEqual(
+            self.api.get(self.url, {"export_format": "xml"}).status_code, 400
+        )
+        self.assertEqual(
+            self.api.get(self.url, {"since": "yesterday"}).status_code, 400
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogFeedTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.product = self.create_product(5, title="Trail shoe")
+        self.expensive_product = self.create_product(
+            5, title="Runner runner shoe", price=30
+        )
+        self.food_product = self.create_food_product(5, title="Runner bar")
+        self.expensive_food_product = self.create_food_product(
+            5, title="Honey jar", price=20
+        )
+
+    def feed(self, **params):
+        return self.client.get("/api/catalog/feed/", params)
+
+    def rows(self, **params):
+        return [
+            (row["kind"], row["id"]) for row in self.feed(**params).json()["results"]
+        ]
+
+    def test_both_kinds_are_ordered_together(self):
+        self.assertEqual(
+            self.rows(ordering="price"),
+            [
+                ("food_product", self.food_product.pk),
+                ("product", self.product.pk),
+                ("food_product", self.expensive_food_product.pk),
+                ("product", self.expensive_product.pk),
+            ],
+        )
+        self.assertEqual(
+            self.rows(ordering="-price")[0], ("product", self.expensive_product.pk)
+        )
+
+    def test_kind_and_filters_apply_to_each_side(self):
+        self.assertEqual(
+            self.rows(kind="food_product", ordering="price"),
+            [
+                ("food_product", self.food_product.pk),
+                ("food_product", self.expensive_food_product.pk),
+            ],
+        )
+        self.assertEqual(
+            self.rows(min_price=15, ordering="price"),
+            [
+                ("food_product", self.expensive_food_product.pk),
+                ("product", self.expensive_product.pk),
+            ],
+        )
+        self.assertEqual(self.feed(kind="service").status_code, 400)
+
+    def test_a_search_is_ordered_by_rank_unless_an_ordering_is_sent(self):
+        self.assertEqual(
+            self.rows(search="runner"),
+            [
+                ("product", self.expensive_product.pk),
+                ("food_product", self.food_product.pk),
+            ],
+        )
+        self.assertEqual(
+            self.rows(search="runner", ordering="price"),
+            [
+                ("food_product", self.food_product.pk),
+                ("product", self.expensive_product.pk),
+            ],
+        )
+
+    def test_cursor_pagination_is_refused(self):
+        response = self.feed(pagination="cursor")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("pagination", response.json())
+
+
+class UnreachableEmailBackend(BaseEmailBackend):
+    def open(self):
+        raise OSError("connection refused")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.emails = [
+            OutgoingEmail.objects.create(
+                to=f"user{number}@example.com",
+                subject="Hello",
+                body="body",
+                from_email="shop@example.com",
+            )
+            for number in range(2)
+        ]
+
+    def drain(self):
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        drain_outbox()
+
+    def test_pending_emails_are_sent(self):
+        drain_outbox()
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            OutgoingEmail.objects.filter(status=EmailStatus.SENT).count(), 2
+        )
+
+    @override_settings(EMAIL_BACKEND="ecomapp.tests.UnreachableEmailBackend")
+    def test_unreachable_server_counts_against_every_email(self):
+        with self.assertRaises(OSError):
+            drain_outbox()
+        email = OutgoingEmail.objects.get(pk=self.emails[0].pk)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.status, EmailStatus.PENDING)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        for _ in range(EMAIL_MAX_ATTEMPTS - 1):
+            with self.assertRaises(OSError):
+                self.drain()
+
+        self.assertEqual(
+            OutgoingEmail.objects.filter(
+                status=EmailStatus.FAILED, attempts=EMAIL_MAX_ATTEMPTS
+            ).count(),
+            2,
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductImportTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.api = APIClient()
+        self.api.force_authenticate(self.vendor.user)
+
+    def upload(self, content, name="products.csv"):
+        return self.api.post(
+            "/api/products/import/",
+            {"file": SimpleUploadedFile(name, content)},
+            format="multipart",
+        )
+
+    def test_files_that_are_not_utf8_are_refused_before_any_row(self):
+        rows = [
+            f"Product {number},{self.sub_category.pk},a.jpg,10,5"
+            for number in range(300)
+        ]
+        content = "title,sub_category,image,price,quantity\n" + "\n".join(rows)
+        response = self.upload((content + "\nCafé,1,a.jpg,10,5\n").encode("latin-1"))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("utf-8", str(response.data))
+        self.assertFalse(Product.objects.exists())
+
+    def test_rows_with_an_image_that_was_not_uploaded_fail(self):
+        content = f"title,sub_category,image,price,quantity\nProduct,{self.sub_category.pk},missing/a.jpg,10,5\n"
+        response = self.upload(content.encode())
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["failed"], 1)
+        self.assertIn("image", response.data["errors"][0]["errors"])
+        self.assertFalse(Product.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TrendingTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.products = [self.create_product(5) for _ in range(3)]
+        content_type = ContentType.objects.get_for_model(Product)
+        TrendingScore.objects.bulk_create(
+            [
+                TrendingScore(
+                    content_type=content_type, object_id=product.pk, score=score
+                )
+                for product, score in zip(self.products, [30, 20, 10])
+            ]
+        )
+
+    def test_inactive_items_do_not_take_the_top_slots(self):
+        self.products[0].is_active = False
+        self.products[0].save()
+
+        response = self.client.get("/api/products/trending/", {"limit": 2})
+
+        self.assertEqual(
+            [row["id"] for row in response.json()],
+            [self.products[1].pk, self.products[2].pk],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SalesRollupTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.product = self.create_product(20)
+        self.food_product = self.create_food_product(20)
+
+    def deliver(self, lines):
+        order = self.create_order(lines)
+        CartOrder.objects.filter(pk=order.pk).update(
+            total_payed=sum(item.price * quantity for item, quantity, _ in lines)
+        )
+        order.refresh_from_db()
+        confirm(order)
+        transition_order(order, order_status="delivered")
+        return order
+
+    def rollup(self):
+        return (
+            list(
+                VendorDailyOrders.objects.values_list(
+                    "date", "orders", "revenue"
+                ).order_by("date")
+            ),
+            list(
+                VendorDailySales.objects.values_list(
+                    "content_type_id", "object_id", "quantity", "orders", "revenue"
+                ).order_by("content_type_id", "object_id")
+            ),
+        )
+
+    def test_delivered_orders_are_added_to_the_rollups(self):
+        self.deliver([(self.product, 2, None), (self.food_product, 1, None)])
+        self.deliver([(self.product, 1, None)])
+
+        orders, sales = self.rollup()
+        self.assertEqual(orders, [(timezone.localdate(), 2, 35)])
+        product_type = ContentType.objects.get_for_model(Product)
+        food_type = ContentType.objects.get_for_model(FoodProduct)
+        self.assertCountEqual(
+            sales,
+            [
+                (product_type.pk, self.product.pk, 3, 2, 30),
+                (food_type.pk, self.food_product.pk, 1, 1, 5),
+            ],
+        )
+
+    def test_an_order_leaving_delivered_is_taken_back(self):
+        kept = self.deliver([(self.product, 1, None)])
+        order = self.deliver([(self.product, 2, None), (self.food_product, 1, None)])
+
+        transition_order(order, order_status="confirmed")
+
+        orders, sales = self.rollup()
+        self.assertEqual(orders, [(timezone.localdate(), 1, 10)])
+        self.assertEqual(
+            sales,
+            [
+                (
+                    ContentType.objects.get_for_model(Product).pk,
+                    self.product.pk,
+                    1,
+                    1,
+                    10,
+                )
+            ],
+        )
+
+        transition_order(kept, order_status="confirmed")
+        self.assertEqual(self.rollup(), ([], []))
+
+    def test_the_backfill_rebuilds_the_same_rows(self):
+        self.deliver([(self.product, 2, None), (self.food_product, 1, None)])
+        order = self.deliver([(self.product, 1, None)])
+        self.deliver([(self.food_product, 3, None)])
+        transition_order(order, order_status="confirmed")
+        incremental = self.rollup()
+
+        VendorDailySales.objects.update(quantity=0)
+        rebuild_vendor_sales(vendor_ids=[self.vendor.pk])
+
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_sales_over_time_buckets_and_fills_the_gaps(self):
+        VendorDailyOrders.objects.bulk_create(
+            [
+                VendorDailyOrders(
+                    vendor=self.vendor, date=day, orders=orders, revenue=revenue
+                )
+                for day, orders, revenue in [
+                    (date(2026, 1, 5), 2, 100),
+                    (date(2026, 1, 7), 1, 50),
+                    (date(2026, 1, 13), 1, 20),
+                    (date(2026, 2, 2), 3, 90),
+                ]
+            ]
+        )
+
+        def series(start, end, granularity):
+            return [
+                (row["date"], row["orders"], row["total_payed"], row["total_earned"])
+                for row in get_sales_over_time(
+                    self.vendor, start, end, granularity, fee=5
+                )
+            ]
+
+        self.assertEqual(
+            series(date(2026, 1, 5), date(2026, 1, 8), "day"),
+            [
+                (date(2026, 1, 5), 2, 100, 90),
+                (date(2026, 1, 6), 0, 0, 0),
+                (date(2026, 1, 7), 1, 50, 45),
+                (date(2026, 1, 8), 0, 0, 0),
+            ],
+        )
+        # a window starting mid week is reported from the monday of that week
+        self.assertEqual(
+            series(date(2026, 1, 7), date(2026, 1, 20), "week"),
+            [
+                (date(2026, 1, 5), 1, 50, 45),
+                (date(2026, 1, 12), 1, 20, 15),
+                (date(2026, 1, 19), 0, 0, 0),
+            ],
+        )
+        self.assertEqual(
+            series(date(2026, 1, 1), date(2026, 3, 31), "month"),
+            [
+                (date(2026, 1, 1), 4, 170, 150),
+                (date(2026, 2, 1), 3, 90, 75),
+                (date(2026, 3, 1), 0, 0, 0),
+            ],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CheckoutTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.vendors = [self.vendor] + [
+            Vendor.objects.create(
+                user=create_user(2 + number, "VENDOR"),
+                title=f"Vendor {number}",
+                address="address",
+                city=self.vendor.city,
+                field="Products",
+            )
+            for number in range(2)
+        ]
+        ContentType.objects.get_for_models(Product, FoodProduct, CartOrder)
+
+    def checkout(self, number, vendors, lines_per_vendor):
+        user = create_user(number, "CLIENT")
+        client = Client.objects.create(user=user, city=self.vendor.city)
+        cart = ShoppingCart.objects.get(client=client)
+        for vendor in vendors:
+            for _ in range(lines_per_vendor):
+                product = Product.objects.create(
+                    vendor=vendor,
+                    title="Product",
+                    sub_category=self.sub_category,
+                    price=10,
+                    quantity=5,
+                )
+                CartItem.objects.create(
+                    shopping_cart=cart, product=product, quantity=1, total_price=10
+                )
+        api = APIClient()
+        api.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = api.post(
+                "/api/global-orders/", {"address": "address"}, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+        return client, len(queries)
+
+    def test_queries_do_not_grow_with_the_lines_or_the_vendors(self):
+        _, small = self.checkout(100, self.vendors[:1], 1)
+        client, large = self.checkout(101, self.vendors, 4)
+
+        self.assertEqual(small, large)
+        self.assertEqual(CartOrder.objects.filter(client=client).count(), 3)
+        self.assertEqual(CartOrderItem.objects.filter(order__client=client).count(), 12)
+
+    def test_the_orders_are_announced_once_committed(self):
+        # the task body runs in process instead of going through the broker
+        with mock.patch.object(
+            notify_new_orders, "delay", side_effect=notify_new_orders
+        ) as delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                client, _ = self.checkout(100, self.vendors[:2], 1)
+            delay.assert_not_called()
+            self.assertFalse(Notification.objects.exists())
+
+            with self.captureOnCommitCallbacks():
+                for callback in callbacks:
+                    callback()
+
+        orders = CartOrder.objects.filter(client=client).order_by("pk")
+        delay.assert_called_once_with([order.pk for order in orders])
+        self.assertEqual(
+            set(Notification.objects.values_list("user_id", "object_id")),
+            {(order.vendor.user_id, order.pk) for order in orders}
+            | {(client.user_id, order.pk) for order in orders},
+        )
+        self.assertEqual(OutgoingEmail.objects.count(), 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class NotificationFanOutTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.users = [create_user(10 + number, "CLIENT") for number in range(5)]
+
+    def test_notifications_are_inserted_in_chunks_with_their_emails(self):
+        notifications = notifications_for(
+            [user.pk for user in self.users],
+            "A new order has been placed",
+            self.vendor,
+            NotificationType.ORDER,
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as queries:
+                count = fan_out(notifications, batch_size=2)
+
+        self.assertEqual(count, 5)
+        inserts = [
+            query
+            for query in queries
+            if query["sql"].startswith('INSERT INTO "ecomapp_notification"')
+        ]
+        self.assertEqual(len(inserts), 3)
+        # one wake up of the outbox worker per chunk
+        self.assertEqual(len(callbacks), 3)
+
+        self.assertEqual(
+            sorted(Notification.objects.values_list("user_id", "object_id")),
+            [(user.pk, self.vendor.pk) for user in self.users],
+        )
+        self.assertEqual(
+            sorted(
+                OutgoingEmail.objects.values_list("to", "subject", "body", "status")
+            ),
+            [
+                (
+                    user.email,
+                    f"Hello, {user.get_full_name()}",
+                    "A new order has been placed",
+                    EmailStatus.PENDING,
+                )
+                for user in self.users
+            ],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImageVariantTests(MarketplaceFixtures, TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.create_catalog()
+        self.product = self.create_product(5)
+
+    def upload(self, name):
+        buffer = BytesIO()
+        PILImage.new("RGB", (400, 300), (200, 30, 30)).save(buffer, "PNG")
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def render(self, image):
+        Product.objects.filter(pk=self.product.pk).update(image=image)
+        build_image_variants("ecomapp.Product", self.product.pk)
+        self.product.refresh_from_db()
+        return variant_files(self.product.image_variants)
+
+    def test_a_new_image_removes_the_previous_variant_files(self):
+        first = self.render(self.upload("products/first.png"))
+        self.assertEqual(len(first), 4)
+        self.assertTrue(all(default_storage.exists(path) for path in first))
+
+        second = self.render(self.upload("products/second.png"))
+
+        self.assertFalse(first & second)
+        self.assertFalse(any(default_storage.exists(path) for path in first))
+        self.assertTrue(all(default_storage.exists(path) for path in second))
+
+    def test_rendering_the_same_image_again_keeps_its_files(self):
+        image = self.upload("products/first.png")
+        first = self.render(image)
+
+        self.assertEqual(self.render(image), first)
+        self.assertTrue(all(default_storage.exists(path) for path in first))
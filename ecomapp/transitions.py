@@ -0,0 +1,158 @@
+from django.db import transaction
+from django.utils import timezone
+from .models import CartOrder, CartOrderItem, ClaimedOrder, ClientStrike
+from .inventory import (
+    STOCK_RESERVED_STATUSES,
+    active_order_items,
+    invalidate_stock_caches,
+    release_stock,
+    reserve_order_stock,
+)
+from .counters import increment_vendor_counters, transition_delta
+from .sales import record_order_sales
+from .forecasting import invalidate_stock_forecast
+from .response_cache import invalidate_response_cache
+from .tasks import notify_order_canceled, notify_order_ready
+
+ORDER_STATE_FIELDS = [
+    "order_status",
+    "is_canceled",
+    "is_active",
+    "delivery_option",
+    "stock_reserved",
+]
+
+
+class OrderTransition:
+    def __init__(self, order, previous, changes):
+        self.order = order
+        self.previous = previous
+        self.changed = set(changes)
+        self.canceled_by = None
+        self.effects = []
+
+    def was(self, field, value):
+        return self.previous[field] == value
+
+    def on_commit(self, task, *args):
+        self.effects.append((task, args))
+
+
+def reserve_stock(transition):
+    order = transition.order
+    if not order.stock_reserved and order.order_status in STOCK_RESERVED_STATUSES:
+        if reserve_order_stock(order):
+            invalidate_stock_caches(order.vendor_id)
+
+
+def deactivate_canceled_order(transition):
+    order = transition.order
+    if not transition.was("is_active", True):
+        return
+    if order.is_canceled:
+        transition.canceled_by = "client"
+    elif order.order_status == "canceled":
+        transition.canceled_by = "vendor"
+    if transition.canceled_by:
+        order.is_active = False
+        transition.changed.add("is_active")
+
+
+def save_order(transition):
+    transition.order.save(update_fields=sorted(transition.changed | {"updated_at"}))
+
+
+def cancel_order_items(transition):
+    order = transition.order
+    if not transition.canceled_by:
+        return
+
+    items = list(active_order_items(order))
+    if items and order.stock_reserved:
+        release_stock(items)
+        invalidate_stock_caches(order.vendor_id)
+    canceled_field = (
+        "is_canceled" if transition.canceled_by == "client" else "is_canceled_by_vendor"
+    )
+    CartOrderItem.objects.filter(pk__in=[item.pk for item in items]).update(
+        is_active=False, updated_at=timezone.now(), **{canceled_field: True}
+    )
+    invalidate_response_cache(CartOrderItem)
+
+    if transition.canceled_by == "client":
+        ClientStrike.objects.create(
+            client_id=order.client_id, reason="You have canceled an order"
+        )
+
+    claimed_order = (
+        order.claimed_orders.filter(is_failed=False)
+        .exclude(delivery_status="delivered")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if claimed_order:
+        ClaimedOrder.objects.filter(pk=claimed_order).update(
+            delivery_status="canceled", updated_at=timezone.now()
+        )
+        invalidate_response_cache(ClaimedOrder)
+    transition.on_commit(
+        notify_order_canceled, order.pk, claimed_order, transition.canceled_by
+    )
+
+
+def count_delivered_order(transition):
+    order = transition.order
+    delta = transition_delta(
+        transition.was("order_status", "delivered"), order.order_status == "delivered"
+    )
+    increment_vendor_counters(order.vendor_id, total_sold=delta)
+    if delta:
+        record_order_sales(order, sign=delta)
+        invalidate_stock_forecast(order.vendor_id)
+
+
+def announce_ready_order(transition):
+    order = transition.order
+    if not (
+        order.delivery_option and order.order_status == "confirmed" and order.is_active
+    ):
+        return
+    if transition.was("order_status", "confirmed") and transition.was(
+        "delivery_option", True
+    ):
+        return
+    if not order.claimed_orders.filter(is_failed=False).exists():
+        transition.on_commit(notify_order_ready, order.pk)
+
+
+# the handlers run in this order inside one transaction, stock is taken before
+# the order is saved so an oversold order is never written
+ORDER_TRANSITION_HANDLERS = [
+    reserve_stock,
+    deactivate_canceled_order,
+    save_order,
+    cancel_order_items,
+    count_delivered_order,
+    announce_ready_order,
+]
+
+
+# every change of an existing order goes through here instead of order.save(),
+# the previous state is read once and notifications wait for the commit
+def transition_order(order, **changes):
+    with transaction.atomic():
+        previous = (
+            CartOrder.objects.select_for_update()
+            .values(*ORDER_STATE_FIELDS)
+            .get(pk=order.pk)
+        )
+        for field, value in changes.items():
+            setattr(order, field, value)
+
+        transition = OrderTransition(order, previous, changes)
+        for handler in ORDER_TRANSITION_HANDLERS:
+            handler(transition)
+
+        for task, args in transition.effects:
+            transaction.on_commit(lambda task=task, args=args: task.delay(*args))
+    return order
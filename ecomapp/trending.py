@@ -0,0 +1,105 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from .models import TrendingScore, CartOrder, CartOrderItem, Product, FoodProduct
+
+TRENDING_HALF_LIFE = timedelta(days=7)
+
+# scores that decayed below this are dropped from the table
+TRENDING_MIN_SCORE = 0.01
+
+
+def decay(age):
+    return 0.5 ** (age / TRENDING_HALF_LIFE)
+
+
+def get_trending_ids(model, city=None, limit=10):
+    # inactive items are left out here so they never take one of the limit slots
+    scores = TrendingScore.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id__in=model.objects.filter(is_active=True).values("pk"),
+    )
+    if city:
+        scores = scores.filter(city__iexact=city)
+    return list(scores.order_by("-score").values_list("object_id", flat=True)[:limit])
+
+
+def collect_delivered_items(order_ids, now):
+    items = CartOrderItem.objects.filter(order_id__in=order_ids).values_list(
+        "cart_item__product_id",
+        "cart_item__food_product_id",
+        "cart_item__quantity",
+        "order__vendor__city",
+        "order__updated_at",
+    )
+    content_types = {
+        "product": ContentType.objects.get_for_model(Product),
+        "food_product": ContentType.objects.get_for_model(FoodProduct),
+    }
+    collected = defaultdict(lambda: {"score": 0.0, "quantity": 0, "city": ""})
+    for product_id, food_product_id, quantity, city, delivered_at in items:
+        if product_id:
+            key = (content_types["product"].pk, product_id)
+        elif food_product_id:
+            key = (content_types["food_product"].pk, food_product_id)
+        else:
+            continue
+        # the order was delivered at most one refresh ago, its last update is
+        # the closest timestamp we have for the delivery
+        collected[key]["score"] += quantity * decay(now - delivered_at)
+        collected[key]["quantity"] += quantity
+        collected[key]["city"] = city or ""
+    return collected
+
+
+def refresh_trending_scores(now=None):
+    now = now or timezone.now()
+    with transaction.atomic():
+        # every row shares the same scored_at, so decaying is a single update
+        last_scored_at = TrendingScore.objects.aggregate(last=Max("scored_at"))["last"]
+        if last_scored_at:
+            TrendingScore.objects.update(
+                score=F("score") * decay(now - last_scored_at), scored_at=now
+            )
+            TrendingScore.objects.filter(score__lt=TRENDING_MIN_SCORE).delete()
+
+        order_ids = list(
+            CartOrder.objects.select_for_update()
+            .filter(order_status="delivered", counted_in_trending=False)
+            .values_list("id", flat=True)
+        )
+        if not order_ids:
+            return 0
+
+        collected = collect_delivered_items(order_ids, now)
+        existing = {
+            (score.content_type_id, score.object_id): score
+            for score in TrendingScore.objects.filter(
+                object_id__in={object_id for _, object_id in collected}
+            )
+        }
+        to_update, to_create = [], []
+        for (content_type_id, object_id), values in collected.items():
+            score = existing.get((content_type_id, object_id))
+            if score is None:
+                to_create.append(
+                    TrendingScore(
+                        content_type_id=content_type_id,
+                        object_id=object_id,
+                        scored_at=now,
+                        **values,
+                    )
+                )
+                continue
+            score.score += values["score"]
+            score.quantity += values["quantity"]
+            score.city = values["city"]
+            to_update.append(score)
+
+        TrendingScore.objects.bulk_create(to_create)
+        TrendingScore.objects.bulk_update(to_update, ["score", "quantity", "city"])
+        CartOrder.objects.filter(id__in=order_ids).update(counted_in_trending=True)
+    return len(order_ids)
@@ -33,6 +33,12 @@ from .views import (
     ProductSizeView,
     CartItemListAPIView,
     AIProductAssistantAPIView,
+    ProductFacetsAPIView,
+    FoodProductFacetsAPIView,
+    ResponseCacheStatsAPIView,
+    CategoryTreeAPIView,
+    CatalogFeedAPIView,
+    VendorExportAPIView,
 )
 
 from userauths.views import (
@@ -100,6 +106,14 @@ urlpatterns = [
         FoodProductListAPIView.as_view(),
         name="food-product-list-filtered",
     ),
+    path(
+        "products/facets/", ProductFacetsAPIView.as_view(), name="product-facets"
+    ),
+    path(
+        "food-products/facets/",
+        FoodProductFacetsAPIView.as_view(),
+        name="food-product-facets",
+    ),
     path("cart-items/list/", CartItemListAPIView.as_view(), name="cart-items-filtered"),
     path(
         "categories/list/", CategoryListAPIView.as_view(), name="category-list-filtered"
@@ -109,6 +123,33 @@ urlpatterns = [
         SubCategoryListAPIView.as_view(),
         name="sub-category-list-filtered",
     ),
+    path("catalog/feed/", CatalogFeedAPIView.as_view(), name="catalog-feed"),
+    path("category-tree/", CategoryTreeAPIView.as_view(), name="category-tree"),
+    path(
+        "exports/products/",
+        VendorExportAPIView.as_view(export_name="products"),
+        name="export-products",
+    ),
+    path(
+        "exports/food-products/",
+        VendorExportAPIView.as_view(export_name="food-products"),
+        name="export-food-products",
+    ),
+    path(
+        "exports/orders/",
+        VendorExportAPIView.as_view(export_name="orders"),
+        name="export-orders",
+    ),
+    path(
+        "exports/order-items/",
+        VendorExportAPIView.as_view(export_name="order-items"),
+        name="export-order-items",
+    ),
+    path(
+        "response-cache/stats/",
+        ResponseCacheStatsAPIView.as_view(),
+        name="response-cache-stats",
+    ),
     path(
         "aiProductAssistant/",
         AIProductAssistantAPIView.as_view(),
@@ -31,8 +31,10 @@ from .serializers import (
     AiMessageSerializer,
     TopProductSerializer,
     SalesOverTimeSerializer,
+    FoodStockAlertSerializer,
     TopFoodProductsSerializer,
     StockAlertSerializer,
+    CatalogFeedSerializer,
 )
 from collections import defaultdict
 from rest_framework import viewsets, permissions, status
@@ -59,6 +61,10 @@ from .filters import (
     SubCategoryFilter,
     ProductPagination,
     CartItemFilter,
+    ProductKeysetPagination,
+    NotificationKeysetPagination,
+    CartOrderKeysetPagination,
+    CatalogSearchFilter,
 )
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, filters as drf_filters
@@ -73,11 +79,160 @@ from django.db.models import (
     Subquery,
     OuterRef,
     FloatField,
+    Prefetch,
+    CharField,
 )
 from rest_framework.permissions import IsAuthenticated
+from django.core.cache import cache
+from .facets import facets_cache_key, get_catalog_facets, FACETS_CACHE_TIMEOUT
+from .response_cache import AnonymousCacheMixin, get_response_cache_stats
+from .conditional import ConditionalGetMixin
+from .sales import (
+    SALES_GRANULARITIES,
+    get_order_totals,
+    get_top_items,
+    get_category_sales,
+    get_sales_over_time,
+)
+from .category_tree import get_category_tree, with_image_urls
+from .trending import get_trending_ids
+from .forecasting import get_stock_forecast
+from .imports import IMPORT_FORMATS, import_products
+from .bulk_updates import BulkItemUpdateSerializer, bulk_update_items
+from .checkout import load_cart_items, place_orders
+from .idempotency import IdempotentMixin
+from .exports import EXPORT_FORMATS, export_columns, export_rows, stream_export
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+
+CATALOG_PREFETCHES = {
+    "images": "images",
+    "tags": "tags",
+    "reviews": "reviews",
+    "color_list": "colors",
+    "sizes": "sizes",
+}
+
+CATALOG_TIMESTAMP_FIELDS = [
+    "updated_at",
+    "vendor__updated_at",
+    "vendor__user__updated_at",
+    "sub_category__updated_at",
+    "sub_category__category__updated_at",
+    "sub_category__category__sector__updated_at",
+]
+
+CATALOG_LARGE_TEXT_FIELDS = [
+    "specifications",
+    "details",
+    "long_description",
+    "ingredients",
+]
+
+
+# fields=None loads everything the full serializer needs, otherwise only what
+# the requested fields use and the large text columns are deferred
+def catalog_queryset(model, fields=None):
+    queryset = (
+        model.objects.select_related("sub_category__category__sector", "vendor__user")
+        .prefetch_related("vendor__rating_summaries")
+        .with_review_stats()
+    )
 
+    for field, lookup in CATALOG_PREFETCHES.items():
+        if not hasattr(model, lookup) or (fields is not None and field not in fields):
+            continue
+        if lookup == "reviews":
+            lookup = Prefetch(
+                "reviews",
+                queryset=ProductReview.objects.select_related(
+                    "client__user", "content_type"
+                ),
+            )
+        queryset = queryset.prefetch_related(lookup)
+
+    if fields is not None:
+        queryset = queryset.defer(
+            *[
+                field.name
+                for field in model._meta.concrete_fields
+                if field.name in CATALOG_LARGE_TEXT_FIELDS and field.name not in fields
+            ]
+        )
+    return queryset
+
+
+def trending_items(model, request, fields=None):
+    try:
+        limit = min(max(int(request.query_params.get("limit", 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    ids = get_trending_ids(model, request.query_params.get("city"), limit)
+    items = catalog_queryset(model, fields).filter(pk__in=ids, is_active=True)
+    return sorted(items, key=lambda item: ids.index(item.pk))
+
+
+SIZE_FORECAST_FIELDS = [
+    "size",
+    "quantity",
+    "smoothed_demand",
+    "days_left",
+    "reorder_point",
+    "needs_reorder",
+]
+
+
+def stock_alert_items(model, vendor, days, limit):
+    kind = model._meta.model_name
+    forecast = [row for row in get_stock_forecast(vendor, days) if row["kind"] == kind]
+    sizes = {}
+    for row in forecast:
+        if row["size"]:
+            sizes.setdefault(row["id"], []).append(
+                {key: row[key] for key in SIZE_FORECAST_FIELDS}
+            )
 
-class SectorViewSet(viewsets.ModelViewSet):
+    rows = sorted(
+        [row for row in forecast if row["size"] is None],
+        key=lambda row: row["total_sold"],
+        reverse=True,
+    )[:limit]
+    items = model.objects.in_bulk([row["id"] for row in rows])
+    alerts = []
+    for row in rows:
+        item = items.get(row["id"])
+        if item is None:
+            continue
+        for key, value in row.items():
+            if key not in ["kind", "id", "size", "quantity"]:
+                setattr(item, key, value)
+        item.size_forecasts = sizes.get(item.pk, [])
+        alerts.append(item)
+    return alerts
+
+
+def import_format(file_name):
+    extension = os.path.splitext(file_name or "")[1].lower().lstrip(".")
+    return "jsonl" if extension in ["jsonl", "ndjson"] else extension
+
+
+def bulk_update_response(request, model):
+    user = request.user
+    if not hasattr(user, "vendor"):
+        raise ValidationError("only vendors can update their items in bulk")
+
+    vendor = user.vendor
+    if vendor.is_banned:
+        raise ValidationError("This vendor is banned")
+
+    serializer = BulkItemUpdateSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    report = bulk_update_items(model, vendor, serializer.validated_data["items"])
+    return Response(report)
+
+
+class SectorViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
+    cache_group = "sector"
     queryset = Sector.objects.all()
     serializer_class = SectorSerializer
     parser_classes = [MultiPartParser, FormParser]
@@ -95,8 +250,10 @@ class SectorViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+class CategoryViewSet(ConditionalGetMixin, AnonymousCacheMixin, viewsets.ModelViewSet):
+    cache_group = "category"
+    conditional_timestamp_fields = ["updated_at", "sector__updated_at"]
+    queryset = Category.objects.select_related("sector")
     serializer_class = CategorySerializer
     parser_classes = [MultiPartParser, FormParser]
 
@@ -125,11 +282,17 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return instance.delete()
 
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductViewSet(ConditionalGetMixin, AnonymousCacheMixin, viewsets.ModelViewSet):
+    cache_group = "product"
+    conditional_timestamp_fields = CATALOG_TIMESTAMP_FIELDS
+    queryset = catalog_queryset(Product)
     serializer_class = ProductSerializer
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
+    def get_queryset(self):
+        fields = self.get_serializer_class().get_requested_fields(self.request)
+        return catalog_queryset(Product, fields)
+
     @action(
         detail=False,
         methods=["get"],
@@ -138,26 +301,62 @@ class ProductViewSet(viewsets.ModelViewSet):
         authentication_classes=[],
     )
     def trending_products(self, request):
-        trending_product = (
-            Product.objects.filter(
-                cart_items__cart_order_items__order__order_status="delivered"
-            )
-            .annotate(
-                total_quantity_sold=Sum(
-                    "cart_items__quantity",
-                    filter=Q(
-                        cart_items__cart_order_items__order__order_status="delivered"
-                    ),
-                )
-            )
-            .order_by("-total_quantity_sold")[:10]
-        )
+        fields = self.get_serializer_class().get_requested_fields(request)
+        trending_product = trending_items(Product, request, fields)
 
         serializer = self.get_serializer(
             trending_product, many=True, context={"request": request}
         )
         return Response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        permission_classes=[IsAuthenticated],
+        parser_classes=[MultiPartParser],
+    )
+    def bulk_import(self, request):
+        user = request.user
+        if not hasattr(user, "vendor"):
+            raise ValidationError("only vendors can import products")
+
+        vendor = user.vendor
+        if vendor.is_banned:
+            raise ValidationError("This vendor is banned")
+
+        if vendor.field == "Food_Products":
+            raise ValidationError(
+                "this endpoint is for products and the vendor publishes food products"
+            )
+
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError("a csv or jsonl file must be sent as 'file'")
+
+        file_format = request.data.get("format") or import_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            raise ValidationError(f"format must be one of {', '.join(IMPORT_FORMATS)}")
+
+        report = import_products(vendor, upload, file_format)
+        return Response(
+            report,
+            status=(
+                status.HTTP_201_CREATED
+                if report["created"]
+                else status.HTTP_400_BAD_REQUEST
+            ),
+        )
+
+    @action(
+        detail=False,
+        methods=["patch"],
+        url_path="bulk-update",
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_update(self, request):
+        return bulk_update_response(request, Product)
+
     @action(
         detail=False,
         methods=["post"],
@@ -192,68 +391,24 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         days = int(request.data.get("days", 7))
         limit = int(request.data.get("limit", 10))
+        granularity = request.data.get("granularity", "day")
+        if granularity not in SALES_GRANULARITIES:
+            raise ValidationError(
+                f"granularity must be one of {', '.join(SALES_GRANULARITIES)}"
+            )
 
         since_date = timezone.now() - timedelta(days=days)
-        compared_end_date = since_date
         compared_start_date = since_date - timedelta(days=days)
-        products = (
-            Product.objects.filter(
-                vendor=vendor,
-                cart_items__cart_order_items__order__order_status="delivered",
-                cart_items__cart_order_items__order__order_date__gte=since_date,
-            )
-            .annotate(
-                total_quantity_sold=Sum(
-                    "cart_items__quantity",
-                    filter=Q(
-                        cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                ),
-                total_orders=Count(
-                    "cart_items__cart_order_items__order",
-                    filter=Q(
-                        cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                    distinct=True,
-                ),
-                total_earned=ExpressionWrapper(
-                    F("price")
-                    * Sum(
-                        "cart_items__quantity",
-                        filter=Q(
-                            cart_items__cart_order_items__order__order_status="delivered"
-                        )
-                        & Q(
-                            cart_items__cart_order_items__order__order_date__gte=since_date
-                        ),
-                    ),
-                    output_field=DecimalField(),
-                ),
-            )
-            .order_by("-total_quantity_sold")[:limit]
-        )
+        since_day = timezone.localdate(since_date)
+        compared_start_day = timezone.localdate(compared_start_date)
+        products = get_top_items(vendor, Product, since_day, limit)
 
-        aggregates = CartOrder.objects.filter(
-            vendor=vendor,
-            order_date__gte=since_date,
-            order_status="delivered",
-        ).aggregate(total_delivered_orders=Count("id"), total_earned=Sum("total_payed"))
+        aggregates = get_order_totals(vendor, since_day)
 
         total_delivered_orders = aggregates["total_delivered_orders"]
         total_earned = (aggregates["total_earned"] or 0) - (total_delivered_orders * 20)
 
-        compared_aggregates = CartOrder.objects.filter(
-            vendor=vendor,
-            order_date__gte=compared_start_date,
-            order_date__lte=compared_end_date,
-            order_status="delivered",
-        ).aggregate(total_delivered_orders=Count("id"), total_earned=Sum("total_payed"))
+        compared_aggregates = get_order_totals(vendor, compared_start_day, since_day)
 
         compared_total_delivered_orders = compared_aggregates["total_delivered_orders"]
         compared_total_earned = compared_aggregates["total_earned"] or 0
@@ -267,91 +422,22 @@ class ProductViewSet(viewsets.ModelViewSet):
             else 0
         )
 
-        top_category = (
-            Category.objects.filter(
-                sub_categories__products__vendor=vendor,
-                sub_categories__products__cart_items__cart_order_items__order__order_status="delivered",
-                sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date,
-            )
-            .annotate(
-                total_sold=Sum(
-                    "sub_categories__products__cart_items__quantity",
-                    filter=Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                ),
-                total_earned=Sum(
-                    ExpressionWrapper(
-                        F("sub_categories__products__cart_items__quantity")
-                        * F("sub_categories__products__price"),
-                        output_field=DecimalField(),
-                    ),
-                    filter=Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                ),
-            )
-            .order_by("-total_sold")
-            .first()
-        )
+        category_sales = get_category_sales(vendor, Product, since_day)
+        top_category = category_sales[0] if category_sales else None
 
         total_quantity_sold_based_on_limit = sum(
             [p.total_quantity_sold for p in products]
         )
         top_category_percentage = (
-            (top_category.total_sold / total_quantity_sold_based_on_limit) * 100
-            if total_quantity_sold_based_on_limit > 0
+            (top_category["total_sold"] / total_quantity_sold_based_on_limit) * 100
+            if top_category and total_quantity_sold_based_on_limit > 0
             else 0
         )
 
-        sales_over_time = CartOrder.objects.filter(
-            vendor=vendor,
-            order_status="delivered",
-            order_date__gte=since_date,
-        ).annotate(
-            total_earned=ExpressionWrapper(
-                F("total_payed") - Value(20),
-                output_field=DecimalField(max_digits=10, decimal_places=2),
-            )
-        )
-        for order in sales_over_time:
-            print("Order ID:", order.id)
-            print("Total Payed:", order.total_payed)
-            print("Total Earned:", getattr(order, "total_earned", "❌ NOT SET"))
-
-        sales_over_time_serializer = SalesOverTimeSerializer(
-            sales_over_time, many=True, context={"request": request}
-        )
-        print(
-            "heree is teh serializerd data of ssales over time",
-            sales_over_time_serializer.data,
-        )
-
-        category_sales = (
-            Category.objects.filter(
-                sub_categories__products__vendor=vendor,
-                sub_categories__products__cart_items__cart_order_items__order__order_status="delivered",
-                sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date,
-            )
-            .annotate(
-                total_sold=Sum(
-                    "sub_categories__products__cart_items__quantity",
-                    filter=Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_status="delivered",
-                    )
-                    & Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                )
-            )
-            .values("title", "total_sold")
+        sales_over_time = get_sales_over_time(
+            vendor, since_day, timezone.localdate(), granularity, fee=20
         )
+        sales_over_time_serializer = SalesOverTimeSerializer(sales_over_time, many=True)
 
         total_quantity_sold = sum(cat["total_sold"] or 0 for cat in category_sales)
 
@@ -402,9 +488,9 @@ class ProductViewSet(viewsets.ModelViewSet):
                 "compared_average_order_value": compared_average_order_value,
             },
             "top_category": {
-                "title": top_category.title if top_category else None,
-                "total_sold": top_category.total_sold if top_category else 0,
-                "total_earned": top_category.total_earned if top_category else 0,
+                "title": top_category["title"] if top_category else None,
+                "total_sold": top_category["total_sold"] if top_category else 0,
+                "total_earned": top_category["total_earned"] if top_category else 0,
                 "percentage": top_category_percentage,
             },
             "products": serialized_products,
@@ -436,7 +522,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                 )
 
             try:
-                vendor = Vendor.objects.get(id, vendor_id)
+                vendor = Vendor.objects.get(id=vendor_id)
 
             except Vendor.DoesNotExist:
                 raise ValidationError(
@@ -451,45 +537,10 @@ class ProductViewSet(viewsets.ModelViewSet):
                 "this endpoint is for products and the vendor publishes food products"
             )
 
-        days = int(request.data.get("days", 30))
+        days = min(max(int(request.data.get("days", 30)), 1), 365)
         limit = int(request.data.get("limit", 10))
-        print(f"days is here {days}")
-
-        since_date = timezone.now() - timedelta(days=days)
-
-        latest_order_date_subquery = Subquery(
-            CartOrderItem.objects.filter(cart_item__product=OuterRef("pk"))
-            .order_by("-created_at")
-            .values("created_at")[:1]
-        )
 
-        products = (
-            Product.objects.filter(vendor=vendor)
-            .annotate(
-                total_sold=Sum(
-                    "cart_items__quantity",
-                    filter=Q(
-                        cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                ),
-            )
-            .annotate(
-                average_sales=ExpressionWrapper(
-                    F("total_sold") / Value(days), output_field=FloatField()
-                ),
-            )
-            .annotate(
-                days_left=ExpressionWrapper(
-                    F("quantity") / F("average_sales") + Value(0.01),
-                    output_field=FloatField(),
-                ),
-                last_order_date=latest_order_date_subquery,
-            )
-            .order_by("-total_sold")[:limit]
-        )
+        products = stock_alert_items(Product, vendor, days, limit)
 
         serializer = StockAlertSerializer(
             products, many=True, context={"request": request}
@@ -547,11 +598,19 @@ class ProductViewSet(viewsets.ModelViewSet):
         return instance.delete()
 
 
-class FoodProductViewSet(viewsets.ModelViewSet):
-    queryset = FoodProduct.objects.all()
+class FoodProductViewSet(
+    ConditionalGetMixin, AnonymousCacheMixin, viewsets.ModelViewSet
+):
+    cache_group = "food_product"
+    conditional_timestamp_fields = CATALOG_TIMESTAMP_FIELDS
+    queryset = catalog_queryset(FoodProduct)
     serializer_class = FoodProductSerializer
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
+    def get_queryset(self):
+        fields = self.get_serializer_class().get_requested_fields(self.request)
+        return catalog_queryset(FoodProduct, fields)
+
     @action(
         detail=False,
         methods=["get"],
@@ -560,20 +619,8 @@ class FoodProductViewSet(viewsets.ModelViewSet):
         authentication_classes=[],
     )
     def trending_food_products(self, request):
-        trending_food_product = (
-            FoodProduct.objects.filter(
-                cart_items__cart_order_items__order__order_status="delivered"
-            )
-            .annotate(
-                total_quantity_sold=Sum(
-                    "cart_items__quantity",
-                    filter=Q(
-                        cart_items__cart_order_items__order__order_status="delivered"
-                    ),
-                )
-            )
-            .order_by("-total_quantity_sold")[:10]
-        )
+        fields = self.get_serializer_class().get_requested_fields(request)
+        trending_food_product = trending_items(FoodProduct, request, fields)
         serializer = self.get_serializer(
             trending_food_product, many=True, context={"request": request}
         )
@@ -616,70 +663,25 @@ class FoodProductViewSet(viewsets.ModelViewSet):
 
         days = int(request.data.get("days", 7))
         limit = int(request.data.get("limit", 10))
+        granularity = request.data.get("granularity", "day")
+        if granularity not in SALES_GRANULARITIES:
+            raise ValidationError(
+                f"granularity must be one of {', '.join(SALES_GRANULARITIES)}"
+            )
 
         since_date = timezone.now() - timedelta(days=days)
-
-        compared_end_date = since_date
         compared_start_date = since_date - timedelta(days=days)
 
-        food_products = (
-            FoodProduct.objects.filter(
-                vendor=vendor,
-                cart_items__cart_order_items__order__order_status="delivered",
-                cart_items__cart_order_items__order__order_date__gte=since_date,
-            )
-            .annotate(
-                total_quantity_sold=Sum(
-                    "cart_items__quantity",
-                    filter=Q(
-                        cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                ),
-                total_orders=Count(
-                    "cart_items__cart_order_items__order",
-                    filter=Q(
-                        cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                    distinct=True,
-                ),
-                total_earned=ExpressionWrapper(
-                    F("price")
-                    * Sum(
-                        "cart_items__quantity",
-                        filter=Q(
-                            cart_items__cart_order_items__order__order_status="delivered"
-                        )
-                        & Q(
-                            cart_items__cart_order_items__order__order_date__gte=since_date
-                        ),
-                    ),
-                    output_field=DecimalField(),
-                ),
-            )
-            .order_by("-total_quantity_sold")[:limit]
-        )
+        since_day = timezone.localdate(since_date)
+        compared_start_day = timezone.localdate(compared_start_date)
+        food_products = get_top_items(vendor, FoodProduct, since_day, limit)
 
-        aggregates = CartOrder.objects.filter(
-            vendor=vendor,
-            order_date__gte=since_date,
-            order_status="delivered",
-        ).aggregate(total_delivered_orders=Count("id"), total_earned=Sum("total_payed"))
+        aggregates = get_order_totals(vendor, since_day)
 
         total_delivered_orders = aggregates["total_delivered_orders"]
         total_earned = aggregates["total_earned"]
 
-        compared_aggregates = CartOrder.objects.filter(
-            vendor=vendor,
-            order_date__gte=compared_start_date,
-            order_date__lte=compared_end_date,
-            order_status="delivered",
-        ).aggregate(total_delivered_orders=Count("id"), total_earned=Sum("total_payed"))
+        compared_aggregates = get_order_totals(vendor, compared_start_day, since_day)
 
         compared_total_delivered_orders = compared_aggregates["total_delivered_orders"]
         compared_total_earned = compared_aggregates["total_earned"]
@@ -694,78 +696,22 @@ class FoodProductViewSet(viewsets.ModelViewSet):
             else 0
         )
 
-        top_category = (
-            Category.objects.filter(
-                sub_categories__products__vendor=vendor,
-                sub_categories__products__cart_items__cart_order_items__order__order_status="delivered",
-                sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date,
-            )
-            .annotate(
-                total_sold=Sum(
-                    "sub_categories__products__cart_items__quantity",
-                    filter=Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                ),
-                total_earned=Sum(
-                    ExpressionWrapper(
-                        F("sub_categories__products__price")
-                        * F("sub_categories__products__cart_items__quantity"),
-                        output_field=DecimalField(),
-                    ),
-                    filter=Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_status="delivered",
-                    )
-                    & Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                ),
-            )
-            .order_by("-total_sold")
-            .first()
-        )
+        category_sales = get_category_sales(vendor, FoodProduct, since_day)
+        top_category = category_sales[0] if category_sales else None
 
         total_quantity_sold_based_on_limit = sum(
             [p.total_quantity_sold for p in food_products]
         )
         top_category_percentage = (
-            (top_category.total_sold / total_quantity_sold_based_on_limit) * 100
-            if total_quantity_sold_based_on_limit > 0
+            (top_category["total_sold"] / total_quantity_sold_based_on_limit) * 100
+            if top_category and total_quantity_sold_based_on_limit > 0
             else 0
         )
 
-        sales_over_time = CartOrder.objects.filter(
-            vendor=vendor,
-            order_status="delivered",
-            order_date__gte=since_date,
-        )
-
-        sales_over_time_serializer = SalesOverTimeSerializer(
-            sales_over_time, many=True, context={"request": request}
-        )
-
-        category_sales = (
-            Category.objects.filter(
-                sub_categories__products__vendor=vendor,
-                sub_categories__products__cart_items__cart_order_items__order__order_status="delivered",
-                sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date,
-            )
-            .annotate(
-                total_sold=Sum(
-                    "sub_categories__products__cart_items__quantity",
-                    filter=Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_status="delivered"
-                    )
-                    & Q(
-                        sub_categories__products__cart_items__cart_order_items__order__order_date__gte=since_date
-                    ),
-                )
-            )
-            .values("title", "total_sold")
+        sales_over_time = get_sales_over_time(
+            vendor, since_day, timezone.localdate(), granularity
         )
+        sales_over_time_serializer = SalesOverTimeSerializer(sales_over_time, many=True)
 
         total_quantity_sold = sum(c["total_sold"] or 0 for c in category_sales)
 
@@ -814,9 +760,9 @@ class FoodProductViewSet(viewsets.ModelViewSet):
             },
             "food_products": serializer.data,
             "top_category": {
-                "title": top_category.title if top_category else None,
-                "total_sold": top_category.total_sold if top_category else 0,
-                "total_earned": top_category.total_earned if top_category else 0,
+                "title": top_category["title"] if top_category else None,
+                "total_sold": top_category["total_sold"] if top_category else 0,
+                "total_earned": top_category["total_earned"] if top_category else 0,
                 "percentage": top_category_percentage,
             },
             "sales_over_time": sales_over_time_serializer.data,
@@ -825,6 +771,62 @@ class FoodProductViewSet(viewsets.ModelViewSet):
 
         return Response(response_data)
 
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="stock-alert",
+        permission_classes=[IsAuthenticated],
+    )
+    def stock_alert(self, request):
+        user = request.user
+
+        if not (hasattr(user, "vendor") or user.is_superuser):
+            raise ValidationError(
+                "only vendors or super users that can access this resource"
+            )
+
+        if user.is_superuser:
+            vendor_id = request.data.get("vendor")
+            if not vendor_id:
+                raise ValidationError(
+                    "as a super user you have to provide the vendor id"
+                )
+
+            try:
+                vendor = Vendor.objects.get(id=vendor_id)
+
+            except Vendor.DoesNotExist:
+                raise ValidationError(
+                    "a vendor with this id does not exist in the database"
+                )
+
+        else:
+            vendor = user.vendor
+
+        if vendor.field == "Products":
+            raise ValidationError(
+                "this endpoint is for food products and the vendor publishes products"
+            )
+
+        days = min(max(int(request.data.get("days", 30)), 1), 365)
+        limit = int(request.data.get("limit", 10))
+
+        food_products = stock_alert_items(FoodProduct, vendor, days, limit)
+
+        serializer = FoodStockAlertSerializer(
+            food_products, many=True, context={"request": request}
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["patch"],
+        url_path="bulk-update",
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_update(self, request):
+        return bulk_update_response(request, FoodProduct)
+
     def get_permissions(self):
         if self.action in ["list", "retrieve", "trending_food_products"]:
             return [permissions.AllowAny()]
@@ -918,22 +920,31 @@ class ProductImagesViewSet(viewsets.ModelViewSet):
         return instance.delete()
 
 
-class CartOrderViewSet(viewsets.ModelViewSet):
+class CartOrderViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = CartOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CartOrderKeysetPagination
+    conditional_timestamp_fields = [
+        "updated_at",
+        "vendor__updated_at",
+        "vendor__user__updated_at",
+    ]
 
     def perform_create(self, serializer):
         serializer.save()
 
     def get_queryset(self):
         user = self.request.user
+        queryset = CartOrder.objects.select_related("vendor__user").prefetch_related(
+            "vendor__rating_summaries"
+        )
         if hasattr(user, "client"):
-            return CartOrder.objects.filter(client=user.client).order_by("-order_date")
+            return queryset.filter(client=user.client).order_by("-order_date")
 
         if hasattr(user, "vendor"):
-            return CartOrder.objects.filter(vendor=user.vendor).order_by("-order_date")
+            return queryset.filter(vendor=user.vendor).order_by("-order_date")
         if user.is_superuser:
-            return CartOrder.objects.all()
+            return queryset
 
         return CartOrder.objects.none()
 
@@ -960,7 +971,7 @@ class CartOrderItemViewSet(viewsets.ModelViewSet):
             )
 
 
-class ProductReviewViewSet(viewsets.ModelViewSet):
+class ProductReviewViewSet(IdempotentMixin, viewsets.ModelViewSet):
     queryset = ProductReview.objects.all()
     serializer_class = ProductReviewSerializer
 
@@ -989,10 +1000,25 @@ class WishlistViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Wishlist.objects.prefetch_related(
+            Prefetch(
+                "products",
+                queryset=catalog_queryset(
+                    Product, ProductSerializer.get_requested_fields(self.request)
+                ),
+            ),
+            Prefetch(
+                "food_products",
+                queryset=catalog_queryset(
+                    FoodProduct,
+                    FoodProductSerializer.get_requested_fields(self.request),
+                ),
+            ),
+        )
         if user.is_superuser:
-            return Wishlist.objects.all()
+            return queryset
         if hasattr(user, "client"):
-            return Wishlist.objects.filter(client=user.client)
+            return queryset.filter(client=user.client)
         return Wishlist.objects.none()
 
     def perform_create(self, serializer):
@@ -1159,7 +1185,7 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(IdempotentMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_serializer_class(self):
@@ -1209,11 +1235,14 @@ class CartItemViewSet(viewsets.ModelViewSet):
     # notify the client incase they forgot a product in the wishlist or in the shoppingcart incase the product is getting to be out of stock
 
 
-class GlobalCartViewset(APIView):
+class GlobalCartViewset(IdempotentMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request):
+        return self.idempotent_response(self.place_global_order, request)
+
+    @transaction.atomic
+    def place_global_order(self, request):
         serializer = GlobalOrderSerializer(
             data=request.data, context={"request": request}
         )
@@ -1225,7 +1254,7 @@ class GlobalCartViewset(APIView):
         client = user.client
         shopping_cart = client.shopping_cart
         today = timezone.now()
-        cart_items = shopping_cart.cart_items.filter(is_ordered=False)
+        cart_items = load_cart_items(shopping_cart)
         if len(cart_items) < 1:
             return Response({"error": "Your shopping cart is empty."})
         global_order = serializer.save(shopping_cart=shopping_cart)
@@ -1244,78 +1273,7 @@ class GlobalCartViewset(APIView):
                 "you cant have more than 10 none delivered orders in the last 30 days"
             )
 
-        print(f"number of cart items is : !!!!!!!! {cart_items.count()}")
-
-        vendors = {}
-
-        global_order_total_price = 0
-        for cart_item in cart_items:
-            vendor = (
-                cart_item.product.vendor
-                if cart_item.product
-                else cart_item.food_product.vendor
-            )
-            if not vendor or vendor.city != client.city:
-                raise ValidationError("Some cart items are not available in your city.")
-            global_order_total_price += cart_item.total_price
-            if vendor not in vendors:
-                vendors[vendor] = []
-
-            vendors[vendor].append(cart_item)
-
-        cart_orders = []
-        vendor_keys = list(vendors.keys())
-        global_order.total_price = global_order_total_price + (len(vendor_keys) * 20)
-        global_order.save(update_fields=["total_price"])
-
-        try:
-            for vendor, cart_items in vendors.items():
-
-                total_payed = sum(cart_item.get_price() for cart_item in cart_items)
-
-                cart_order = CartOrder.objects.create(
-                    client=client,
-                    vendor=vendor,
-                    total_payed=(
-                        total_payed + 20
-                        if global_order.delivery_option
-                        else total_payed
-                    ),
-                    payment_method="cod",
-                    global_order=global_order,
-                    delivery_option=global_order.delivery_option,
-                )
-
-                cart_order.save()
-
-                print(f"Created CartOrder: {cart_order}")
-                cart_orders.append(cart_order)
-
-                for cart_item in cart_items:
-                    try:
-                        CartOrderItem.objects.create(
-                            client=client,
-                            order=cart_order,
-                            cart_item=cart_item,
-                            total_payed=(
-                                cart_item.product.price
-                                if cart_item.product
-                                else cart_item.food_product.price
-                            )
-                            * cart_item.quantity,
-                        )
-                        cart_item.is_ordered = True
-                        cart_item.save(update_fields=["is_ordered"])
-
-                        print(
-                            f"Created CartOrderItem for CartOrder ID: {cart_order.id}"
-                        )
-                    except Exception as e:
-                        raise e
-                    # TODO : make sure to use signals in order to inform the vendors and send updates in their email
-
-        except Exception as e:
-            raise e
+        place_orders(client, global_order, cart_items)
 
         return Response(
             {
@@ -1341,8 +1299,9 @@ class GlobalCartViewset(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class SubCategoryViewSet(viewsets.ModelViewSet):
-    queryset = SubCategory.objects.all()
+class SubCategoryViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
+    cache_group = "sub_category"
+    queryset = SubCategory.objects.select_related("category__sector")
     serializer_class = SubCategorySerializer
 
     def get_permissions(self):
@@ -1358,7 +1317,8 @@ class SubCategoryViewSet(viewsets.ModelViewSet):
         return instance.delete()
 
 
-class SubscriptionPlanViewSet(viewsets.ModelViewSet):
+class SubscriptionPlanViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
+    cache_group = "subscription_plan"
     queryset = SubscriptionPlan.objects.all()
     serializer_class = SubscriptionPlanSerializer
 
@@ -1407,7 +1367,7 @@ class SubscriptionPaymentViewSet(viewsets.ModelViewSet):
         return SubscriptionPayment.objects.filter(subscription__vendor=user.vendor)
 
 
-class ClaimedOrderViewSet(viewsets.ModelViewSet):
+class ClaimedOrderViewSet(IdempotentMixin, viewsets.ModelViewSet):
     serializer_class = ClaimOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -1521,6 +1481,7 @@ class ClientStrikeViewSet(viewsets.ModelViewSet):
 class NotificationViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationKeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -1531,64 +1492,233 @@ class NotificationViewSet(viewsets.ModelViewSet):
         return Notification.objects.filter(user=user)
 
 
-class TestimonialViewSet(viewsets.ModelViewSet):
+class TestimonialViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
+    cache_group = "testimonial"
     queryset = Testimonial.objects.all()
     serializer_class = TestimonialSerializer
     permission_classes = [permissions.AllowAny]
 
 
-class ProductListAPIView(generics.ListAPIView):
-
-    queryset = Product.objects.filter(is_active=True).select_related(
-        "sub_category__category__sector", "vendor"
-    )
+class ProductListAPIView(AnonymousCacheMixin, generics.ListAPIView):
+    cache_group = "product"
+    queryset = catalog_queryset(Product).filter(is_active=True)
     permission_classes = [permissions.AllowAny]
     serializer_class = ProductSerializer
-    pagination_class = ProductPagination
+    pagination_class = ProductKeysetPagination
     filter_backends = [
         DjangoFilterBackend,
-        drf_filters.SearchFilter,
         drf_filters.OrderingFilter,
+        CatalogSearchFilter,
     ]
     filterset_class = ProductFilter
-    search_fields = [
-        "title",
-        "description",
-        "tags__name",
-        "specifications",
-        "vendor_title",
-        "vendor__user__first_name",
-    ]
     ordering_fields = ["price", "created_at"]
     ordering = ["-created_at"]
 
+    def get_queryset(self):
+        fields = self.get_serializer_class().get_requested_fields(self.request)
+        return catalog_queryset(Product, fields).filter(is_active=True)
 
-class FoodProductListAPIView(generics.ListAPIView):
-    queryset = FoodProduct.objects.filter(is_active=True).select_related(
-        "sub_categories__category__sector", "vendor"
-    )
+
+class FoodProductListAPIView(AnonymousCacheMixin, generics.ListAPIView):
+    cache_group = "food_product"
+    queryset = catalog_queryset(FoodProduct).filter(is_active=True)
     serializer_class = FoodProductSerializer
-    pagination_class = ProductPagination
+    pagination_class = ProductKeysetPagination
     filter_backends = [
         DjangoFilterBackend,
-        drf_filters.SearchFilter,
         drf_filters.OrderingFilter,
+        CatalogSearchFilter,
     ]
     filterset_class = FoodProductFilter
-    search_fields = [
-        "title",
-        "description",
-        "tags__name",
-        "specifications",
-        "vendor_title",
-        "ingredients",
-    ]
     ordering_fields = ["price", "created_at", "calories"]
     ordering = ["-created_at"]
 
+    def get_queryset(self):
+        fields = self.get_serializer_class().get_requested_fields(self.request)
+        return catalog_queryset(FoodProduct, fields).filter(is_active=True)
+
+
+class CatalogFeedAPIView(generics.ListAPIView):
+    permission_classes = [permissions.AllowAny]
+    serializer_class = CatalogFeedSerializer
+    pagination_class = ProductPagination
+    filter_backends = []
+    feed_sources = {
+        "product": (Product, ProductFilter),
+        "food_product": (FoodProduct, FoodProductFilter),
+    }
+    feed_fields = [
+        "id",
+        "kind",
+        "title",
+        "price",
+        "old_price",
+        "discount_percentage",
+        "image",
+        "in_stock",
+        "vendor_id",
+        "sub_category_id",
+        "city",
+        "average_reviews",
+        "total_reviews",
+        "created_at",
+    ]
+    ordering_fields = ["price", "created_at"]
+    ordering = "-created_at"
+
+    # a search without an explicit ordering is ranked like the list endpoints
+    def get_ordering(self, ranked=False):
+        params = self.request.query_params
+        if ranked and "ordering" not in params:
+            return ["-search_rank", f"-{self.ordering.lstrip('-')}", "-id", "kind"]
+        ordering = params.get("ordering", self.ordering)
+        if ordering.lstrip("-") not in self.ordering_fields:
+            ordering = self.ordering
+        direction = "-" if ordering.startswith("-") else ""
+        return [ordering, f"{direction}id", "kind"]
+
+    # each model is filtered with its own filterset, then both sides are
+    # combined in one UNION ALL so ordering and pagination happen in the database
+    def get_queryset(self):
+        params = self.request.query_params
+        # the union has no single keyset to seek on, the feed is paged by number
+        if params.get("pagination") == "cursor" or "cursor" in params:
+            raise ValidationError(
+                {"pagination": "the catalog feed only supports ?page pagination"}
+            )
+        kind = params.get("kind")
+        querysets = []
+        ranked = False
+        for source, (model, filterset_class) in self.feed_sources.items():
+            if kind and kind != source:
+                continue
+            filterset = filterset_class(
+                self.request.query_params,
+                queryset=model.objects.filter(is_active=True),
+                request=self.request,
+            )
+            if not filterset.is_valid():
+                raise ValidationError(filterset.errors)
+            queryset = CatalogSearchFilter().filter_queryset(
+                self.request, filterset.qs, self
+            )
+            ranked = "search_rank" in queryset.query.annotations
+            querysets.append(
+                queryset.with_review_stats()
+                .annotate(
+                    kind=Value(source, output_field=CharField()),
+                    city=F("vendor__city"),
+                )
+                .order_by()
+                .values(*self.feed_fields, *(["search_rank"] if ranked else []))
+            )
+
+        if not querysets:
+            raise ValidationError(
+                {"kind": f"kind must be one of {', '.join(self.feed_sources)}"}
+            )
+        first, *rest = querysets
+        return first.union(*rest, all=True).order_by(*self.get_ordering(ranked))
+
+
+class ProductFacetsAPIView(generics.GenericAPIView):
+    queryset = Product.objects.filter(is_active=True)
+    permission_classes = [permissions.AllowAny]
+    filter_backends = [DjangoFilterBackend, CatalogSearchFilter]
+    filterset_class = ProductFilter
+
+    def get(self, request, *args, **kwargs):
+        allowed_params = list(self.filterset_class.base_filters) + ["search"]
+        key = facets_cache_key(
+            self.queryset.model, request.query_params, allowed_params
+        )
+        facets = cache.get(key)
+        if facets is None:
+            facets = get_catalog_facets(self.filter_queryset(self.get_queryset()))
+            cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+        return Response(facets)
+
+
+class FoodProductFacetsAPIView(ProductFacetsAPIView):
+    queryset = FoodProduct.objects.filter(is_active=True)
+    filterset_class = FoodProductFilter
+
+
+class CategoryTreeAPIView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        return Response(with_image_urls(get_category_tree(), request))
+
+
+class ResponseCacheStatsAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if not request.user.is_superuser:
+            raise PermissionDenied("only super users who can access this resource")
+        return Response(get_response_cache_stats())
+
+
+# the rows never go through a serializer, a values() projection is streamed in
+# chunks so the memory stays flat whatever the size of the export
+class VendorExportAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    export_name = None
+
+    def get_vendor_id(self, request):
+        user = request.user
+        if user.is_superuser:
+            # super users export every vendor unless one is asked for
+            vendor_id = request.query_params.get("vendor")
+            if vendor_id and not Vendor.objects.filter(id=vendor_id).exists():
+                raise ValidationError("Vendor with the provided ID does not exist")
+            return vendor_id or None
+
+        if not hasattr(user, "vendor"):
+            raise PermissionDenied(
+                "only vendors or super users that can access this resource"
+            )
+        return user.vendor.id
+
+    def get_since(self, request):
+        since = request.query_params.get("since")
+        if not since:
+            return None
+        value = parse_datetime(since) or parse_date(since)
+        if value is None:
+            raise ValidationError("since must be a date or a datetime")
+        if not isinstance(value, datetime):
+            value = datetime.combine(value, datetime.min.time())
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    # ?format= is taken by the renderer negotiation of drf
+    def get(self, request):
+        file_format = request.query_params.get("export_format", "csv")
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                f"export_format must be one of {', '.join(EXPORT_FORMATS)}"
+            )
+
+        rows = export_rows(
+            self.export_name,
+            vendor_id=self.get_vendor_id(request),
+            since=self.get_since(request),
+        )
+        response = StreamingHttpResponse(
+            stream_export(rows, export_columns(self.export_name), file_format),
+            content_type=EXPORT_FORMATS[file_format],
+        )
+        file_name = f"{self.export_name}-{timezone.now():%Y%m%d%H%M%S}.{file_format}"
+        response["Content-Disposition"] = f'attachment; filename="{file_name}"'
+        return response
+
 
-class CategoryListAPIView(generics.ListAPIView):
-    queryset = Category.objects.all()
+class CategoryListAPIView(AnonymousCacheMixin, generics.ListAPIView):
+    cache_group = "category"
+    queryset = Category.objects.select_related("sector")
     serializer_class = CategorySerializer
     filter_backends = [
         DjangoFilterBackend,
@@ -1601,8 +1731,9 @@ class CategoryListAPIView(generics.ListAPIView):
     ordering = ["-created_at"]
 
 
-class SubCategoryListAPIView(generics.ListAPIView):
-    queryset = SubCategory.objects.all()
+class SubCategoryListAPIView(AnonymousCacheMixin, generics.ListAPIView):
+    cache_group = "sub_category"
+    queryset = SubCategory.objects.select_related("category__sector")
     serializer_class = SubCategorySerializer
     filter_backends = [
         DjangoFilterBackend,
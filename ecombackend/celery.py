@@ -13,4 +13,16 @@ app.conf.beat_schedule = {
         'task': 'ecomapp.tasks.check_and_fail_expired_claimed_orders',
         'schedule': crontab(minute='*/5'),
     },
+    'refresh-trending-scores-every-15-minutes': {
+        'task': 'ecomapp.tasks.refresh_trending',
+        'schedule': crontab(minute='*/15'),
+    },
+    'prune-idempotency-keys-every-hour': {
+        'task': 'ecomapp.tasks.prune_expired_idempotency_keys',
+        'schedule': crontab(minute=0),
+    },
+    'send-outgoing-emails-every-minute': {
+        'task': 'ecomapp.tasks.send_outgoing_emails',
+        'schedule': crontab(),
+    },
 }
@@ -169,6 +169,19 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
 
+# the response cache, facets, category tree and forecasts keep their versions
+# in the cache, every web worker and the celery workers must see the same bumps,
+# set CACHE_BACKEND to django.core.cache.backends.locmem.LocMemCache to run a
+# single process without redis
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.redis.RedisCache"
+        ),
+        "LOCATION": os.getenv("CACHE_URL", "redis://localhost:6379/1"),
+    }
+}
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",  # Add this for good measure
@@ -205,4 +218,7 @@ EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
 EMAIL_HOST_PASSWORD = "lihi dolj brug cimb"
 EMAIL_USE_TLS = True
-EMAIL_BACKEND = "backends.email_backend.EmailBackend"
+# set EMAIL_BACKEND to django.core.mail.backends.console.EmailBackend or
+# django.core.mail.backends.filebased.EmailBackend to keep the mails local
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "backends.email_backend.EmailBackend")
+EMAIL_FILE_PATH = BASE_DIR / "sent_emails"
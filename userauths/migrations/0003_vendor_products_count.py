@@ -0,0 +1,98 @@
+# Generated by Django 5.1.6 on 2026-10-17 22:59
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# frozen copy of ecomapp.counters.reconcile_vendor_counters, it only uses the
+# historical models and leaves the response cache to the management command
+def count_per_vendor(queryset):
+    counts = (
+        queryset.filter(vendor=OuterRef("pk"))
+        .order_by()
+        .values("vendor")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def backfill_vendor_counters(apps, schema_editor):
+    Vendor = apps.get_model("userauths", "Vendor")
+    CartOrder = apps.get_model("ecomapp", "CartOrder")
+    Product = apps.get_model("ecomapp", "Product")
+    FoodProduct = apps.get_model("ecomapp", "FoodProduct")
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    ProductReview = apps.get_model("ecomapp", "ProductReview")
+    RatingSummary = apps.get_model("ecomapp", "RatingSummary")
+
+    Vendor.objects.update(
+        total_sold=count_per_vendor(CartOrder.objects.filter(order_status="delivered")),
+        products_count=count_per_vendor(Product.objects.filter(is_active=True))
+        + count_per_vendor(FoodProduct.objects.filter(is_active=True)),
+    )
+
+    rows = []
+    for model_name in ["product", "foodproduct"]:
+        model = apps.get_model("ecomapp", model_name)
+        content_type, _ = ContentType.objects.get_or_create(
+            app_label="ecomapp", model=model_name
+        )
+        rows += (
+            ProductReview.objects.filter(content_type=content_type)
+            .annotate(
+                vendor_id=Subquery(
+                    model.objects.filter(pk=OuterRef("object_id")).values("vendor_id")
+                )
+            )
+            .filter(vendor_id__isnull=False)
+            .values("vendor_id", "rating")
+            .annotate(count=Count("pk"))
+            .order_by()
+        )
+    vendor_type, _ = ContentType.objects.get_or_create(
+        app_label="userauths", model="vendor"
+    )
+    rows += (
+        ProductReview.objects.filter(content_type=vendor_type)
+        .values("rating", vendor_id=F("object_id"))
+        .annotate(count=Count("pk"))
+        .order_by()
+    )
+
+    summaries = {}
+    for row in rows:
+        summary = summaries.setdefault(
+            row["vendor_id"],
+            RatingSummary(content_type_id=vendor_type.pk, object_id=row["vendor_id"]),
+        )
+        summary.count += row["count"]
+        summary.total += row["count"] * row["rating"]
+        field = f"stars_{row['rating']}"
+        setattr(summary, field, getattr(summary, field) + row["count"])
+    RatingSummary.objects.filter(content_type_id=vendor_type.pk).delete()
+    RatingSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userauths", "0002_delete_sector"),
+        ("ecomapp", "0007_vendor_sales_rollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vendor",
+            name="products_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="vendor",
+            index=models.Index(
+                fields=["-total_sold", "id"], name="userauths_v_total_s_69431c_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_vendor_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userauths", "0003_vendor_products_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vendor",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from shortuuid.django_fields import ShortUUIDField
 from django.utils.html import mark_safe
+from django.utils.functional import cached_property
+from django.contrib.contenttypes.fields import GenericRelation
 from phonenumber_field.modelfields import PhoneNumberField
 
 
@@ -120,6 +122,7 @@ class Vendor(models.Model):
     title = models.CharField(max_length=128)
     description = models.TextField(null=True, blank=True)
     image = models.ImageField(upload_to=user_directory_path, null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     address = models.CharField(max_length=255, blank=False)
     country = models.CharField(max_length=128, default="morocco")
     city = models.CharField(
@@ -135,6 +138,7 @@ class Vendor(models.Model):
     is_banned = models.BooleanField(default=False)
     ban_expired_at = models.DateTimeField(null=True, blank=True)
     total_sold = models.PositiveIntegerField(default=0)
+    products_count = models.PositiveIntegerField(default=0)
     field = models.CharField(
         max_length=54, choices=FIELD_CHOICES.choices, null=False, blank=False
     )
@@ -143,12 +147,30 @@ class Vendor(models.Model):
     def chat_response_time(self):
         return 10
 
+    rating_summaries = GenericRelation("ecomapp.RatingSummary")
+
+    # pages prefetching vendor__rating_summaries read it without a query per row
+    @cached_property
+    def rating_summary(self):
+        from ecomapp.services import get_rating_summary
+
+        if "rating_summaries" in getattr(self, "_prefetched_objects_cache", {}):
+            return next(iter(self.rating_summaries.all()), None)
+        return get_rating_summary(self)
+
     @property
     def average_rating(self):
-        return 10
+        summary = self.rating_summary
+        return summary.average if summary else 0.0
+
+    @property
+    def reviews_count(self):
+        summary = self.rating_summary
+        return summary.count if summary else 0
 
     class Meta:
         verbose_name_plural = "Vendors"
+        indexes = [models.Index(fields=["-total_sold", "id"])]
 
     def vendor_image(self):
         if self.image:
@@ -2,10 +2,8 @@ from .models import User, Vendor, Client, UserRoles, DeliveryAgent
 from rest_framework import serializers
 import json
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from ecomapp.models import ProductReview, Product, FoodProduct
-from django.db.models import Avg, Count
-from django.contrib.contenttypes.models import ContentType
 import logging
+from ecomapp.images import image_srcset
 
 logger = logging.getLogger(__name__)
 
@@ -70,8 +68,10 @@ class UserSerializer(serializers.ModelSerializer):
 class VendorSerializer(serializers.ModelSerializer):
     vid = serializers.ReadOnlyField()
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     user = UserSerializer()
     total_sold = serializers.IntegerField(read_only=True)
+    products_count = serializers.IntegerField(read_only=True)
     average_reviews = serializers.SerializerMethodField()
     reviews_count = serializers.SerializerMethodField()
 
@@ -86,65 +86,21 @@ class VendorSerializer(serializers.ModelSerializer):
             "country",
             "city",
             "image_url",
+            "image_srcset",
             "address",
             "total_sold",
+            "products_count",
             "average_reviews",
             "reviews_count",
             "field",
         ]
-        read_only_fields = ["vid", "image_url", "country"]
+        read_only_fields = ["vid", "image_url", "image_srcset", "country"]
 
     def get_average_reviews(self, obj):
-        logger.debug(f"Calculating average reviews for vendor: {obj.vid}")
-
-        product_content_type = ContentType.objects.get_for_model(Product)
-        food_product_content_type = ContentType.objects.get_for_model(FoodProduct)
-
-        vendor_products = Product.objects.filter(vendor=obj)
-        food_products = FoodProduct.objects.filter(vendor=obj)
-
-        reviews_for_products = ProductReview.objects.filter(
-            content_type=product_content_type,
-            object_id__in=vendor_products.values_list("id", flat=True),
-        )
-        reviews_for_food_products = ProductReview.objects.filter(
-            content_type=food_product_content_type,
-            object_id__in=food_products.values_list("id", flat=True),
-        )
-
-        all_reviews = reviews_for_products | reviews_for_food_products
-
-        if all_reviews.exists():
-            average = all_reviews.aggregate(Avg("rating"))["rating__avg"]
-            logger.debug(f"Average review for vendor {obj.vid}: {average}")
-            return average or 0.0
-
-        logger.debug(f"No reviews found for vendor: {obj.vid}")
-        return 0.0
+        return obj.average_rating
 
     def get_reviews_count(self, obj):
-        logger.debug(f"Calculating reviews count for vendor: {obj.vid}")
-
-        product_content_type = ContentType.objects.get_for_model(Product)
-        food_product_content_type = ContentType.objects.get_for_model(FoodProduct)
-
-        vendor_products = Product.objects.filter(vendor=obj)
-        food_products = FoodProduct.objects.filter(vendor=obj)
-
-        reviews_for_products = ProductReview.objects.filter(
-            content_type=product_content_type,
-            object_id__in=vendor_products.values_list("id", flat=True),
-        )
-        reviews_for_food_products = ProductReview.objects.filter(
-            content_type=food_product_content_type,
-            object_id__in=food_products.values_list("id", flat=True),
-        )
-
-        all_reviews = reviews_for_products | reviews_for_food_products
-
-        count = all_reviews.count()
-        logger.debug(f"Review count for vendor {obj.vid}: {count}")
-        return count
+        return obj.reviews_count
 
     def validate(self, data):
         user = self.context["request"].user
@@ -186,6 +142,9 @@ class VendorSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         return request.build_absolute_uri(obj.image.url) if obj.image else None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj, self.context.get("request"))
+
     # def to_internal_value(self, data):
     #     data = data.copy()
     #     user_data = data.get("user")
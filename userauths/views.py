@@ -21,6 +21,7 @@ from django.db.models import Q, Sum, Count
 from rest_framework import filters as drf_filters
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.pagination import PageNumberPagination
+from ecomapp.services import prefetch_rating_summaries
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -99,7 +100,7 @@ class VendorViewSet(viewsets.ModelViewSet):
 
 
 class VendorListAPIView(generics.ListAPIView):
-    queryset = Vendor.objects.all()
+    queryset = Vendor.objects.select_related("user")
     serializer_class = VendorSerializer
     pagination_class = VendorPagination
     permission_classes = [permissions.AllowAny]
@@ -110,8 +111,13 @@ class VendorListAPIView(generics.ListAPIView):
     ]
     filterset_class = VendorFilter
     search_fields = ["city", "total_sold"]
-    ordering_fields = ["total_sold"]
-    ordering = ["-total_sold"]
+    ordering_fields = ["total_sold", "products_count"]
+    # id keeps pages stable between vendors with the same total_sold
+    ordering = ["-total_sold", "id"]
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return prefetch_rating_summaries(page) if page is not None else page
 
 
 class DeliveryAgentViewSet(viewsets.ModelViewSet):